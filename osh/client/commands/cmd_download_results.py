@@ -5,7 +5,9 @@ import os
 import sys
 
 import osh.client
-from osh.client.commands.shortcuts import fetch_results
+from osh.client.commands.shortcuts import (DOWNLOAD_JOBS,
+                                           fetch_results_concurrently,
+                                           get_tasks_info)
 
 
 class Download_Results(osh.client.OshCommand):
@@ -25,6 +27,14 @@ class Download_Results(osh.client.OshCommand):
             help="path to store results",
         )
 
+        self.parser.add_option(
+            "-j",
+            "--jobs",
+            type="int",
+            default=DOWNLOAD_JOBS,
+            help="number of concurrent downloads (default: %default)",
+        )
+
     def run(self, *tasks, **kwargs):
         if not tasks:
             self.parser.error("no task ID specified")
@@ -37,17 +47,22 @@ class Download_Results(osh.client.OshCommand):
         if results_dir is not None and not os.path.isdir(os.path.expanduser(results_dir)):
             self.parser.error("provided directory does not exist")
 
+        jobs = kwargs.pop("jobs", DOWNLOAD_JOBS)
+        if jobs < 1:
+            self.parser.error("number of jobs has to be positive")
+
         # login to the hub
         self.connect_to_hub(kwargs)
 
         success = True
+        tasks_info = get_tasks_info(self.hub, tasks, ['args'])
         for task_id in tasks:
-            if not self.hub.scan.get_task_info(task_id):
+            if task_id not in tasks_info:
                 print(f"Task {task_id} does not exist!", file=sys.stderr)
                 success = False
-                continue
 
-            success &= fetch_results(self.hub, results_dir, task_id)
+        if tasks_info:
+            success &= fetch_results_concurrently(self.hub, results_dir, tasks_info, jobs)
 
         if not success:
             sys.exit(1)
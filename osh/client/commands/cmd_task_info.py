@@ -5,6 +5,7 @@ import json
 import sys
 
 import osh.client
+from osh.client.commands.shortcuts import get_tasks_info
 
 
 class Task_Info(osh.client.OshCommand):
@@ -16,38 +17,58 @@ class Task_Info(osh.client.OshCommand):
         # specify command usage
         # normalized name contains a lower-case class name with underscores
         # converted to dashes
-        self.parser.usage = f"%prog {self.normalized_name} <task_id>"
-        self.parser.epilog = "exit status is set to 1, if the task is not found"
+        self.parser.usage = f"%prog {self.normalized_name} <task_id> [task_id...]"
+        self.parser.epilog = "exit status is set to 1, if any of the tasks is not found"
 
         self.parser.add_option('--json', action='store_true',
                                help='print the task info in JSON format')
 
     def run(self, *args, **kwargs):
-        if len(args) != 1:
-            self.parser.error("please specify exactly one task ID")
+        if not args:
+            self.parser.error("please specify at least one task ID")
 
-        task_id = args[0]
         use_json = kwargs.get('json')
 
-        if not task_id.isdigit():
-            self.parser.error(f"'{task_id}' is not a number")
+        for task_id in args:
+            if not task_id.isdigit():
+                self.parser.error(f"'{task_id}' is not a number")
 
         # login to the hub
         self.connect_to_hub(kwargs)
 
-        task_info = self.hub.scan.get_task_info(task_id)
-        if not task_info:
-            print("There is no info about the task.", file=sys.stderr)
-            sys.exit(1)
+        if len(args) == 1:
+            task_info = self.hub.scan.get_task_info(args[0])
+            if not task_info:
+                print("There is no info about the task.", file=sys.stderr)
+                sys.exit(1)
 
-        if use_json:
-            print(json.dumps(task_info, indent=4))
+            if use_json:
+                print(json.dumps(task_info, indent=4))
+            else:
+                print(self.format_task_info(task_info))
             return
 
+        # fetch info about all the tasks at once
+        tasks_info = get_tasks_info(self.hub, args)
+        if use_json:
+            print(json.dumps(tasks_info, indent=4))
+        elif tasks_info:
+            found = [tasks_info[task_id] for task_id in args if task_id in tasks_info]
+            print("\n\n".join(self.format_task_info(task_info) for task_info in found))
+
+        missing = [task_id for task_id in args if task_id not in tasks_info]
+        if missing:
+            print(f"There is no info about tasks: {', '.join(missing)}", file=sys.stderr)
+            sys.exit(1)
+
+    @staticmethod
+    def format_task_info(task_info):
+        lines = []
         for key, value in task_info.items():
             if key == 'args':
-                print('args:')
+                lines.append('args:')
                 for a_k, a_v in value.items():
-                    print(f"    {a_k} = {a_v}")
+                    lines.append(f"    {a_k} = {a_v}")
             else:
-                print(f"{key} = {value}")
+                lines.append(f"{key} = {value}")
+        return "\n".join(lines)
@@ -4,13 +4,23 @@
 import os
 import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
+from http.client import HTTPException
 from urllib.error import HTTPError
-from urllib.request import urlretrieve
+from urllib.request import Request, urlopen
 from xmlrpc.client import Fault
 
 import koji
 
+# number of concurrent downloads of results
+DOWNLOAD_JOBS = 4
+# size of chunks in which results are downloaded
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# number of attempts to download a file before giving up
+DOWNLOAD_ATTEMPTS = 3
+
 
 def check_analyzers(proxy, analyzers_list):
     result = proxy.scan.check_analyzers(analyzers_list)
@@ -128,11 +138,100 @@ def _get_result_filename(task_args):
     return 'output'
 
 
-def fetch_results(hub, dest, task_id):
-    """Downloads results for the given task"""
-    task_info = hub.scan.get_task_info(task_id)
-    task_url = hub.client.task_url(task_id)
+def get_tasks_info(hub, task_ids, fields=None):
+    """
+    Return dict {task_id: task info} of existing tasks from task_ids in one
+    call; hubs not supporting the batch call are asked for each task.
+    """
+    try:
+        infos = hub.scan.get_tasks_info(list(task_ids), fields)
+        return {task_id: infos[str(task_id)] for task_id in task_ids if str(task_id) in infos}
+    except Fault as e:
+        if 'is not supported' not in e.faultString:
+            raise
+
+    infos = {}
+    for task_id in task_ids:
+        task_info = hub.scan.get_task_info(task_id)
+        if task_info:
+            infos[task_id] = task_info if fields is None else \
+                {key: task_info[key] for key in fields if key in task_info}
+    return infos
+
 
+def _get_remote_size(url):
+    """ Return size of file at url or None if the server does not tell """
+    try:
+        with urlopen(Request(url, method='HEAD')) as response:
+            length = response.headers.get('Content-Length')
+    except HTTPError:
+        return None
+    return int(length) if length is not None else None
+
+
+def download_file(url, local_path):
+    """
+    Download url to local_path and return number of downloaded bytes.
+
+    Existing file of the same size as the remote one is not downloaded
+    again.  The file is downloaded to local_path + '.part' first and the
+    partial download is resumed using HTTP Range request if it fails.
+    """
+    if os.path.exists(local_path) and os.path.getsize(local_path) == _get_remote_size(url):
+        return 0
+
+    part_path = local_path + '.part'
+    downloaded = 0
+    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        request = Request(url)
+        if offset:
+            request.add_header('Range', f'bytes={offset}-')
+
+        try:
+            with urlopen(request) as response:
+                # the server may ignore the range and send the whole file
+                mode = 'ab' if response.status == HTTPStatus.PARTIAL_CONTENT else 'wb'
+                with open(part_path, mode) as f:
+                    for chunk in iter(lambda: response.read(DOWNLOAD_CHUNK_SIZE), b''):
+                        f.write(chunk)
+                        downloaded += len(chunk)
+            break
+        except HTTPError as e:
+            if e.code != HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE or attempt == DOWNLOAD_ATTEMPTS:
+                raise
+            # the partial file is not a prefix of the remote file
+            os.remove(part_path)
+        except (OSError, HTTPException):
+            # connection failures, the partial file is kept to be resumed
+            if attempt == DOWNLOAD_ATTEMPTS:
+                raise
+
+    os.replace(part_path, local_path)
+    return downloaded
+
+
+def _get_task_urls(hub, task_ids):
+    """
+    Return {task_id: URL of task} using a single task_url call; URLs of other
+    tasks are derived from the first one, which ends with '<task_id>/'
+    """
+    task_ids = list(task_ids)
+    if not task_ids:
+        return {}
+
+    first_url = hub.client.task_url(task_ids[0])
+    suffix = f"{task_ids[0]}/"
+    if not first_url.endswith(suffix):
+        # unknown layout of URLs, ask for each of them
+        return {task_id: hub.client.task_url(task_id) for task_id in task_ids}
+
+    prefix = first_url[:-len(suffix)]
+    return {task_id: f"{prefix}{task_id}/" for task_id in task_ids}
+
+
+def _get_results_download(dest, task_url, task_info):
+    """ Return URL of tarball with results of the task at task_url and local path for it """
     # we need result_filename + '.tar.xz'
     tarball = _get_result_filename(task_info['args']) + '.tar.xz'
 
@@ -141,17 +240,52 @@ def fetch_results(hub, dest, task_id):
     local_path = os.path.join(dest_dir, tarball)
 
     # task_url is url to task with trailing '/'
-    url = f"{task_url}log/{tarball}?format=raw"
+    return f"{task_url}log/{tarball}?format=raw", local_path
+
 
-    print(f"Downloading {tarball}: ", file=sys.stderr, end="")
+def _download_results(url, local_path):
+    """ Download results and report the outcome, return number of bytes or None on failure """
+    tarball = os.path.basename(local_path)
     try:
-        urlretrieve(url, local_path)
-    except HTTPError as e:
-        print(e, file=sys.stderr)
-        return False
+        downloaded = download_file(url, local_path)
+    except (OSError, HTTPException) as e:
+        print(f"Downloading {tarball}: {e}", file=sys.stderr)
+        return None
 
-    print("OK", file=sys.stderr)
-    return True
+    if downloaded:
+        print(f"Downloading {tarball}: OK", file=sys.stderr)
+    else:
+        print(f"Downloading {tarball}: already downloaded", file=sys.stderr)
+    return downloaded
+
+
+def fetch_results(hub, dest, task_id, task_info=None):
+    """Downloads results for the given task"""
+    if task_info is None:
+        task_info = hub.scan.get_task_info(task_id)
+    url, local_path = _get_results_download(dest, hub.client.task_url(task_id), task_info)
+    return _download_results(url, local_path) is not None
+
+
+def fetch_results_concurrently(hub, dest, tasks_info, jobs=DOWNLOAD_JOBS):
+    """
+    Download results of tasks from dict {task_id: task info} using at most
+    `jobs` concurrent downloads; return True if all of them succeeded
+    """
+    # the hub proxy is not thread-safe, ask for URLs upfront
+    task_urls = _get_task_urls(hub, tasks_info)
+    downloads = [_get_results_download(dest, task_urls[task_id], task_info)
+                 for task_id, task_info in tasks_info.items()]
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(lambda download: _download_results(*download), downloads))
+    elapsed = time.monotonic() - start
+
+    total = sum(downloaded for downloaded in results if downloaded)
+    print(f"Downloaded {total / 2**20:.1f} MiB in {elapsed:.1f} s "
+          f"({total / 2**20 / max(elapsed, 0.001):.1f} MiB/s)", file=sys.stderr)
+    return None not in results
 
 
 def upload_file(hub, srpm, target_dir, parser):
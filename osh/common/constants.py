@@ -15,6 +15,9 @@ FIXED_HTML_FILE = 'fixed.html'
 ERROR_TXT_FILE = 'added.err'
 FIXED_TXT_FILE = 'fixed.err'
 
+# state of HTML and TXT renderings of the diff files
+DIFF_ARTIFACTS_STATUS_FILE = 'diff-artifacts.json'
+
 DEFAULT_CHECKER_GROUP = "Unsorted"
 
 SCAN_RESULTS_FILENAME = 'scan-results.js'
@@ -8,17 +8,33 @@ from kobo.django.xmlrpc.decorators import login_required
 
 from osh.hub.scan.models import (REQUEST_STATES, SCAN_STATES, AppSettings,
                                  ETMapping)
-from osh.hub.scan.scanner import handle_scan
+from osh.hub.scan.scanner import handle_scan, handle_scans
 
 # DO NOT REMOVE!  The __all__ list contains all publicly exported XML-RPC
 # methods from this module.
 __all__ = [
     "create_errata_diff_scan",
+    "create_errata_diff_scans",
     "get_scan_state",
 ]
 
 logger = logging.getLogger(__name__)
 
+EMPTY_KWARGS_ERROR = {'status': 'ERROR',
+                      'message': 'Provided dictionary (map/Hash) is empty.'}
+
+
+def __check_user_can_submit(request):
+    """ return error response if the user is not allowed to submit scans """
+    # either there is no need to check user or user has to have permission to
+    # submit scans
+    if AppSettings.setting_check_user_can_submit() and \
+            not request.user.has_perm('scan.errata_xmlrpc_scan'):
+        logger.info('User %s tried to submit scan.', request.user.username)
+        return {'status': 'ERROR',
+                'message': 'You are not authorized to execute this function.'}
+    return None
+
 
 @login_required
 def create_errata_diff_scan(request, kwargs):
@@ -48,17 +64,12 @@ def create_errata_diff_scan(request, kwargs):
            <hub_prefix>/waiving/et/<et_internal_osh_id>
     """
     logger.info('[CREATE_SCAN] %s', kwargs)
-    # either there is no need to check user or user has to have permission to
-    # submit scans
-    if AppSettings.setting_check_user_can_submit() and \
-            not request.user.has_perm('scan.errata_xmlrpc_scan'):
-        logger.info('User %s tried to submit scan.', request.user.username)
-        return {'status': 'ERROR',
-                'message': 'You are not authorized to execute this function.'}
+    error = __check_user_can_submit(request)
+    if error:
+        return error
 
     if not kwargs:
-        return {'status': 'ERROR',
-                'message': 'Provided dictionary (map/Hash) is empty.'}
+        return EMPTY_KWARGS_ERROR
 
     kwargs['task_user'] = request.user.username
 
@@ -68,6 +79,43 @@ def create_errata_diff_scan(request, kwargs):
     return response
 
 
+@login_required
+def create_errata_diff_scans(request, kwargs_list):
+    """
+    create_errata_diff_scans(kwargs_list)
+
+        batch version of create_errata_diff_scan(), submits 'differential
+        scan' tasks of all builds in kwargs_list at once
+
+    @param kwargs_list: list of dictionaries with the same keys as kwargs of
+        create_errata_diff_scan()
+    @type kwargs_list: list
+    @rtype: list or dictionary
+    @return: list of responses of create_errata_diff_scan() for each of the
+        builds in the same order; a single error response if the request is
+        invalid as a whole
+    """
+    logger.info('[CREATE_SCANS] %s', kwargs_list)
+    error = __check_user_can_submit(request)
+    if error:
+        return error
+
+    if not kwargs_list or not isinstance(kwargs_list, list):
+        return {'status': 'ERROR',
+                'message': 'Provided list of builds is empty.'}
+
+    valid = [kwargs for kwargs in kwargs_list if kwargs and isinstance(kwargs, dict)]
+    for kwargs in valid:
+        kwargs['task_user'] = request.user.username
+
+    responses = iter(handle_scans(valid))
+    response = [next(responses) if kwargs and isinstance(kwargs, dict) else EMPTY_KWARGS_ERROR
+                for kwargs in kwargs_list]
+
+    logger.info('[CREATE_SCANS] => %s', response)
+    return response
+
+
 def get_scan_state(request, etm_id):
     """
     get_scan_state(scan_id)
@@ -1,21 +1,84 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
+import base64
+import binascii
+import datetime
 import logging
 import re
 
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from kobo.client.constants import FAILED_STATES, FINISHED_STATES
 from kobo.django.auth.models import User
 from kobo.django.xmlrpc.decorators import login_required
 from kobo.hub.models import Task
 
 from osh.common.constants import DEFAULT_SCAN_LIMIT
-from osh.hub.scan.models import SCAN_STATES, ClientAnalyzer, Profile, Scan
+from osh.hub.scan.koji_cache import get_cache_stats
+from osh.hub.scan.messaging import get_publisher_stats
+from osh.hub.scan.models import (SCAN_STATES, BusMessage, ClientAnalyzer,
+                                 Profile, Scan)
 from osh.hub.scan.scanner import (ClientDiffPatchesScanScheduler,
                                   ClientDiffScanScheduler, ClientScanScheduler)
+from osh.hub.scan.utils import normalize_comment, parse_task_label
 
 logger = logging.getLogger(__name__)
 
+# comments containing any of these are searched as regular expressions
+REGEX_METACHARACTERS = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+# names of fields of scans returned by get_filtered_scan_list*() and the
+# corresponding lookups
+SCAN_LIST_FIELDS = (
+    ('owner_name', 'username__username'),
+    ('owner_email', 'username__email'),
+    ('package_name', 'package__name'),
+    ('package_is_blocked', 'package__blocked'),
+    ('date_submitted', 'date_submitted'),
+    ('is_enabled', 'enabled'),
+    ('id', 'scanbinding__id'),
+    ('target', 'nvr'),
+    ('base_id', 'base_id'),
+    ('base_target', 'base__nvr'),
+    ('date_last_accessed', 'last_access'),
+    ('scan_type', 'scan_type'),
+    ('state', 'state'),
+    ('release', 'tag__release__tag'),
+    ('tag_name', 'tag__name'),
+)
+
+# names of fields of task info as exported by Task.export() and the lookups
+# of values they are computed from
+TASK_INFO_FIELDS = {
+    'id': 'id',
+    'owner': 'owner__username',
+    'worker': 'worker',
+    'parent': 'parent',
+    'state': 'state',
+    'label': 'label',
+    'method': 'method',
+    'args': 'args',
+    'result': 'result',
+    'exclusive': 'exclusive',
+    'arch': 'arch',
+    'channel': 'channel',
+    'timeout': 'timeout',
+    'waiting': 'waiting',
+    'awaited': 'awaited',
+    'dt_created': 'dt_created',
+    'dt_started': 'dt_started',
+    'dt_finished': 'dt_finished',
+    'priority': 'priority',
+    'weight': 'weight',
+    'resubmitted_by': 'resubmitted_by__username',
+    'resubmitted_from': 'resubmitted_from',
+    'state_label': 'state',
+    'is_finished': 'state',
+    'is_failed': 'state',
+}
+
 # DO NOT REMOVE!  The __all__ list contains all publicly exported XML-RPC
 # methods from this module.
 __all__ = [
@@ -24,7 +87,12 @@ __all__ = [
     "diff_build",
     "find_tasks",
     "get_filtered_scan_list",
+    "get_filtered_scan_list_page",
+    "get_koji_cache_stats",
+    "get_message_bus_stats",
     "get_task_info",
+    "get_tasks_info",
+    "get_tasks_state",
     "list_analyzers",
     "list_profiles",
     "mock_build",
@@ -129,30 +197,97 @@ def get_filtered_scan_list(request, kwargs, filter_scan_limit=DEFAULT_SCAN_LIMIT
     if ret_value:
         return ret_value
 
-    query_set = Scan.objects.filter(**kwargs).select_related() \
-        .order_by('-date_submitted') \
-        .values('username__username',
-                'username__email',
-                'package__name',
-                'package__blocked',
-                'date_submitted',
-                'enabled',
-                'scanbinding__id',
-                'nvr',
-                'base_id',
-                'base__nvr',
-                'last_access',
-                'scan_type',
-                'state',
-                'tag__release__tag',
-                'tag__name',
-                )
+    query_set = Scan.objects.filter(**kwargs).order_by('-date_submitted') \
+        .values_list(*(lookup for _, lookup in SCAN_LIST_FIELDS))
     results_count = query_set.count()
     if results_count > filter_scan_limit:
         return {'status': 'ERROR', 'message': 'Limit exceeded, returning first ' + str(filter_scan_limit) + ' scans.',
-                'count': filter_scan_limit, 'scans': __rename_keys(list(query_set[:filter_scan_limit]))}
+                'count': filter_scan_limit, 'scans': __rows_to_scans(query_set[:filter_scan_limit])}
+
+    return {'status': 'OK', 'count': results_count, 'scans': __rows_to_scans(query_set)}
+
+
+def get_filtered_scan_list_page(request, kwargs, cursor=None, page_size=DEFAULT_SCAN_LIMIT,
+                                with_count=False):
+    """
+    get_filtered_scan_list_page(kwargs, cursor=None, page_size=DEFAULT_SCAN_LIMIT, with_count=False)
+
+        Paginated variant of get_filtered_scan_list() which makes it possible
+        to walk through all scans matching the filters.
 
-    return {'status': 'OK', 'count': results_count, 'scans': __rename_keys(list(query_set))}
+    @param kwargs: filters, same as in get_filtered_scan_list()
+    @param cursor: opaque string returned as 'next_cursor' by previous call,
+                   None to get the first page
+    @param page_size: maximum number of returned scans
+    @param with_count: also return total number of scans matching the filters
+    @return:
+     - status: status message: { 'OK', 'ERROR' }
+     - message: in case of error, here is detailed message
+     - scans: info about scans in the same format as get_filtered_scan_list(),
+              sorted by submission date (latest first)
+     - next_cursor: cursor of the next page, None if this is the last page
+     - count: number of all matching scans, only if with_count is set
+
+     Basic usage:
+
+        cursor = None
+        while True:
+            page = hub.scan.get_filtered_scan_list_page(filters, cursor)
+            for scan in page['scans']:
+                print(scan['target'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+    """
+    kwargs = __setup_kwargs(kwargs)
+    logger.info('[FILTER_SCANS_PAGE] %s cursor=%s', kwargs, cursor)
+    ret_value = __convert_names_to_numbers(kwargs)
+    if ret_value:
+        return ret_value
+
+    if not isinstance(page_size, int) or isinstance(page_size, bool) \
+            or not 0 < page_size <= DEFAULT_SCAN_LIMIT:
+        return {'status': 'ERROR', 'message': 'Page size has to be between 1 and %d.' % DEFAULT_SCAN_LIMIT}
+
+    query_set = Scan.objects.filter(**kwargs)
+    response = {'status': 'OK'}
+    if with_count:
+        response['count'] = query_set.count()
+
+    if cursor is not None:
+        try:
+            date_submitted, scan_id = __decode_cursor(cursor)
+        except ValueError:
+            return {'status': 'ERROR', 'message': 'Invalid cursor: ' + str(cursor)}
+        query_set = query_set.filter(Q(date_submitted__lt=date_submitted)
+                                     | Q(date_submitted=date_submitted, id__lt=scan_id))
+
+    # the scan id and submission date are appended to build the cursor
+    rows = list(query_set.order_by('-date_submitted', '-id')
+                .values_list(*(lookup for _, lookup in SCAN_LIST_FIELDS), 'date_submitted', 'id')
+                [:page_size + 1])
+
+    response['next_cursor'] = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        response['next_cursor'] = __encode_cursor(rows[-1][-2], rows[-1][-1])
+
+    response['scans'] = __rows_to_scans(row[:-2] for row in rows)
+    return response
+
+
+def __encode_cursor(date_submitted, scan_id):
+    value = '%s|%d' % (date_submitted.isoformat(timespec='microseconds'), scan_id)
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def __decode_cursor(cursor):
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (binascii.Error, UnicodeError) as ex:
+        raise ValueError(ex)
+    date_submitted, scan_id = value.split('|')
+    return datetime.datetime.strptime(date_submitted, '%Y-%m-%dT%H:%M:%S.%f'), int(scan_id)
 
 
 def __setup_kwargs(kwargs):
@@ -191,24 +326,10 @@ def __convert_names_to_numbers(kwargs):
         kwargs['state'] = state_number
 
 
-def __rename_keys(scans_list):
-    # The best way would be to use SQL query with renamed values, but django doesn't support it very cleverly
-    translation_table = {'username__username': 'owner_name',
-                         'username__email': 'owner_email',
-                         'package__name': 'package_name',
-                         'package__blocked': 'package_is_blocked',
-                         'last_access': 'date_last_accessed',
-                         'nvr': 'target',
-                         'enabled': 'is_enabled',
-                         'base__nvr': 'base_target',
-                         'tag__release__tag': 'release',
-                         'tag__name': 'tag_name',
-                         'scanbinding__id': 'id',
-                         }
-    for scan in scans_list:
-        for old_name, new_name in translation_table.items():
-            scan[new_name] = scan.pop(old_name)
-    return scans_list
+def __rows_to_scans(rows):
+    """ convert rows of values in order of SCAN_LIST_FIELDS to dicts with public names """
+    names = [name for name, _ in SCAN_LIST_FIELDS]
+    return [dict(zip(names, row)) for row in rows]
 
 
 def get_task_info(request, task_id):
@@ -227,17 +348,78 @@ def get_task_info(request, task_id):
     return result
 
 
+def get_tasks_info(request, task_ids, fields=None):
+    """
+    get_tasks_info(task_ids, fields=None) -> {'<id>': {...}, ...}
+
+    Batch version of get_task_info(): provide info about tasks with IDs
+    task_ids in a single query.  If fields (list) is specified, only these
+    fields of task info are returned.  Tasks which do not exist are not
+    present in the returned dict, which is keyed by task IDs as strings.
+    """
+    tasks = Task.objects.filter(pk__in=task_ids)
+    if fields is not None:
+        return __export_task_fields(tasks, [key for key in fields if key in TASK_INFO_FIELDS])
+
+    tasks = tasks.select_related('owner', 'resubmitted_by', 'resubmitted_from')
+    return {str(task.id): task.export() for task in tasks}
+
+
+def __export_task_fields(tasks, fields):
+    """ export `fields` of task info loading only the columns they need """
+    lookups = {TASK_INFO_FIELDS[key] for key in fields}
+    lookups.add('id')
+    state_labels = dict(Task._meta.get_field('state').flatchoices)
+
+    result = {}
+    for row in tasks.values(*lookups):
+        info = {}
+        for key in fields:
+            value = row[TASK_INFO_FIELDS[key]]
+            if key.startswith('dt_'):
+                value = value and value.strftime('%Y-%m-%d %H:%M:%S')
+            elif key == 'state_label':
+                value = str(state_labels.get(value, value))
+            elif key == 'is_finished':
+                value = value in FINISHED_STATES
+            elif key == 'is_failed':
+                value = value in FAILED_STATES
+            info[key] = value
+        result[str(row['id'])] = info
+    return result
+
+
+def get_tasks_state(request, task_ids):
+    """
+    get_tasks_state(task_ids) -> {'<id>': <state>, ...}
+
+    Return states of tasks with IDs task_ids, this is meant for polling
+    of many tasks at once.  Tasks which do not exist are not present in the
+    returned dict, which is keyed by task IDs as strings.
+    """
+    tasks = Task.objects.filter(pk__in=task_ids).values_list('id', 'state')
+    return {str(task_id): state for task_id, state in tasks}
+
+
 def find_tasks(request, query):
     """
     find_tasks(request, query) -> [ <id>, <id>, ... ]
 
     Query hub to get IDs of tasks specified by query.
     Query is a dict (hash/map), it has to have exactly one of these keys:
-     * 'package_name': return all task IDs for provided package
-     * 'nvr': search by specific NVR
+     * 'package_name': return all task IDs for provided package, i.e. tasks
+                     whose label is an NVR (or SRPM file name) with exactly
+                     this (case sensitive) name; labels of other packages
+                     containing "<package_name>-<digit>" are not matched
+     * 'nvr': search by specific NVR, i.e. tasks whose label is this NVR
+              or file name of its SRPM; SRPM file name is accepted as well,
+              so 'foo-1-1.src.rpm' finds the same tasks as 'foo-1-1'
      * 'regex': find by provided regex (this is not match, but find, if you
                 want match, change your regex to "^<regex>$")
-     * 'comment': string, search by comment
+     * 'comment': string, search for comments containing it (case
+                  insensitive, runs of whitespace are treated as a single
+                  space); it is treated as a case sensitive regex if it
+                  contains any special characters
 
     Query also supports following optional keys:
      * 'states': list, search by task states
@@ -257,14 +439,17 @@ def find_tasks(request, query):
 
     result = []
     tasks = Task.objects.none()
+    # use the search index unless the query is a regular expression
     if nvr:
-        tasks = Task.objects.filter(label=nvr)
+        tasks = Task.objects.filter(search__nvr=parse_task_label(nvr)[0])
     elif package_name:
-        tasks = Task.objects.filter(label__regex=package_name + r"-\d")
+        tasks = Task.objects.filter(search__package_name=package_name)
     elif regex:
         tasks = Task.objects.filter(label__regex=regex)
-    elif comment:
+    elif comment and REGEX_METACHARACTERS.search(comment):
         tasks = Task.objects.filter(comment__regex=comment)
+    elif comment:
+        tasks = Task.objects.filter(search__comment__contains=normalize_comment(comment))
 
     if states:
         tasks = tasks.filter(state__in=states)
@@ -281,6 +466,35 @@ def find_tasks(request, query):
     return result
 
 
+def get_koji_cache_stats(request):
+    """
+    get_koji_cache_stats() -> {'hits': <int>, 'misses': <int>, 'size': <int>}
+
+    Return counters of the cache of koji metadata of the hub process which
+    handled this call.
+    """
+    return get_cache_stats()
+
+
+def get_message_bus_stats(request):
+    """
+    get_message_bus_stats() -> {'outbox': <int>, 'oldest': <float or None>, 'publisher': <dict or None>}
+
+    Return number of messages in the outbox, age of the oldest of them in
+    seconds and counters of the message bus publisher of the hub process which
+    handled this call (None if it has not sent any messages yet).
+    """
+    outbox = BusMessage.objects.aggregate(count=Count('id'), oldest=Min('created'))
+    oldest = None
+    if outbox['oldest'] is not None:
+        oldest = (timezone.now() - outbox['oldest']).total_seconds()
+    return {
+        'outbox': outbox['count'],
+        'oldest': oldest,
+        'publisher': get_publisher_stats(),
+    }
+
+
 def list_analyzers(request):
     return ClientAnalyzer.objects.export_available()
 
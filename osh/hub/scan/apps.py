@@ -0,0 +1,40 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+import logging
+
+from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+START_PUBLISHER_UID = 'osh.hub.scan.start_publisher'
+
+
+def start_publisher(sender, **kwargs):
+    """
+    Start the message bus publisher of this hub process, so that messages left
+    in the outbox by previous runs are sent without waiting for a new message
+    """
+    request_started.disconnect(dispatch_uid=START_PUBLISHER_UID)
+
+    from osh.hub.scan.messaging import get_publisher
+    from osh.hub.scan.models import AppSettings, BusMessage
+    try:
+        if AppSettings.setting_send_bus_message():
+            get_publisher(BusMessage.objects)
+    except AppSettings.DoesNotExist:
+        pass
+    except DatabaseError:
+        # the publisher is started by the next posted message
+        logger.exception('message bus: failed to start the publisher')
+
+
+class ScanConfig(AppConfig):
+    name = 'osh.hub.scan'
+
+    def ready(self):
+        # database must not be accessed here, it is checked on the first
+        # request, which comes right after start (workers poll the hub)
+        request_started.connect(start_publisher, dispatch_uid=START_PUBLISHER_UID)
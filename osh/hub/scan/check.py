@@ -15,6 +15,7 @@ from kobo.django.upload.models import FileUpload
 from kobo.rpmlib import parse_nvr
 
 from osh.hub.other.exceptions import PackageBlockedException
+from osh.hub.scan.koji_cache import get_koji_session
 from osh.hub.scan.models import ClientAnalyzer, ScanBinding
 from osh.hub.scan.xmlrpc_helper import cancel_scan
 
@@ -41,16 +42,39 @@ def check_obsolete_scan(package, release):
             cancel_scan(binding)
 
 
-def check_build(nvr):
-    configs = ['brew', 'koji', 'stream']
+# koji profiles searched for builds in this order
+KOJI_PROFILES = ['brew', 'koji', 'stream']
+
+
+def prefetch_builds(nvrs):
+    """
+    Fetch builds and their tasks from koji by a few multicalls and cache them
+    for check_build() and is_container_build() of many builds
+    """
+    missing = list(nvrs)
+    for config in KOJI_PROFILES:
+        if not missing:
+            return
+        try:
+            koji_proxy = get_koji_session(config)
+        except koji.ConfigurationError as e:
+            logger.debug('koji: %s', e)
+            continue
 
-    for config in configs:
+        builds = koji_proxy.prefetch('getBuild', [(nvr,) for nvr in missing])
+        found = [build for build in builds if build is not None and build.get('task_id')]
+        koji_proxy.prefetch('getTaskInfo', [(build['task_id'],) for build in found], request=True)
+        missing = [nvr for nvr, build in zip(missing, builds) if build is None]
+
+
+def check_build(nvr):
+    for config in KOJI_PROFILES:
         try:
-            server = koji.read_config(config)['server']
+            koji_proxy = get_koji_session(config)
         except koji.ConfigurationError as e:
             logger.debug('koji: %s', e)
             continue
-        build = koji.ClientSession(server).getBuild(nvr)
+        build = koji_proxy.getBuild(nvr)
         if build is None:
             continue
 
@@ -78,8 +102,7 @@ def is_container_build(nvr, koji_profile):
     """
 
     # retrieve the build task
-    cfg = koji.read_config(koji_profile)
-    koji_proxy = koji.ClientSession(cfg['server'])
+    koji_proxy = get_koji_session(koji_profile)
     build = koji_proxy.getBuild(nvr)
     task = koji_proxy.getTaskInfo(build['task_id'], request=True)
 
@@ -0,0 +1,147 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Pool of koji sessions and cache of build, task and tag metadata
+
+Koji sessions are not thread-safe, so every thread has its own session for
+each koji profile.  Metadata returned by the methods in CACHED_METHODS are
+shared by all threads of the process until they expire after
+KOJI_CACHE_TIMEOUT seconds.  Missing objects (None) are never cached because
+they may appear in koji at any time.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import koji
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# koji methods whose results are cached
+CACHED_METHODS = ('getBuild', 'getTaskInfo', 'getTag')
+
+
+class MetadataCache:
+    """ thread-safe LRU cache with entries expiring after `timeout` seconds """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        """ return cached value of key, call load() to obtain it on cache miss """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = load()
+        self.set(key, value)
+        return value
+
+    def set(self, key, value):
+        if value is None:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+
+metadata_cache = MetadataCache(settings.KOJI_CACHE_SIZE, settings.KOJI_CACHE_TIMEOUT)
+
+
+class KojiSession:
+    """ wrapper of koji.ClientSession which caches results of CACHED_METHODS """
+
+    def __init__(self, profile, session):
+        self.profile = profile
+        self.session = session
+
+    def __getattr__(self, name):
+        method = getattr(self.session, name)
+        if name not in CACHED_METHODS:
+            return method
+
+        def cached_method(*args, **kwargs):
+            key = _get_cache_key(self.profile, name, args, kwargs)
+            if key is None:
+                return method(*args, **kwargs)
+            return metadata_cache.get(key, lambda: method(*args, **kwargs))
+        return cached_method
+
+    def prefetch(self, name, args_list, **kwargs):
+        """
+        Cache results of method `name` (one of CACHED_METHODS) called with
+        each of args_list and kwargs using a single multicall; return list of
+        the results (None for failed calls)
+        """
+        with self.session.multicall(strict=False) as multicall:
+            calls = [getattr(multicall, name)(*args, **kwargs) for args in args_list]
+
+        results = []
+        for args, call in zip(args_list, calls):
+            try:
+                value = call.result
+            except Exception as e:  # noqa: B902
+                logger.debug('koji: %s%s failed: %s', name, args, e)
+                value = None
+            key = _get_cache_key(self.profile, name, args, kwargs)
+            if key is not None:
+                metadata_cache.set(key, value)
+            results.append(value)
+        return results
+
+
+def _get_cache_key(profile, name, args, kwargs):
+    """ return key of cached result of koji call or None if it is not hashable """
+    key = (profile, name, tuple(args), tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+_local = threading.local()
+
+
+def get_koji_session(profile):
+    """
+    Return session of koji `profile` for the current thread, raise
+    koji.ConfigurationError if the profile is not configured
+    """
+    sessions = _local.__dict__.setdefault('sessions', {})
+    if profile not in sessions:
+        server = koji.read_config(profile)['server']
+        logger.debug("Opening koji session to '%s' (%s)", server, profile)
+        sessions[profile] = KojiSession(profile, koji.ClientSession(server))
+    return sessions[profile]
+
+
+def get_cache_stats():
+    """ return counters of metadata cache of this process """
+    return metadata_cache.get_stats()
@@ -7,84 +7,295 @@ Created on Mon Aug 20 10:36:56 2012
 @author: ttomecek@redhat.com, kdudka@redhat.com
 
 module for sending messages using UMB (Unified Message Bus)
+
+Messages are stored in a database outbox first (see BusMessage) and passed to
+a Publisher once the transaction which created them is committed.  Every hub
+process has a single Publisher thread which keeps one connection to the
+broker open and sends queued messages in batches of up to UMB_BATCH_SIZE
+unacknowledged messages.  It is started by the first request of the process
+(see apps.py) or by the first posted message.  Messages are deleted from the outbox when the broker
+accepts them.  Messages which were not accepted within UMB_RETRY_DELAY seconds
+(because the queue was full, the connection was lost or the hub was restarted)
+are loaded from the outbox and sent again, so they are delivered at least
+once.
 """
 
+import collections
 import logging
+import queue
 import threading
+import time
 
 import proton
 import proton.handlers
 import proton.reactor
 from django.conf import settings
+from django.db import DatabaseError, close_old_connections
 
 __all__ = (
-    "send_message",
-    "post_qpid_message",
+    "Publisher",
+    "get_publisher",
+    "get_publisher_stats",
+    "get_topics",
 )
 
 logger = logging.getLogger(__name__)
 
 
-class UMBSender(proton.handlers.MessagingHandler):
-    def __init__(self, key, msg, topic_prefix):
+def get_topics(key):
+    """ return list of topics of messages with routing `key` """
+    tp_list = settings.UMB_TOPIC_PREFIX
+    if isinstance(tp_list, str):
+        # wrap string as a one-item list
+        tp_list = [tp_list]
+    return [topic_prefix + '.' + key for topic_prefix in tp_list]
+
+
+class PublisherHandler(proton.handlers.MessagingHandler):
+    """
+    proton handler of the Publisher thread, all its methods are called from
+    the thread of the container
+    """
+    def __init__(self, publisher):
         super().__init__()
-        self.urls = settings.UMB_BROKER_URLS
-        self.cert = settings.UMB_CLIENT_CERT
-        self.topic = topic_prefix + '.' + key
-        self.scan_id = msg['scan_id']
-        self.scan_state = msg['scan_state']
+        self.publisher = publisher
+        self.container = None
+        self.connection = None
+        self.senders = {}
+        # messages taken from the queue or the outbox and not sent yet
+        self.backlog = collections.deque()
+        # {delivery: (message, queued_at)}
+        self.in_flight = {}
+        # ids of messages settled by the broker and not deleted from the outbox yet
+        self.settled = []
 
     def on_start(self, event):
-        ssl = proton.SSLDomain(1)
-        cert = str(self.cert)
-        ssl.set_credentials(cert, cert, "")
-        conn = event.container.connect(urls=self.urls, ssl_domain=ssl)
-        event.container.create_sender(conn, self.topic)
+        ssl_domain = None
+        if self.publisher.cert:
+            ssl_domain = proton.SSLDomain(proton.SSLDomain.MODE_CLIENT)
+            cert = str(self.publisher.cert)
+            ssl_domain.set_credentials(cert, cert, "")
+        self.container = event.container
+        self.connection = event.container.connect(urls=self.publisher.urls,
+                                                  ssl_domain=ssl_domain)
+        event.container.selectable(self.publisher.injector)
+        # pick up messages left in the outbox by previous runs
+        event.container.schedule(0, self)
+
+    def on_timer_task(self, event):
+        event.container.schedule(self.publisher.retry_delay, self)
+        self.load_outbox()
+
+    def on_publisher_flush(self, event):
+        self.flush()
+
+    def on_publisher_stop(self, event):
+        self.delete_settled()
+        self.publisher.injector.close()
+        if self.connection is not None:
+            self.connection.close()
+        # application events are not bound to the container
+        self.container.stop()
 
     def on_sendable(self, event):
-        json_msg = '{ "scan_id": %d, "scan_state": "%s" }' % (self.scan_id, self.scan_state)
-        msg = proton.Message(body=json_msg)
-        event.sender.send(msg)
-        event.sender.close()
+        self.flush()
 
     def on_accepted(self, event):
-        event.connection.close()
+        message, queued_at = self.in_flight.pop(event.delivery)
+        self.publisher.record_sent(time.monotonic() - queued_at)
+        self.settle(message)
 
+    def on_rejected(self, event):
+        # the broker would reject the message again, do not retry it
+        message, _ = self.in_flight.pop(event.delivery)
+        logger.error('message bus: message %s to %s rejected: %s', message.id, message.topic,
+                     event.delivery.remote.condition)
+        self.publisher.record_failed()
+        self.settle(message)
 
-class SenderThread(threading.Thread):
-    """
-    new thread that handles sending messages to broker
-    """
-    def __init__(self, key, msg, topic_prefix):
-        threading.Thread.__init__(self)
-        self.key = key
-        self.msg = msg
-        self.topic_prefix = topic_prefix
+    def on_released(self, event):
+        # released and modified messages stay in the outbox and are sent again
+        message, _ = self.in_flight.pop(event.delivery, (None, None))
+        if message is not None:
+            logger.warning('message bus: message %s to %s not delivered', message.id, message.topic)
+            self.publisher.record_failed()
+        self.flush()
+
+    def on_disconnected(self, event):
+        # unacknowledged messages stay in the outbox and are sent again later
+        logger.warning('message bus: disconnected, %d messages not acknowledged',
+                       len(self.in_flight))
+        self.in_flight.clear()
+        self.senders.clear()
+        self.delete_settled()
+
+    def get_sender(self, topic):
+        sender = self.senders.get(topic)
+        if sender is None:
+            sender = self.senders[topic] = self.container.create_sender(self.connection, topic)
+        return sender
+
+    def flush(self):
+        """ send queued messages until there are batch_size messages in flight """
+        self.publisher.take_queued(self.backlog)
+        while self.backlog and len(self.in_flight) < self.publisher.batch_size:
+            message, queued_at = self.backlog.popleft()
+            delivery = self.get_sender(message.topic).send(proton.Message(body=message.body))
+            self.in_flight[delivery] = (message, queued_at)
+
+    def load_outbox(self):
+        """ queue messages which were not accepted by the broker in time """
+        pending = {message.id for message, _ in self.backlog}
+        pending.update(message.id for message, _ in self.in_flight.values())
+        now = time.monotonic()
+        try:
+            close_old_connections()
+            claimed = self.publisher.outbox.claim(self.publisher.queue_size)
+        except DatabaseError:
+            # keep the publisher running, the outbox is checked again later
+            logger.exception('message bus: failed to load messages from the outbox')
+            claimed = []
+        for message in claimed:
+            if message.id not in pending:
+                self.backlog.append((message, now))
+        self.flush()
 
-    def run(self):
-        sender = UMBSender(self.key, self.msg, self.topic_prefix)
-        cont = proton.reactor.Container(sender)
-        cont.run()
+    def settle(self, message):
+        """ delete settled messages from the outbox in batches """
+        self.settled.append(message.id)
+        if not self.in_flight or len(self.settled) >= self.publisher.batch_size:
+            self.delete_settled()
+        self.flush()
 
+    def delete_settled(self):
+        if not self.settled:
+            return
+        try:
+            close_old_connections()
+            self.publisher.outbox.delete_sent(self.settled)
+        except DatabaseError:
+            # keep the ids to delete them next time, the messages might be
+            # sent again meanwhile
+            logger.exception('message bus: failed to delete %d sent messages from the outbox',
+                             len(self.settled))
+            return
+        self.settled = []
 
-def send_message(message, key):
+
+class Publisher:
     """
-    this function sends specified message to broker and append specified
-        key to ROUTING_KEY
+    Thread sending messages stored in `outbox` to broker at one of `urls`
+
+    `outbox` provides claim(limit), which returns messages (objects with id,
+    topic and body attributes) not accepted by the broker in time, and
+    delete_sent(ids), which deletes messages accepted by the broker.
     """
-    tp_list = settings.UMB_TOPIC_PREFIX
-    if isinstance(tp_list, str):
-        # wrap string as a one-item list
-        tp_list = [tp_list]
+    def __init__(self, outbox, urls, cert=None, queue_size=1000, batch_size=100, retry_delay=60):
+        self.outbox = outbox
+        self.urls = urls
+        self.cert = cert
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.queue = queue.Queue(queue_size)
+        self.injector = proton.reactor.EventInjector()
+        self.container = proton.reactor.Container(PublisherHandler(self))
+        self.thread = threading.Thread(target=self.container.run, name='message-bus-publisher',
+                                       daemon=True)
+        self.stats_lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.latency_last = None
+        self.latency_max = None
+        self.latency_total = 0.0
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """ close the connection and wait for the thread to finish """
+        if not self.is_alive():
+            return
+        self.injector.trigger(proton.reactor.ApplicationEvent('publisher_stop'))
+        self.thread.join(timeout)
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def publish(self, messages):
+        """
+        Queue messages stored in the outbox for sending; return False if the
+        queue is full and some of them are left to be sent from the outbox
+        later
+        """
+        now = time.monotonic()
+        queued = True
+        for message in messages:
+            try:
+                self.queue.put_nowait((message, now))
+            except queue.Full:
+                with self.stats_lock:
+                    self.dropped += 1
+                queued = False
+        self.injector.trigger(proton.reactor.ApplicationEvent('publisher_flush'))
+        return queued
+
+    def take_queued(self, backlog):
+        """ move queued messages to `backlog` """
+        while True:
+            try:
+                backlog.append(self.queue.get_nowait())
+            except queue.Empty:
+                return
+
+    def record_sent(self, latency):
+        with self.stats_lock:
+            self.sent += 1
+            self.latency_last = latency
+            self.latency_max = max(latency, self.latency_max or 0)
+            self.latency_total += latency
+
+    def record_failed(self):
+        with self.stats_lock:
+            self.failed += 1
+
+    def get_stats(self):
+        """
+        return counters of sent, failed and dropped (sent from the outbox
+        later) messages, size of the queue and latencies of sending in seconds
+        """
+        with self.stats_lock:
+            return {
+                'sent': self.sent,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'queued': self.queue.qsize(),
+                'latency_last': self.latency_last,
+                'latency_max': self.latency_max,
+                'latency_avg': self.latency_total / self.sent if self.sent else None,
+            }
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
 
-    # start a separate instance of SenderThread for each topic prefix in the list
-    for topic_prefix in tp_list:
-        s = SenderThread(key, message, topic_prefix)
-        s.start()
+def get_publisher(outbox):
+    """ return publisher of this process, start it on first use """
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None or not _publisher.is_alive():
+            _publisher = Publisher(outbox, settings.UMB_BROKER_URLS, settings.UMB_CLIENT_CERT,
+                                   settings.UMB_QUEUE_SIZE, settings.UMB_BATCH_SIZE,
+                                   settings.UMB_RETRY_DELAY)
+            _publisher.start()
+        return _publisher
 
 
-def post_qpid_message(state, etm, key):
-    """Separated this into scan_notice because of dependency deadlock"""
-    logger.info('message bus: %s %s', etm, state)
-    message = {'scan_id': etm.id, 'scan_state': state}
-    send_message(message, key)
+def get_publisher_stats():
+    """ return stats of publisher of this process or None if it was not started """
+    with _publisher_lock:
+        if _publisher is None:
+            return None
+        return _publisher.get_stats()
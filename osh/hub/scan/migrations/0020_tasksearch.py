@@ -0,0 +1,24 @@
+# Generated by Django 3.2.20 on 2026-10-18 22:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0004_alter_task_worker'),
+        ('scan', '0019_alter_analyzer_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskSearch',
+            fields=[
+                ('task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search', serialize=False, to='hub.task')),
+                ('nvr', models.CharField(db_index=True, max_length=255)),
+                ('package_name', models.CharField(blank=True, db_index=True, max_length=255, null=True)),
+                ('comment', models.TextField(blank=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,49 @@
+import os
+
+from django.db import migrations
+from kobo.rpmlib import parse_nvr
+
+BATCH_SIZE = 1000
+
+
+# copies of osh.hub.scan.utils.parse_task_label() and normalize_comment() as
+# of this migration, so that later changes of them do not affect it
+def parse_task_label(label):
+    nvr = os.path.basename(label or '')
+    if nvr.endswith('.src.rpm'):
+        nvr = nvr[:-len('.src.rpm')]
+    try:
+        return nvr, parse_nvr(nvr)['name']
+    except ValueError:
+        return nvr, None
+
+
+def normalize_comment(comment):
+    return ' '.join((comment or '').lower().split())
+
+
+def forwards_func(apps, schema_editor):
+    Task = apps.get_model('hub', 'task')
+    TaskSearch = apps.get_model('scan', 'tasksearch')
+
+    # index all existing tasks, new tasks are indexed when created
+    batch = []
+    tasks = Task.objects.filter(search__isnull=True).values_list('id', 'label', 'comment')
+    for task_id, label, comment in tasks.iterator(chunk_size=BATCH_SIZE):
+        nvr, package_name = parse_task_label(label)
+        batch.append(TaskSearch(task_id=task_id, nvr=nvr, package_name=package_name,
+                                comment=normalize_comment(comment)))
+        if len(batch) >= BATCH_SIZE:
+            TaskSearch.objects.bulk_create(batch)
+            batch = []
+    TaskSearch.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('scan', '0020_tasksearch'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards_func, migrations.RunPython.noop)
+    ]
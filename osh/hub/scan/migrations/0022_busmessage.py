@@ -0,0 +1,24 @@
+# Generated by Django 3.2.20 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scan', '0021_fill_tasksearch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BusMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('locked_until', models.DateTimeField(db_index=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
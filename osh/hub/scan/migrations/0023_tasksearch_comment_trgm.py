@@ -0,0 +1,31 @@
+# Generated by Django 3.2.20 on 2026-10-18 16:20
+
+from django.db import migrations
+
+INDEX_NAME = 'scan_tasksearch_comment_trgm'
+
+
+def create_index(apps, schema_editor):
+    # substring lookups can use trigram index only on PostgreSQL
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS %s ON scan_tasksearch USING gin (comment gin_trgm_ops)'
+                          % INDEX_NAME)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS %s' % INDEX_NAME)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scan', '0022_busmessage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
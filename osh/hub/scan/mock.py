@@ -12,9 +12,13 @@ import subprocess
 import tempfile
 import urllib.parse
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import koji
 from django.conf import settings
+from django.core.cache import cache
+
+from osh.hub.scan.koji_cache import get_koji_session
 
 logger = logging.getLogger(__name__)
 
@@ -64,15 +68,24 @@ def _get_build_method_build_tag(koji_proxy, nvr, target):
     return koji_proxy.getBuildTarget(target)['build_tag_name']
 
 
+def _get_task_descendents(koji_proxy, task_id):
+    """
+    returns info (including request) about given task and all its descendents,
+    the info is fetched by a single multicall
+    """
+    descendents = koji_proxy.getTaskDescendents(task_id, request=True)
+    with koji_proxy.multicall(strict=True) as multicall:
+        calls = [multicall.getTaskInfo(child_id, request=True) for child_id in descendents]
+    return [call.result for call in calls]
+
+
 def _get_module_build_tag(koji_proxy, task_id):
     """
     returns build tag name of the first regular external build target for given
     modular task
     """
     buildtag_id = None
-    for child_id in koji_proxy.getTaskDescendents(task_id, request=True):
-        child = koji_proxy.getTaskInfo(child_id, request=True)
-
+    for child in _get_task_descendents(koji_proxy, task_id):
         # skip non-buildArch tasks
         if child['method'] != 'buildArch':
             continue
@@ -122,8 +135,7 @@ def _get_build_arches(koji_proxy, task_id, tag):
         return koji_proxy.getTag(tag)['arches'].split()
 
     arches = []
-    for child_id in koji_proxy.getTaskDescendents(task_id, request=True):
-        child = koji_proxy.getTaskInfo(child_id, request=True)
+    for child in _get_task_descendents(koji_proxy, task_id):
         method = child['method']
 
         # wrapperRPM tasks do not track arches directly
@@ -183,16 +195,35 @@ def _get_tag_specific_config(target):
     return "config_opts['use_bootstrap_image'] = False\n"
 
 
-def _create_mock_config(tag, arch, koji_profile, dest_dir):
+def _get_koji_mock_config(tag, arch, koji_profile, repo_id):
     """
-    creates a single mock config for given tag and architecture and stores it
-    in given directory
+    returns mock config for given tag and architecture generated by koji,
+    it is cached until the repo of the tag is regenerated
     """
+    key = f'mock-config:{koji_profile}:{tag}:{arch}:{repo_id}'
+    if repo_id is not None:
+        contents = cache.get(key)
+        if contents is not None:
+            logger.debug('Using cached mock config for "%s" (%s, repo %s)', tag, arch, repo_id)
+            return contents
+
     p = subprocess.run(['koji', '-p', koji_profile, 'mock-config', '--latest',
                         '--arch', arch, '--tag', tag],
                        check=True, stdout=subprocess.PIPE)
     contents = p.stdout.decode()
 
+    if repo_id is not None:
+        cache.set(key, contents, settings.MOCK_CONFIG_CACHE_TIMEOUT)
+    return contents
+
+
+def _create_mock_config(tag, arch, koji_profile, dest_dir, repo_id=None):
+    """
+    creates a single mock config for given tag and architecture and stores it
+    in given directory
+    """
+    contents = _get_koji_mock_config(tag, arch, koji_profile, repo_id)
+
     # add extra repos
     matched_repos = [repo for regex, repo
                      in getattr(settings, 'MOCK_AUTO_EXTRA_REPOS', {}).items()
@@ -224,8 +255,7 @@ def generate_mock_configs(nvr, koji_profile):
     tmpdir = tempfile.mkdtemp()
 
     # retrieve the build
-    cfg = koji.read_config(koji_profile)
-    koji_proxy = koji.ClientSession(cfg['server'])
+    koji_proxy = get_koji_session(koji_profile)
     build = koji_proxy.getBuild(nvr)
 
     # retrieve task parameters
@@ -257,9 +287,17 @@ def generate_mock_configs(nvr, koji_profile):
     if not arches:
         raise RuntimeError(f'No arches found for tag "{tag}"!')
 
+    # the latest repo identifies the content of the generated configs
+    repo = koji_proxy.getRepo(tag)
+    repo_id = repo['id'] if repo else None
+
     # generate a config for every built arch
     logger.debug(f'Generating mock configs for build tag "{tag}"')
-    for arch in _get_build_arches(koji_proxy, task['id'], tag):
-        _create_mock_config(tag, arch, koji_profile, tmpdir)
+    with ThreadPoolExecutor(max_workers=settings.MOCK_CONFIG_WORKERS) as executor:
+        futures = [executor.submit(_create_mock_config, tag, arch, koji_profile, tmpdir, repo_id)
+                   for arch in arches]
+        # propagate failures
+        for future in futures:
+            future.result()
 
     return tmpdir
@@ -5,20 +5,26 @@ import datetime
 import json
 import logging
 import re
+import threading
+import time
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import (MultipleObjectsReturned,
                                     ObjectDoesNotExist, ValidationError)
 from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from kobo.client.constants import TASK_STATES
 from kobo.hub.models import Task
 from kobo.types import Enum, EnumItem
 
 from osh.hub.other import get_or_none
-from osh.hub.scan.messaging import post_qpid_message
+from osh.hub.scan.messaging import get_publisher, get_topics
+from osh.hub.scan.utils import normalize_comment, parse_task_label
 
 logger = logging.getLogger(__name__)
 
@@ -208,10 +214,9 @@ statistical data will be harvested for this system release.")
 
 class TagMixin:
     def for_release_str(self, release_str):
-        for rm in ReleaseMapping.objects.all():
-            tag = rm.get_tag(release_str)
-            if tag:
-                return tag
+        tag = release_resolver.resolve(release_str)
+        if tag:
+            return tag
         logger.critical("Unable to assign proper product and release: %s", release_str)
         raise RuntimeError("Packages in this release are not being scanned.")
 
@@ -694,11 +699,10 @@ counted in statistics.")
         if self.is_errata_base_scan():
             return
         if AppSettings.setting_send_bus_message():
-            post_qpid_message(
-                SCAN_STATES.get_value(self.state),
-                ETMapping.objects.get(latest_run=self.scanbinding),
-                key
-            )
+            etm = ETMapping.objects.get(latest_run=self.scanbinding)
+            state = SCAN_STATES.get_value(self.state)
+            logger.info('message bus: %s %s', etm, state)
+            BusMessage.objects.post({'scan_id': etm.id, 'scan_state': state}, key)
 
     def set_base(self, base, save=True):
         self.base = base
@@ -946,6 +950,79 @@ class ReleaseMapping(models.Model):
                 return tag
 
 
+class ReleaseResolver:
+    """
+    Resolve release strings to tags using compiled release mappings.
+
+    Mappings and tags are loaded once and results are memoized.  Everything
+    is loaded again when mappings or tags are changed in this process or after
+    `timeout` seconds, so that changes made by other processes are noticed.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.loaded = None
+        # [(compiled release_tag, template)] in order of priority
+        self.mappings = []
+        # tag name -> [field values of tags]
+        self.tags = {}
+        # release string -> field values of tag or None
+        self.resolved = {}
+
+    def invalidate(self, **kwargs):
+        with self.lock:
+            self.loaded = None
+
+    def load(self):
+        self.mappings = [(re.compile(rm.release_tag), rm.template)
+                         for rm in ReleaseMapping.objects.order_by('priority', 'id')]
+        field_names = self.field_names()
+        name_index = field_names.index('name')
+        self.tags = {}
+        for values in Tag.objects.values_list(*field_names):
+            self.tags.setdefault(values[name_index], []).append(values)
+        self.resolved = {}
+        self.loaded = time.monotonic()
+
+    @staticmethod
+    def field_names():
+        return [f.attname for f in Tag._meta.concrete_fields]
+
+    def match(self, release_str):
+        for pattern, template in self.mappings:
+            m = pattern.match(release_str)
+            if m:
+                tags = self.tags.get(template % m.groups(), [])
+                # skip missing and ambiguous tags
+                if len(tags) == 1:
+                    return tags[0]
+        return None
+
+    def resolve(self, release_str):
+        """ return Tag for release_str or None if there is no matching one """
+        with self.lock:
+            if self.loaded is None or time.monotonic() - self.loaded > self.timeout:
+                self.load()
+            if release_str not in self.resolved:
+                self.resolved[release_str] = self.match(release_str)
+            values = self.resolved[release_str]
+
+        if values is None:
+            return None
+        # every caller gets its own instance
+        return Tag.from_db(None, self.field_names(), values)
+
+
+release_resolver = ReleaseResolver(settings.RELEASE_MAPPING_CACHE_TIMEOUT)
+
+
+@receiver([post_save, post_delete], sender=ReleaseMapping)
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_release_resolver(sender, **kwargs):
+    release_resolver.invalidate()
+
+
 class ETMapping(models.Model):
     advisory_id = models.CharField(max_length=16, blank=False, null=False)
     et_scan_id = models.CharField(max_length=16, blank=False, null=False)
@@ -967,6 +1044,57 @@ class ETMapping(models.Model):
             self.save()
 
 
+class BusMessageManager(models.Manager):
+    def post(self, message, key):
+        """
+        Store JSON `message` for all UMB topic prefixes and pass it to the
+        publisher once the current transaction is committed
+        """
+        locked_until = timezone.now() + datetime.timedelta(seconds=settings.UMB_RETRY_DELAY)
+        body = json.dumps(message)
+        messages = [self.create(topic=topic, body=body, locked_until=locked_until)
+                    for topic in get_topics(key)]
+        transaction.on_commit(lambda: get_publisher(self).publish(messages))
+        return messages
+
+    def claim(self, limit):
+        """
+        Return up to `limit` messages which were not accepted by the broker in
+        time and lock them for another UMB_RETRY_DELAY seconds, so that they
+        are not sent by other hub processes meanwhile
+        """
+        now = timezone.now()
+        locked_until = now + datetime.timedelta(seconds=settings.UMB_RETRY_DELAY)
+        with transaction.atomic():
+            # rows locked by other hub processes claiming them are skipped
+            claimed = list(self.select_for_update(skip_locked=True)
+                           .filter(locked_until__lte=now).order_by('id')[:limit])
+            self.filter(id__in=[message.id for message in claimed]).update(
+                locked_until=locked_until, attempts=models.F('attempts') + 1)
+        return claimed
+
+    def delete_sent(self, ids):
+        self.filter(id__in=ids).delete()
+
+
+class BusMessage(models.Model):
+    """
+    Outbox of messages for UMB, messages are deleted once they are accepted by
+    the broker
+    """
+    topic = models.CharField(max_length=255)
+    body = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+    # the message is sent again from the outbox after this time
+    locked_until = models.DateTimeField(db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    objects = BusMessageManager()
+
+    def __str__(self):
+        return "#%d %s" % (self.id, self.topic)
+
+
 class AppSettings(models.Model):
     """
     Settings for OpenScanHub stored in DB so they can be easily changed.
@@ -979,6 +1107,8 @@ class AppSettings(models.Model):
     WAIVER_IS_OVERDUE int
 
     SCANNING_COMMAND_RELSPEC -- override of default
+
+    STATS_WATERMARK json -- state of incremental statistics
     """
     key = models.CharField(max_length=128, blank=False, null=False)
     value = models.TextField(blank=True, null=True)
@@ -1062,6 +1192,22 @@ class AppSettings(models.Model):
         if dirs:
             return json.loads(dirs.value)
 
+    @classmethod
+    def settings_get_stats_watermark(cls):
+        """
+        State of incremental statistics after their last update:
+        {'scan': last_scan_id, 'waiving_log': last_log_id, 'pending': [scan_id, ...]}
+        """
+        watermark = get_or_none(cls, key="STATS_WATERMARK")
+        if watermark:
+            return json.loads(watermark.value)
+
+    @classmethod
+    def settings_set_stats_watermark(cls, watermark):
+        obj, _ = cls.objects.get_or_create(key="STATS_WATERMARK")
+        obj.value = json.dumps(watermark)
+        obj.save()
+
 
 class ClientAnalyzerMixin:
     def verify_by_name(self, name):
@@ -1298,3 +1444,54 @@ class TaskResultsRemoval(models.Model):
     reason = models.ForeignKey(RetentionPolicySetting, on_delete=models.CASCADE,
                                help_text="Reason why the retention was applied to the task")
     date_retention_applied = models.DateTimeField(auto_now_add=True)
+
+
+class TaskSearchManager(models.Manager):
+    def update_for_task(self, task, created=False):
+        """ index `task`, the index is written only if it is missing or outdated """
+        nvr, package_name = parse_task_label(task.label)
+        values = {
+            'nvr': nvr,
+            'package_name': package_name,
+            'comment': normalize_comment(task.comment),
+        }
+        search = None if created else self.filter(task=task).first()
+        if search is None:
+            return self.create(task=task, **values)
+
+        changed = [field for field, value in values.items() if getattr(search, field) != value]
+        if changed:
+            for field in changed:
+                setattr(search, field, values[field])
+            search.save(update_fields=changed)
+        return search
+
+
+class TaskSearch(models.Model):
+    """
+    Searchable attributes of a task parsed from its label and comment, so that
+    tasks can be found by indexed lookups instead of regular expressions
+    """
+    task = models.OneToOneField(Task, on_delete=models.CASCADE, primary_key=True,
+                                related_name='search')
+    nvr = models.CharField(max_length=255, db_index=True)
+    package_name = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    # lowercase comment with collapsed whitespace, searched for substrings
+    # using trigram index on PostgreSQL (see migration 0023)
+    comment = models.TextField(blank=True)
+
+    objects = TaskSearchManager()
+
+    def __str__(self):
+        return "#%d %s" % (self.task_id, self.nvr)
+
+
+@receiver(post_save, sender=Task)
+def index_task(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    """ keep the search index up to date with labels and comments of tasks """
+    if raw:
+        return
+    if update_fields is not None and not {'label', 'comment'} & set(update_fields):
+        # neither label nor comment was saved
+        return
+    TaskSearch.objects.update_for_task(instance, created)
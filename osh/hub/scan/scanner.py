@@ -14,15 +14,18 @@ import re
 import shutil
 
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.utils.functional import cached_property
 from kobo.django.upload.models import FileUpload
 from kobo.hub.models import TASK_STATES, Arch, Task
+from kobo.rpmlib import parse_nvr
 
 from osh.common.validators import parse_dist_git_url
 from osh.hub.other.exceptions import PackageBlockedException
 from osh.hub.scan.check import (check_analyzers, check_build, check_nvr,
                                 check_obsolete_scan, check_package_is_blocked,
                                 check_srpm, check_task_metadata, check_upload,
-                                is_container_build)
+                                is_container_build, prefetch_builds)
 from osh.hub.scan.mock import generate_mock_configs
 from osh.hub.scan.models import (REQUEST_STATES, SCAN_TYPES, AppSettings,
                                  ClientAnalyzer, ETMapping, MockConfig,
@@ -34,10 +37,12 @@ from osh.hub.service.processing import task_has_results
 logger = logging.getLogger(__name__)
 
 
-def dig_arch(mock_config):
-    for arch in Arch.objects.all():
-        if mock_config.endswith(arch.name):
-            return arch.name
+def dig_arch(mock_config, arch_names=None):
+    if arch_names is None:
+        arch_names = Arch.objects.values_list('name', flat=True)
+    for arch_name in arch_names:
+        if mock_config.endswith(arch_name):
+            return arch_name
     return 'noarch'
 
 
@@ -55,17 +60,52 @@ def move_mock_configs(src, task_dir):
     shutil.rmtree(src)
 
 
+class SchedulerLookups:
+    """
+    Database lookups of schedulers, a single instance is shared by all
+    schedulers of a batch of submitted scans
+    """
+    def __init__(self):
+        # package name -> Package
+        self.packages = {}
+
+    def prefetch_packages(self, names):
+        """
+        load packages `names` and create the missing ones; this has to be
+        called outside of savepoints of the scans, which could roll back the
+        created packages
+        """
+        for package in Package.objects.filter(name__in=names):
+            self.packages[package.name] = package
+        for name in names:
+            self.get_package(name)
+
+    def get_package(self, name):
+        if name not in self.packages:
+            self.packages[name] = Package.objects.get_or_create_by_name(name)
+        return self.packages[name]
+
+    @cached_property
+    def su_user(self):
+        return AppSettings.setting_get_su_user()
+
+    @cached_property
+    def arch_names(self):
+        return list(Arch.objects.values_list('name', flat=True))
+
+
 class AbstractScheduler:
     """
 
     """
-    def __init__(self, options, *args, **kwargs):
+    def __init__(self, options, *args, lookups=None, **kwargs):
         """ """
         self.task_args = {}
         self.scan_args = {}
 
         # provided options
         self.options = options
+        self.lookups = lookups if lookups is not None else SchedulerLookups()
 
         # {'name': 'foo', 'version':...}
         self.target_nvre_dict = {}
@@ -92,10 +132,10 @@ class AbstractScheduler:
         self.task_args['args'] = {}
         self.task_args['args']['build'] = self.nvr
         self.task_args['args']['profile'] = 'errata'
-        self.task_args['args']['su_user'] = AppSettings.setting_get_su_user()
+        self.task_args['args']['su_user'] = self.lookups.su_user
         self.scan_args['nvr'] = self.nvr
         self.scan_args['username'] = self.package_owner
-        self.package = Package.objects.get_or_create_by_name(self.target_nvre_dict['name'])
+        self.package = self.lookups.get_package(self.target_nvre_dict['name'])
         self.priority_offset = self.package.get_priority_offset()
 
     def store(self):
@@ -150,7 +190,7 @@ class BaseScheduler(AbstractScheduler):
         self.scan_args['tag'] = self.tag
         self.scan_args['enabled'] = False
 
-        self.task_args['arch_name'] = dig_arch(self.mock_config)
+        self.task_args['arch_name'] = dig_arch(self.mock_config, self.lookups.arch_names)
         self.task_args['label'] = self.nvr
         self.task_args['method'] = self.method
 
@@ -200,6 +240,7 @@ class AbstractTargetScheduler(AbstractScheduler):
         self.package_name = ""
 
         # transaction management
+        self.is_prepared = False
         self.is_spawned = False
 
         self.validate_options()
@@ -224,13 +265,14 @@ class AbstractTargetScheduler(AbstractScheduler):
         self.task_args['priority'] = max(0, 10 + self.priority_offset)
         self.scan_args['enabled'] = True
 
-    def store(self):
+    def prepare(self):
         """
-        create and update database models from provided data
+        prepare arguments of the scan and its task including mock configs,
+        this involves only koji and reads from the database
         """
-        if self.is_stored:
-            logger.warning("Trying to call store() second time.")
+        if self.is_prepared:
             return
+        self.prepare_args()
 
         pkg_name = self.package.name
 
@@ -249,7 +291,7 @@ class AbstractTargetScheduler(AbstractScheduler):
         if mock_config == 'auto' and is_container:
             mock_config = 'cspodman'
 
-        self.task_args['arch_name'] = dig_arch(mock_config)
+        self.task_args['arch_name'] = dig_arch(mock_config, self.lookups.arch_names)
         self.task_args['args']['mock_config'] = mock_config
         if self.task_args['args']['mock_config'] == 'auto':
             self.mock_config_tmpdir = generate_mock_configs(self.nvr, self.koji_profile)
@@ -263,6 +305,16 @@ class AbstractTargetScheduler(AbstractScheduler):
         elif is_container:
             raise PackageBlockedException(f'Container {pkg_name} is not eligible for scanning.')
 
+        self.is_prepared = True
+
+    def store(self):
+        """
+        create and update database models from provided data
+        """
+        if self.is_stored:
+            logger.warning("Trying to call store() second time.")
+            return
+
         check_package_is_blocked(self.package, self.tag.release)
         check_obsolete_scan(self.package, self.tag.release)
 
@@ -275,7 +327,7 @@ class AbstractTargetScheduler(AbstractScheduler):
         if self.is_spawned:
             logger.warning("Trying to call spawn() second time.")
             return
-        self.prepare_args()
+        self.prepare()
         self.store()
         task_id = Task.create_task(**self.task_args)
         task = Task.objects.get(id=task_id)
@@ -717,22 +769,28 @@ def obtain_base(base_nvr, mock_config):
     return binding.scan
 
 
-def create_errata_scan(options, etm):
+def get_errata_scheduler(options, lookups=None):
     if options['base'].lower() == 'new_package':
-        sb = NewPkgScheduler(options).spawn()
-    elif is_rebase(options['base'], options['target']):
-        sb = RebaseScheduler(options).spawn()
-    else:
-        sb = ClassicScheduler(options).spawn()
+        return NewPkgScheduler(options, lookups=lookups)
+    if is_rebase(options['base'], options['target']):
+        return RebaseScheduler(options, lookups=lookups)
+    return ClassicScheduler(options, lookups=lookups)
+
+
+def create_errata_scan(options, etm, lookups=None, scheduler=None):
+    if scheduler is None:
+        scheduler = get_errata_scheduler(options, lookups)
+    sb = scheduler.spawn()
     etm.set_latest_run(sb)
     sb.scan.set_state_queued()
     return etm
 
 
-def handle_scan(kwargs):
+def handle_scan(kwargs, lookups=None, scheduler=None):
     """
     Create ET diff scan, handle all possible failures, return dict with
-    response, so it can be passed to ET
+    response, so it can be passed to ET.  `scheduler` is either the result
+    of prepare_errata_scan() or None to prepare it here.
     """
     response = {}
     message = None
@@ -746,7 +804,12 @@ def handle_scan(kwargs):
         etm.advisory_id = get_or_fail('errata_id', kwargs)
         etm.save()
 
-        create_errata_scan(kwargs, etm)
+        if isinstance(scheduler, Exception):
+            raise scheduler
+
+        # do not leave partially created scans behind
+        with transaction.atomic():
+            create_errata_scan(kwargs, etm, lookups, scheduler)
     except PackageBlockedException as ex:
         status = 'INELIGIBLE'
         message = str(ex)
@@ -759,6 +822,10 @@ def handle_scan(kwargs):
     else:
         status = 'OK'
 
+    if status != 'OK':
+        # the scan binding was rolled back
+        etm.latest_run = None
+
     # set status in response dict + in DB
     response['status'] = status
     etm.state = REQUEST_STATES[status]
@@ -775,3 +842,43 @@ def handle_scan(kwargs):
         response['id'] = etm.id
 
     return response
+
+
+def prepare_errata_scan(kwargs, lookups):
+    """
+    Return scheduler of ET diff scan with koji lookups done and mock configs
+    generated, or the exception to be reported by handle_scan()
+    """
+    try:
+        scheduler = get_errata_scheduler(kwargs, lookups)
+        scheduler.prepare()
+    except Exception as ex:  # noqa: B902
+        return ex
+    return scheduler
+
+
+def handle_scans(kwargs_list):
+    """
+    Batch version of handle_scan(): create ET diff scans of all builds in a
+    single transaction, return list of responses in the same order.  Koji and
+    database lookups are shared by all the builds and each of them is created
+    in its own savepoint, so that a failure affects only the failed build.
+    Koji calls and generation of mock configs are done before the transaction
+    to keep it short.
+    """
+    lookups = SchedulerLookups()
+    nvrs = [kwargs['target'] for kwargs in kwargs_list if kwargs.get('target')]
+    names = []
+    for nvr in nvrs:
+        try:
+            names.append(parse_nvr(nvr)['name'])
+        except ValueError:
+            # reported by handle_scan()
+            pass
+    lookups.prefetch_packages(names)
+    prefetch_builds(nvrs)
+
+    schedulers = [prepare_errata_scan(kwargs, lookups) for kwargs in kwargs_list]
+    with transaction.atomic():
+        return [handle_scan(kwargs, lookups, scheduler)
+                for kwargs, scheduler in zip(kwargs_list, schedulers)]
@@ -9,6 +9,7 @@
 import logging
 import os
 import shlex
+import tarfile
 
 from django.core.exceptions import ObjectDoesNotExist
 from kobo.hub.models import Task
@@ -19,6 +20,7 @@ from osh.common.constants import (ERROR_DIFF_FILE, ERROR_HTML_FILE,
                                   FIXED_HTML_FILE, FIXED_TXT_FILE)
 from osh.hub.other.exceptions import ScanException
 from osh.hub.service.processing import add_title_to_json
+from osh.hub.service.tarball import extract_tarball
 
 from .models import (SCAN_STATES, SCAN_STATES_FINISHED_BAD, SCAN_TYPES_TARGET,
                      Scan, ScanBinding)
@@ -109,10 +111,6 @@ old: %s new: %s', old_err, new_err)
 def extract_logs_from_tarball(task_id, name=None):
     """
         Extracts files from tarball for specified task.
-
-        currently (sep 2012) module tarfile does not support lzma compression
-        so I used program tar (and xz, because RHEL5 does not have latest tar
-        program with lzma compression support)
     """
     task = Task.objects.get(id=task_id)
     task_dir = task.get_task_dir(task.id)
@@ -149,32 +147,11 @@ def extract_logs_from_tarball(task_id, name=None):
         raise RuntimeError('There is no tarball specfied for task %s' %
                            (task_id))
 
-    # xz -cd asd.tar.xz | tar -x --exclude=\*.cov -C ./test/
-    # tar -xzf file.tar.gz -C /output/directory
-    if tar_archive.endswith('xz'):
-        command = ' '.join(['xz', '-cd', shlex.quote(tar_archive),
-                            '|', 'tar', '-x', r'--exclude=\*.cov',
-                            r'--exclude=\*cov-html',
-                            '-C ' + shlex.quote(task_dir)])
-    elif tar_archive.endswith('lzma'):
-        command = ' '.join(['xz', '-cd', '--format=lzma',
-                            shlex.quote(tar_archive),
-                            '|', 'tar', '-x', r'--exclude=\*.cov',
-                            r'--exclude=\*cov-html',
-                            '-C ' + shlex.quote(task_dir)])
-    elif tar_archive.endswith('gz'):
-        command = ['tar', '-xzf',
-                   shlex.quote(tar_archive),
-                   r'--exclude=\*.cov', r'--exclude=\*cov-html',
-                   '-C ' + shlex.quote(task_dir)]
-    else:
-        raise RuntimeError('Unsupported compression format (%s), task id: %s' %
-                           (tar_archive, task_id))
     try:
-        run(command, can_fail=False, stdout=False)
-    except RuntimeError:
-        raise RuntimeError('[%s] Unable to extract tarball archive %s \
-I have used this command: %s' % (task_id, tar_archive, command))
+        extract_tarball(tar_archive, task_dir, ['*.cov', '*cov-html'])
+    except (OSError, tarfile.TarError) as ex:
+        raise RuntimeError('[%s] Unable to extract tarball archive %s: %s'
+                           % (task_id, tar_archive, ex))
 
 
 def get_latest_sb_by_package(release, package):
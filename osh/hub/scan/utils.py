@@ -2,6 +2,7 @@
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
 import logging
+import os
 
 from kobo.rpmlib import parse_nvr
 
@@ -22,3 +23,22 @@ def is_rebase(base, target):
     base_d = parse_nvr(base)
     target_d = parse_nvr(target)
     return target_d['version'] != base_d['version']
+
+
+def parse_task_label(label):
+    """
+    Return (nvr, package name) of task with label `label`, which is either NVR
+    or file name of SRPM; package name is None if it cannot be parsed
+    """
+    nvr = os.path.basename(label or '')
+    if nvr.endswith('.src.rpm'):
+        nvr = nvr[:-len('.src.rpm')]
+    try:
+        return nvr, parse_nvr(nvr)['name']
+    except ValueError:
+        return nvr, None
+
+
+def normalize_comment(comment):
+    """ lowercase comment and collapse whitespace so that it can be searched """
+    return ' '.join((comment or '').lower().split())
@@ -5,9 +5,11 @@ import glob
 import json
 import logging
 import os
-import subprocess
+import re
 import tempfile
 
+from osh.hub.service.tarball import extract_tarball
+
 RESULT_FILE_JSON = 'scan-results.js'
 RESULT_FILE_ERR = 'scan-results.err'
 RESULT_FILE_HTML = 'scan-results.html'
@@ -38,24 +40,15 @@ class ResultsExtractor:
             raise RuntimeError('json results do not exist: ' + self._json_path)
         return self._json_path
 
-    def extract_tarball(self, exclude_patterns=None):
+    def extract_tarball(self, exclude_patterns=None, include_patterns=None):
         """
-
+        extract the tarball, contents matching exclude_patterns (and debug
+        dir) are skipped; if include_patterns are set, only files matching
+        them are extracted
         """
-        exclude_patterns = exclude_patterns or []
+        exclude_patterns = list(exclude_patterns or [])
         exclude_patterns.append("*debug")  # do not unpack debug dir
-        # python 2 does not support lzma
-        command = [
-            'tar', '-xf', self.path,
-            '-C', self.output_dir,
-            '--wildcards',
-            '--wildcards-match-slash',
-        ]
-        if exclude_patterns:
-            # do NOT quote pattern! it won't work
-            command += ['--exclude=' + p for p in exclude_patterns]
-        logger.debug('Running command %s', command)
-        subprocess.check_call(command)
+        return extract_tarball(self.path, self.output_dir, exclude_patterns, include_patterns)
 
     def get_json_result_path(self):
         return self.json_path
@@ -65,7 +58,8 @@ class ResultsExtractor:
         if os.path.isdir(self.path):
             self._json_path = os.path.join(self.path, RESULT_FILE_JSON)
         else:
-            self.extract_tarball()
+            # nothing but the JSON results is needed here
+            self.extract_tarball(include_patterns=['*/' + RESULT_FILE_JSON])
             try:
                 self._json_path = glob.glob(os.path.join(self.output_dir, '*', RESULT_FILE_JSON))[0]
             except IndexError:
@@ -73,6 +67,108 @@ class ResultsExtractor:
                 self._json_path = ''
 
 
+class JSONStreamReader:
+    """
+    Incremental reader of a JSON object stored in a file.  Members of the
+    object which are arrays can be iterated item by item so that only a single
+    item of the array needs to be kept in memory.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+    # characters which may continue a number in the next chunk
+    NUMBER_TAIL = re.compile(r'[0-9.eE+-]*')
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.buf = ''
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size=None):
+        """ read more data into buffer, return False on EOF """
+        chunk = self.fp.read(size or self.CHUNK_SIZE)
+        if not chunk:
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """ skip whitespace and return the next character ('' on EOF) """
+        while True:
+            self.pos = self.WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, chars):
+        """ consume the next character, which has to be one of chars """
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError("Expected one of %r in %s, got %r"
+                             % (chars, getattr(self.fp, "name", "JSON stream"), char))
+        self.pos += 1
+        return char
+
+    def _decode(self):
+        """ decode a single JSON value """
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                # incomplete value, read at least as much as we already have
+                # so that large values are not re-parsed too many times
+                if not self._fill(max(self.CHUNK_SIZE, len(self.buf) - self.pos)):
+                    raise
+                continue
+
+            # a number at the end of buffer might continue in the next chunk,
+            # e.g. '1.' is decoded as 1 if '5' has not been read yet
+            if isinstance(value, (int, float)) and not isinstance(value, bool) \
+                    and self.NUMBER_TAIL.match(self.buf, end).end() == len(self.buf) \
+                    and self._fill():
+                continue
+
+            self.pos = end
+            return value
+
+    def _iter_array(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self._decode()
+            if self._expect(',]') == ']':
+                return
+
+    def iter_items(self, streamed=()):
+        """
+        yield (key, value) pairs of the top-level object; values of members
+        named in streamed are yielded as iterators over the array items, items
+        not consumed by the caller are skipped
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self._decode()
+            self._expect(':')
+            if key in streamed and self._peek() == '[':
+                items = self._iter_array()
+                yield key, items
+                for _ in items:
+                    pass
+            else:
+                yield key, self._decode()
+            if self._expect(',}') == '}':
+                return
+
+
 class CsmockAPI:
     """
     Parser for the csmock JSON results:
@@ -106,6 +202,7 @@ class CsmockAPI:
         """
         self.json_results_path = json_results_path
         self._json_result = None
+        self._scan_metadata = None
 
     @property
     def json_result(self):
@@ -120,8 +217,40 @@ class CsmockAPI:
         """
         return self.json_result['defects']
 
+    def iter_defects(self):
+        """
+        iterate over defects without loading the whole file into memory,
+        scan metadata found on the way are remembered; raise KeyError if the
+        results have no defects, as get_defects() does
+        """
+        if self._json_result is not None:
+            yield from self.get_defects()
+            return
+
+        found = False
+        with open(self.json_results_path) as fp:
+            for key, value in JSONStreamReader(fp).iter_items(streamed=('defects',)):
+                if key == 'scan':
+                    self._scan_metadata = value
+                elif key == 'defects':
+                    found = True
+                    yield from value
+        if not found:
+            raise KeyError('defects')
+
     def get_scan_metadata(self):
-        return self.json_result.get('scan', {})
+        if self._json_result is not None:
+            return self._json_result.get('scan', {})
+
+        if self._scan_metadata is None:
+            self._scan_metadata = {}
+            with open(self.json_results_path) as fp:
+                # defects are skipped one by one if they precede the metadata
+                for key, value in JSONStreamReader(fp).iter_items(streamed=('defects',)):
+                    if key == 'scan':
+                        self._scan_metadata = value
+                        break
+        return self._scan_metadata
 
     def json(self):
         """
@@ -44,6 +44,21 @@ class TaskResultPaths:
     def get_txt_fixed(self):
         return os.path.join(self.task_dir, osh.common.constants.FIXED_TXT_FILE)
 
+    def get_diff_artifacts_status(self):
+        return os.path.join(self.task_dir, osh.common.constants.DIFF_ARTIFACTS_STATUS_FILE)
+
+    def get_diff_artifacts(self):
+        """
+        return list of (input, output) pairs of HTML and TXT renderings of
+        the diff files
+        """
+        return [
+            (self.get_json_added(), self.get_html_added()),
+            (self.get_json_fixed(), self.get_html_fixed()),
+            (self.get_json_added(), self.get_txt_added()),
+            (self.get_json_fixed(), self.get_txt_fixed()),
+        ]
+
     def get_json_defects_in_patches(self):
         g = glob(os.path.join(self.task_dir, '*', osh.common.constants.DEFECTS_IN_PATCHES_FILE))
         if len(g) == 1:
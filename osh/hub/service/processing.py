@@ -5,18 +5,50 @@
 Util functions related to processing data -- results of analysis
 """
 
+import contextlib
+import copy
+import fcntl
 import json
 import logging
 import os
 import shlex
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from django.conf import settings
 from kobo.shortcuts import run
 
 from osh.common.constants import CSDIFF_ARGS
 from osh.hub.service.path import TaskResultPaths
 
+try:
+    import pycsdiff
+except ImportError:
+    pycsdiff = None
+
 logger = logging.getLogger(__name__)
 
+ADDED_TITLE = 'Newly introduced findings'
+FIXED_TITLE = 'Fixed findings'
+
+# states of HTML and TXT renderings of the diff files
+ARTIFACT_PENDING = 'PENDING'
+ARTIFACT_READY = 'READY'
+ARTIFACT_FAILED = 'FAILED'
+
+# rendering which is pending longer than this was most likely interrupted
+# by restart of the hub and may be scheduled again
+ARTIFACT_PENDING_TIMEOUT = 60 * 60
+
+# failed rendering is scheduled again after this many seconds, the delay
+# doubles with every consecutive failure up to ARTIFACT_RETRY_MAX_DELAY
+ARTIFACT_RETRY_DELAY = 10 * 60
+ARTIFACT_RETRY_MAX_DELAY = 24 * 60 * 60
+
+_artifacts_executor = None
+_artifacts_lock = threading.Lock()
+
 
 def _run(command, workdir):
     """ kobo.shortcuts.run wrapper with predefined setup and logging """
@@ -56,6 +88,82 @@ def csdiff_fixed_defects(old, new, result, task_dir):
     return csdiff(new, old, result, task_dir)
 
 
+def _write_json_atomically(data, path):
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w', encoding='utf-8') as fd:
+        json.dump(data, fd, indent=4)
+    os.replace(tmp_path, path)
+
+
+def _strip_paths(scan):
+    """
+    return copy of `scan` with directories removed from paths of all events,
+    so that defects are matched the way `csdiff -z` (ignore path) does
+    """
+    scan = dict(scan)
+    defects = []
+    for defect in scan.get('defects', []):
+        defect = dict(defect)
+        defect['events'] = [dict(event, file_name=event.get('file_name', '').rsplit('/', 1)[-1])
+                            for event in defect.get('events', [])]
+        defects.append(defect)
+    scan['defects'] = defects
+    return scan
+
+
+def _get_defect_key(defect):
+    events = defect.get('events') or [{}]
+    event = events[min(defect.get('key_event_idx', 0), len(events) - 1)]
+    return (defect.get('checker'), event.get('file_name'), event.get('line'),
+            event.get('event'), event.get('message'))
+
+
+def _restore_paths(diff_defects, stripped_defects, defects):
+    """
+    map defects of diff computed from `stripped_defects` back to the original
+    `defects`, so that the diff keeps full paths; the diff lists the defects in
+    the same order as its input
+    """
+    result = []
+    originals = iter(zip(stripped_defects, defects))
+    for diff_defect in diff_defects:
+        key = _get_defect_key(diff_defect)
+        for stripped, original in originals:
+            if _get_defect_key(stripped) == key:
+                result.append(original)
+                break
+        else:
+            raise ValueError("Defect %r not found in the diffed results" % (key,))
+    return result
+
+
+def pycsdiff_diff(old, new, added, fixed):
+    """
+    compute newly introduced and fixed findings in-process using pycsdiff
+    and store them (titled) in `added` and `fixed`; both inputs are read
+    from disk only once.  Paths are ignored when matching defects, as
+    CSDIFF_ARGS do for csdiff.
+    """
+    # encoding="utf-8" is needed to load JSON with utf-8 chars on RHEL-8 when running in POSIX locale
+    with open(old, encoding='utf-8') as fd:
+        old_scan = json.load(fd)
+    with open(new, encoding='utf-8') as fd:
+        new_scan = json.load(fd)
+    old_stripped = _strip_paths(old_scan)
+    new_stripped = _strip_paths(new_scan)
+    old_json = json.dumps(old_stripped)
+    new_json = json.dumps(new_stripped)
+
+    for base_json, target_json, target, target_stripped, result, title in (
+            (old_json, new_json, new_scan, new_stripped, added, ADDED_TITLE),
+            (new_json, old_json, old_scan, old_stripped, fixed, FIXED_TITLE)):
+        diff = json.loads(pycsdiff.diff_scans(base_json, target_json))
+        diff['defects'] = _restore_paths(diff.get('defects', []), target_stripped['defects'],
+                                         target.get('defects', []))
+        diff.setdefault('scan', {})['title'] = title
+        _write_json_atomically(diff, result)
+
+
 def cshtml(input_file, output_file, workdir):
     """ generate HTML report """
     cmd = 'csgrep --prune-events 1 --mode json %s | cshtml - > %s' % \
@@ -76,38 +184,44 @@ class TaskDiffer:
         self.paths = TaskResultPaths(task)
         self.base_paths = TaskResultPaths(base_task)
 
+    def diff_json(self):
+        """
+        create added.js and fixed.js, in-process if possible
+        """
+        base_results = self.base_paths.get_json_results()
+        results = self.paths.get_json_results()
+        added = self.paths.get_json_added()
+        fixed = self.paths.get_json_fixed()
+
+        if pycsdiff is not None:
+            try:
+                pycsdiff_diff(base_results, results, added, fixed)
+                return True
+            except (OSError, RuntimeError, ValueError) as ex:
+                logger.warning("In-process diff of %s failed, running csdiff instead: %s",
+                               self.task, ex)
+                for path in (added, fixed):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+        if not csdiff_new_defects(base_results, results, added, self.paths.task_dir):
+            return False
+        if not csdiff_fixed_defects(base_results, results, fixed, self.paths.task_dir):
+            return False
+
+        add_title_to_json(added, ADDED_TITLE)
+        add_title_to_json(fixed, FIXED_TITLE)
+        return True
+
     def generate_diff_files(self):
         """
         create diffs, html reports and .err files
         """
-        succ = csdiff_new_defects(
-            self.base_paths.get_json_results(),
-            self.paths.get_json_results(),
-            self.paths.get_json_added(),
-            self.paths.task_dir
-        )
-        if succ:
-            f_succ = csdiff_new_defects(
-                self.paths.get_json_results(),
-                self.base_paths.get_json_results(),
-                self.paths.get_json_fixed(),
-                self.paths.task_dir
-            )
-
-            if f_succ:
-                # these are basicly optional, don't fail if one of them
-                # was not successfull
-                add_title_to_json(self.paths.get_json_added(), 'Newly introduced findings')
-                add_title_to_json(self.paths.get_json_fixed(), 'Fixed findings')
-
-                cshtml(self.paths.get_json_added(), self.paths.get_html_added(), self.paths.task_dir)
-                cshtml(self.paths.get_json_fixed(), self.paths.get_html_fixed(), self.paths.task_dir)
-                csgrep_err(self.paths.get_json_added(), self.paths.get_txt_added(), self.paths.task_dir)
-                csgrep_err(self.paths.get_json_fixed(), self.paths.get_txt_fixed(), self.paths.task_dir)
-            else:
-                return False
-        else:
+        if not self.diff_json():
             return False
+
+        # these are basicly optional and are rendered in background
+        schedule_diff_artifacts(self.task)
         return True
 
     def diff_results(self):
@@ -133,6 +247,125 @@ def add_title_to_json(path, title):
         json.dump(loaded_json, fd, indent=4)
 
 
+def _get_artifacts_executor():
+    global _artifacts_executor
+    with _artifacts_lock:
+        if _artifacts_executor is None:
+            _artifacts_executor = ThreadPoolExecutor(
+                max_workers=settings.DIFF_ARTIFACTS_WORKERS,
+                thread_name_prefix='diff-artifacts')
+        return _artifacts_executor
+
+
+def get_diff_artifacts_status(paths):
+    """
+    return dict of states of HTML and TXT renderings of the diff files:
+    {
+        'added.html': {'state': 'READY', 'updated': 1700000000.0, 'failures': 0},
+    }
+    """
+    try:
+        with open(paths.get_diff_artifacts_status()) as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return {}
+
+
+@contextlib.contextmanager
+def _lock_diff_artifacts_status(paths):
+    """
+    lock status of diff artifacts of the task against other threads and hub
+    processes and yield it for modification, changes are written on exit
+    """
+    status_file = paths.get_diff_artifacts_status()
+    with open(status_file + '.lock', 'a') as lock_fd:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        status = get_diff_artifacts_status(paths)
+        original = copy.deepcopy(status)
+        yield status
+        if status != original:
+            _write_json_atomically(status, status_file)
+
+
+def _set_diff_artifacts_state(status, name, state):
+    failures = status.get(name, {}).get('failures', 0)
+    if state == ARTIFACT_FAILED:
+        failures += 1
+    elif state == ARTIFACT_READY:
+        failures = 0
+    status[name] = {'state': state, 'updated': time.time(), 'failures': failures}
+
+
+def _is_scheduled(entry, now):
+    """ the artifact is being rendered or its rendering failed recently """
+    state = entry.get('state')
+    age = now - entry.get('updated', 0)
+    if state == ARTIFACT_PENDING:
+        return age < ARTIFACT_PENDING_TIMEOUT
+    if state == ARTIFACT_FAILED:
+        delay = ARTIFACT_RETRY_DELAY * 2 ** max(entry.get('failures', 1) - 1, 0)
+        return age < min(delay, ARTIFACT_RETRY_MAX_DELAY)
+    return False
+
+
+def _render_diff_artifact(paths, input_file, output_file):
+    """ render one artifact, the output appears only once it is complete """
+    name = os.path.basename(output_file)
+    render = cshtml if output_file.endswith('.html') else csgrep_err
+    tmp_file = '%s.%d.tmp' % (output_file, os.getpid())
+    start = time.monotonic()
+    try:
+        succ = render(input_file, tmp_file, paths.task_dir)
+        if succ:
+            os.replace(tmp_file, output_file)
+    except Exception:  # noqa: B902
+        logger.exception("Rendering of %s failed", output_file)
+        succ = False
+
+    if not succ and os.path.exists(tmp_file):
+        os.remove(tmp_file)
+
+    logger.info("Rendering of %s for %s took %.2fs", name, paths.task, time.monotonic() - start)
+    with _lock_diff_artifacts_status(paths) as status:
+        _set_diff_artifacts_state(status, name, ARTIFACT_READY if succ else ARTIFACT_FAILED)
+
+
+def schedule_diff_artifacts(task):
+    """
+    render HTML and TXT versions of the diff files in background, artifacts
+    which already exist or are being rendered by any hub process are skipped,
+    failed ones are retried after ARTIFACT_RETRY_DELAY; return list of names
+    of artifacts which are not ready yet
+    """
+    paths = TaskResultPaths(task)
+    artifacts = [(input_file, output_file) for input_file, output_file in paths.get_diff_artifacts()
+                 if not os.path.exists(output_file) and os.path.exists(input_file)]
+    if not artifacts:
+        return []
+
+    pending = []
+    scheduled = []
+    with _lock_diff_artifacts_status(paths) as status:
+        now = time.time()
+        for input_file, output_file in artifacts:
+            name = os.path.basename(output_file)
+            entry = status.get(name, {})
+            if _is_scheduled(entry, now):
+                if entry['state'] == ARTIFACT_PENDING:
+                    pending.append(name)
+                continue
+
+            pending.append(name)
+            scheduled.append((input_file, output_file))
+            _set_diff_artifacts_state(status, name, ARTIFACT_PENDING)
+
+    executor = _get_artifacts_executor()
+    for input_file, output_file in scheduled:
+        executor.submit(_render_diff_artifact, paths, input_file, output_file)
+
+    return pending
+
+
 def task_has_results(task):
     trp = TaskResultPaths(task)
     try:
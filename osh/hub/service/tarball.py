@@ -0,0 +1,94 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Extraction of results tarballs
+"""
+
+import fnmatch
+import logging
+import os
+import tarfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# tarfile.data_filter() is available since Python 3.12 (and in backports)
+if hasattr(tarfile, 'data_filter'):
+    UnsafeMemberError = tarfile.FilterError
+
+    def _extract_member(tar, member, output_dir):
+        tar.extract(member, output_dir, filter='data')
+else:
+    class UnsafeMemberError(ValueError):
+        pass
+
+    def _is_unsafe_path(path):
+        return os.path.isabs(path) or '..' in path.split('/')
+
+    def _extract_member(tar, member, output_dir):
+        if _is_unsafe_path(member.name):
+            raise UnsafeMemberError('%s points outside of %s' % (member.name, output_dir))
+        if (member.issym() or member.islnk()) and _is_unsafe_path(member.linkname):
+            raise UnsafeMemberError('%s links outside of %s' % (member.name, output_dir))
+        if not (member.isreg() or member.isdir() or member.issym() or member.islnk()):
+            raise UnsafeMemberError('%s is a special file' % member.name)
+        tar.extract(member, output_dir, set_attrs=False)
+
+
+def path_matches(name, patterns):
+    """
+    Return True if member `name` matches any of `patterns` in the way
+    `tar --wildcards --wildcards-match-slash --exclude=PATTERN` does: '*'
+    matches '/' as well and the pattern may match any sequence of path
+    components, so contents of a matching directory match too.
+    """
+    if not patterns:
+        return False
+
+    parts = [part for part in name.split('/') if part and part != '.']
+    for start in range(len(parts)):
+        for end in range(start + 1, len(parts) + 1):
+            candidate = '/'.join(parts[start:end])
+            if any(fnmatch.fnmatchcase(candidate, pattern) for pattern in patterns):
+                return True
+    return False
+
+
+def extract_tarball(tarball, output_dir, exclude_patterns=None, include_patterns=None):
+    """
+    Extract `tarball` (compressed by xz, lzma, gzip or bzip2) to `output_dir`
+    in a single streaming pass.
+
+    Members matching `exclude_patterns` are skipped.  If `include_patterns`
+    are specified, only files matching them are extracted.  Return tuple
+    (number of extracted files, number of extracted bytes).
+    """
+    start = time.monotonic()
+    files = size = skipped = 0
+
+    with tarfile.open(tarball, mode='r|*') as tar:
+        for member in tar:
+            if path_matches(member.name, exclude_patterns):
+                skipped += 1
+                continue
+
+            if include_patterns is not None and \
+                    (member.isdir() or not path_matches(member.name, include_patterns)):
+                skipped += 1
+                continue
+
+            try:
+                _extract_member(tar, member, output_dir)
+            except (UnsafeMemberError, tarfile.StreamError) as ex:
+                logger.warning("Skipping member %s of %s: %s", member.name, tarball, ex)
+                skipped += 1
+                continue
+
+            if not member.isdir():
+                files += 1
+                size += member.size
+
+    logger.info("Extracted %d files (%d bytes, %d members skipped) from %s in %.2fs",
+                files, size, skipped, tarball, time.monotonic() - start)
+    return files, size
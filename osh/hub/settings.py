@@ -199,6 +199,46 @@ NOTIFICATION_EMAIL_FOOTER = ""
 # If this setting is enabled, a worker is only used to perform a single task.
 ENABLE_SINGLE_USE_WORKERS = False
 
+# Maximum number of HTML and TXT reports of diffed tasks rendered concurrently
+# by a single hub process
+DIFF_ARTIFACTS_WORKERS = 2
+
+# Compute the expensive per-package statistics incrementally, i.e. only for
+# packages changed since the last run of osh-stats
+ENABLE_INCREMENTAL_STATS = True
+
+# Number of statistics computed concurrently by osh-stats, each worker uses its
+# own database connection
+STATS_WORKERS = 4
+
+# Time budget of a single statistic in seconds (None for unlimited).  It covers
+# all queries of the statistic, the last one is canceled by statement timeout
+# on PostgreSQL.  Statistics exceeding it are not stored.
+STATS_TIME_BUDGET = None
+
+# Number of koji builds, tasks and tags cached by each hub process and time in
+# seconds after which they are fetched from koji again
+KOJI_CACHE_SIZE = 1024
+KOJI_CACHE_TIMEOUT = 300
+
+# Maximum number of mock configs generated concurrently for a single build and
+# time in seconds for which configs generated for the latest repo of a build tag
+# are cached
+MOCK_CONFIG_WORKERS = 4
+MOCK_CONFIG_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Time in seconds after which release mappings and tags are loaded again by
+# hub processes other than the one which changed them
+RELEASE_MAPPING_CACHE_TIMEOUT = 60
+
+# Maximum number of UMB messages queued in memory of a hub process (more of
+# them are sent from the outbox later), maximum number of messages sent before
+# waiting for their acknowledgement and time in seconds after which messages
+# not acknowledged by the broker are sent again from the outbox
+UMB_QUEUE_SIZE = 1000
+UMB_BATCH_SIZE = 100
+UMB_RETRY_DELAY = 60
+
 # Disable sending messages to Fedora rabbitmq
 # Enabling this option requires `fedora-messaging` package
 ENABLE_FEDORA_MESSAGING = False
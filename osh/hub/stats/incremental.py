@@ -0,0 +1,134 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Incremental computation of statistics marked by @per_binding_stat
+
+Value of such statistic in a release is a sum of contributions of all
+packages scanned in the release.  Contributions are stored in StatContribution
+and only packages with scans, results or waivers changed since the last run
+(as recorded by the STATS_WATERMARK app setting) are computed again.
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from kobo.client.constants import FINISHED_STATES
+
+from osh.hub.scan.models import (SCAN_STATES_IN_PROGRESS, AppSettings, Scan,
+                                 ScanBinding, SystemRelease)
+from osh.hub.stats.models import StatContribution, StatType
+from osh.hub.waiving.models import WaivingLog
+
+logger = logging.getLogger(__name__)
+
+EMPTY_WATERMARK = {'scan': 0, 'waiving_log': 0, 'pending': []}
+
+
+def get_incremental_stats(mapping):
+    """ Filter stat functions from get_mapping() that are computed incrementally """
+    return {key: func for key, func in mapping if hasattr(func, 'diff_function')}
+
+
+def _is_pending(scan_state, task_state):
+    """ scan may still change its result or its first scan binding """
+    if task_state is None:
+        return scan_state in SCAN_STATES_IN_PROGRESS
+    return task_state not in FINISHED_STATES
+
+
+def get_dirty_packages(watermark, last_scan, last_log):
+    """
+    Return set of (release_id, package_id) changed since `watermark` up to
+    scan `last_scan` and waiving log `last_log`, and list of scans which are
+    not finished yet and need to be checked again next time.
+    """
+    dirty = set()
+    pending = []
+
+    scans = Scan.objects.filter(tag__isnull=False, id__lte=last_scan).filter(
+        Q(id__gt=watermark['scan']) | Q(id__in=watermark['pending']))
+    rows = scans.values_list('id', 'tag__release', 'package', 'state', 'scanbinding__task__state')
+    for scan_id, release_id, package_id, scan_state, task_state in rows:
+        dirty.add((release_id, package_id))
+        if _is_pending(scan_state, task_state):
+            pending.append(scan_id)
+
+    logs = WaivingLog.objects.filter(id__gt=watermark['waiving_log'], id__lte=last_log)
+    scan_prefix = 'waiver__result_group__result__scanbinding__scan__'
+    dirty.update(logs.filter(**{scan_prefix + 'tag__isnull': False})
+                 .values_list(scan_prefix + 'tag__release', scan_prefix + 'package')
+                 .distinct())
+
+    return dirty, pending
+
+
+def compute_contribution(func, release_id, package_id):
+    """ sum diff_function of func over bindings of package in release """
+    bindings = ScanBinding.objects.by_release(release_id).by_package(package_id).enabled()
+    if func.binding_scope is not None:
+        bindings = getattr(bindings, func.binding_scope)()
+    return sum(func.diff_function(sb) for sb in bindings)
+
+
+def store_contribution(stat_type_id, release_id, package_id, value):
+    contributions = StatContribution.objects.filter(stat=stat_type_id, release=release_id,
+                                                    package=package_id)
+    if not value:
+        contributions.delete()
+    elif not contributions.update(value=value):
+        StatContribution.objects.create(stat_id=stat_type_id, release_id=release_id,
+                                        package_id=package_id, value=value)
+
+
+def update_contributions(stats, full=False):
+    """
+    Recompute contributions of packages changed since the last run for
+    statistics `stats` ({key: stat function}); all of them if `full` is set.
+    Return number of processed (release, package) pairs.
+    """
+    watermark = AppSettings.settings_get_stats_watermark()
+    if full or watermark is None:
+        watermark = EMPTY_WATERMARK
+
+    # take the limits first so that objects created meanwhile are processed next time
+    last_scan = Scan.objects.aggregate(last=Max('id'))['last'] or 0
+    last_log = WaivingLog.objects.aggregate(last=Max('id'))['last'] or 0
+
+    dirty, pending = get_dirty_packages(watermark, last_scan, last_log)
+    # stats between releases of a release depend on scans in its child release
+    parents = dict(SystemRelease.objects.filter(parent__isnull=False)
+                   .values_list('id', 'parent'))
+    dirty_parents = {(parents[release_id], package_id) for release_id, package_id in dirty
+                     if release_id in parents}
+
+    stat_types = dict(StatType.objects.filter(key__in=stats).values_list('key', 'id'))
+
+    with transaction.atomic():
+        if watermark is EMPTY_WATERMARK:
+            StatContribution.objects.filter(stat__in=stat_types.values()).delete()
+
+        for key, func in stats.items():
+            pairs = dirty | dirty_parents if func.between_releases else dirty
+            for release_id, package_id in pairs:
+                value = compute_contribution(func, release_id, package_id)
+                store_contribution(stat_types[key], release_id, package_id, value)
+
+        AppSettings.settings_set_stats_watermark({
+            'scan': last_scan,
+            'waiving_log': last_log,
+            'pending': pending,
+        })
+
+    logger.info('Recomputed statistics of %d packages in releases (%d pending scans).',
+                len(dirty | dirty_parents), len(pending))
+    return len(dirty | dirty_parents)
+
+
+def get_stat_values(key, func):
+    """ Return value of incremental stat in the same format as func() """
+    releases = SystemRelease.objects.filter(active=True, **func.release_filter)
+    sums = dict(StatContribution.objects.filter(stat__key=key, release__in=releases)
+                .values_list('release').annotate(Sum('value')))
+    return {r: sums.get(r.id, 0) for r in releases}
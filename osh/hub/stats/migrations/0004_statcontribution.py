@@ -0,0 +1,28 @@
+# Generated by Django 3.2.20 on 2026-10-18 23:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scan', '0019_alter_analyzer_options'),
+        ('stats', '0003_alter_statresults_value'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatContribution',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+                ('package', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scan.package')),
+                ('release', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scan.systemrelease')),
+                ('stat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='stats.stattype')),
+            ],
+            options={
+                'unique_together': {('stat', 'release', 'package')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.20 on 2026-10-19 00:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0004_statcontribution'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stattype',
+            name='duration',
+            field=models.FloatField(blank=True, help_text='Wall time of the last computation in seconds.', null=True),
+        ),
+        migrations.AddField(
+            model_name='stattype',
+            name='queries',
+            field=models.IntegerField(blank=True, help_text='Number of SQL queries of the last computation.', null=True),
+        ),
+    ]
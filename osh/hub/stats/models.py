@@ -4,7 +4,7 @@
 from django.db import models
 from django.urls import reverse
 
-from osh.hub.scan.models import SystemRelease
+from osh.hub.scan.models import Package, SystemRelease
 
 
 class StatType(models.Model):
@@ -15,22 +15,14 @@ class StatType(models.Model):
     group = models.CharField("Description", max_length=16)
     order = models.IntegerField()
     is_release_specific = models.BooleanField()
+    duration = models.FloatField(blank=True, null=True,
+                                 help_text="Wall time of the last computation in seconds.")
+    queries = models.IntegerField(blank=True, null=True,
+                                  help_text="Number of SQL queries of the last computation.")
 
     def __str__(self):
         return f"{self.key} ({self.comment})"
 
-    def display_value(self, release=None):
-        results = StatResults.objects.filter(stat=self)
-
-        if self.is_release_specific:
-            if release is None:
-                raise ValueError("Release specific statistic requested without a release!")
-            results = results.filter(release=release)
-
-        if not results:
-            return 0
-        return results.latest().value
-
     def detail_url(self, release=None):
         if self.is_release_specific:
             return reverse('stats/release/detail', args=[release.id, self.id])
@@ -49,3 +41,20 @@ class StatResults(models.Model):
 
     def __str__(self):
         return f"{self.stat.key} = {self.value}"
+
+
+class StatContribution(models.Model):
+    """
+    Contribution of scans of a package in a release to the value of an
+    incrementally computed statistic.
+    """
+    stat = models.ForeignKey(StatType, on_delete=models.CASCADE)
+    release = models.ForeignKey(SystemRelease, on_delete=models.CASCADE)
+    package = models.ForeignKey(Package, on_delete=models.CASCADE)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('stat', 'release', 'package')
+
+    def __str__(self):
+        return f"{self.stat.key} {self.release} {self.package} = {self.value}"
@@ -1,17 +1,34 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
-import datetime
 import inspect
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from django.db.models import ObjectDoesNotExist
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Avg, Max, ObjectDoesNotExist
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
 
 from osh.hub.stats import stattypes
+from osh.hub.stats.incremental import (get_incremental_stats, get_stat_values,
+                                       update_contributions)
 from osh.hub.stats.models import StatResults, StatType
 
 logger = logging.getLogger(__name__)
 
+TIME_SERIES_BUCKETS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+TIME_SERIES_AGGREGATES = ('last', 'max', 'avg')
+
+# cached views of results are invalidated by version, this only limits memory use
+STATS_CACHE_TIMEOUT = 24 * 60 * 60
+
 
 def _get_stat_results(stat_type, release):
     filter_args = {'stat': stat_type}
@@ -20,12 +37,6 @@ def _get_stat_results(stat_type, release):
     return StatResults.objects.filter(**filter_args)
 
 
-def get_last_stat_result(stat_type, release=None):
-    results = _get_stat_results(stat_type, release)
-    if results:
-        return results.latest()
-
-
 def get_mapping():
     """
     Return mapping between key and the corresponding statistical function.
@@ -58,50 +69,210 @@ def create_stat_type(key, func):
     st.save()
 
 
-def create_stat_result(key, value, release=None):
+class StatResultsWriter:
     """
-    Helper function that stores statistical result. If the result is same as
-     in previous run, do not store it
+    Store statistical results of one run at once.  Results which are same as
+    in the previous run are not stored.
     """
-    stat_type = StatType.objects.get(key=key)
-    last_stat = get_last_stat_result(stat_type, release)
+    def __init__(self):
+        self.stat_types = dict(StatType.objects.values_list('key', 'id'))
+        # latest value of every (stat, release)
+        latest = StatResults.objects.order_by().values('stat', 'release').annotate(last=Max('id'))
+        self.last_values = {
+            (stat_id, release_id): value for stat_id, release_id, value in
+            StatResults.objects.filter(id__in=latest.values('last'))
+            .values_list('stat', 'release', 'value')
+        }
+        self.results = []
+
+    def add(self, key, value, release=None):
+        stat_id = self.stat_types[key]
+        release_id = release.id if release is not None else None
+
+        if not value:
+            value = 0
+
+        if self.last_values.get((stat_id, release_id)) != value:
+            self.last_values[(stat_id, release_id)] = value
+            self.results.append(StatResults(stat_id=stat_id, value=value, release=release))
+
+    def add_stat_data(self, key, stat_data):
+        if not isinstance(stat_data, dict):
+            self.add(key, stat_data)
+            return
+
+        for s in stat_data:
+            self.add(key, stat_data[s], s)
 
-    if not value:
-        value = 0
+    def write(self):
+        StatResults.objects.bulk_create(self.results)
+        logger.info('Stored %d changed statistical results.', len(self.results))
+        self.results = []
 
-    if not last_stat or last_stat.value != value:
-        s = StatResults()
-        s.stat = stat_type
-        s.value = value
-        if release is not None:
-            s.release = release
-        s.save()
+
+class StatTimeBudgetExceeded(Exception):
+    """ computation of a statistic exceeded STATS_TIME_BUDGET """
+
+
+def compute_stat(key, func, incremental=False):
+    """
+    Compute value of a statistic within the time budget, return tuple
+    (value, wall time in seconds, number of SQL queries).  Computation which
+    exceeds the budget is aborted before its next query; on PostgreSQL the
+    running query is canceled as soon as the budget is exhausted.
+    """
+    budget = settings.STATS_TIME_BUDGET
+    queries = 0
+    start = time.monotonic()
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal queries
+        if budget:
+            remaining = budget - (time.monotonic() - start)
+            if remaining <= 0:
+                raise StatTimeBudgetExceeded('%s exceeded the time budget of %ss' % (key, budget))
+            if connection.vendor == 'postgresql':
+                # limit the statement to the rest of the budget of the whole stat
+                execute('SET LOCAL statement_timeout = %d' % max(1, int(remaining * 1000)),
+                        None, False, context)
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with transaction.atomic():
+        with connection.execute_wrapper(count_queries):
+            stat_data = get_stat_values(key, func) if incremental else func()
+    return stat_data, time.monotonic() - start, queries
+
+
+def _compute_stat_in_worker(key, func, incremental):
+    """ compute_stat() in a pool thread which must not keep its connection open """
+    try:
+        return compute_stat(key, func, incremental)
+    finally:
+        connection.close()
 
 
-def update():
+def update(full=False):
     """
-    Refresh statistics data.
+    Refresh statistics data; stats marked by @per_binding_stat are computed
+    incrementally unless `full` recomputation is requested.  Other stats are
+    computed concurrently by STATS_WORKERS threads.
     """
     logger.info('Updating statistics.')
-    for key, func in get_mapping():
+    mapping = list(get_mapping())
+    for key, func in mapping:
         create_stat_type(key, func)
 
-        logger.info('Updating %s.', key)
-        stat_data = func()
+    incremental_stats = {}
+    if settings.ENABLE_INCREMENTAL_STATS:
+        incremental_stats = get_incremental_stats(mapping)
+        update_contributions(incremental_stats, full)
 
-        if not isinstance(stat_data, dict):
-            create_stat_result(key, stat_data)
-            continue
+    stat_types = {st.key: st for st in StatType.objects.all()}
+    writer = StatResultsWriter()
 
-        for s in stat_data:
-            create_stat_result(key, stat_data[s], s)
+    if settings.STATS_WORKERS > 1:
+        executor = ThreadPoolExecutor(max_workers=settings.STATS_WORKERS,
+                                      thread_name_prefix='stats')
+        futures = [executor.submit(_compute_stat_in_worker, key, func, key in incremental_stats)
+                   for key, func in mapping]
+    else:
+        executor = None
+
+    failed = 0
+    try:
+        for i, (key, func) in enumerate(mapping):
+            logger.info('Updating %s.', key)
+            try:
+                if executor is not None:
+                    stat_data, duration, queries = futures[i].result()
+                else:
+                    stat_data, duration, queries = compute_stat(key, func, key in incremental_stats)
+            except (DatabaseError, StatTimeBudgetExceeded):
+                # most likely canceled because of exceeding the time budget
+                logger.exception('Computation of %s failed.', key)
+                failed += 1
+                continue
+
+            logger.info('%s computed in %.2fs using %d queries.', key, duration, queries)
+            if settings.STATS_TIME_BUDGET and duration > settings.STATS_TIME_BUDGET:
+                logger.warning('%s exceeded the time budget of %ss.', key, settings.STATS_TIME_BUDGET)
+
+            stat_types[key].duration = duration
+            stat_types[key].queries = queries
+            writer.add_stat_data(key, stat_data)
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
-    logger.info('Statistics successfully updated.')
+    StatType.objects.bulk_update(stat_types.values(), ['duration', 'queries'])
+    writer.write()
+
+    if failed:
+        logger.error('%d statistics were not updated.', failed)
+    else:
+        logger.info('Statistics successfully updated.')
+
+
+def get_results_version():
+    """
+    Return version of statistical results which changes whenever update()
+    stores new results; it is used to invalidate cached views of the results.
+    """
+    return StatResults.objects.aggregate(last=Max('id'))['last'] or 0
 
 
-def display_values(stat_type, release=None):
-    results = _get_stat_results(stat_type, release)
-    if not results:
-        return {datetime.datetime.now(): 0}
+def get_latest_values(release=None):
+    """
+    Return latest values of all statistics of release (or of global
+    statistics) in a single query: {stat_type_id: value}
+    """
+    results = StatResults.objects.filter(release=release).order_by()
+    latest = results.values('stat').annotate(last=Max('id'))
+    return dict(results.filter(id__in=latest.values('last')).values_list('stat', 'value'))
+
+
+def _compute_time_series(stat_type, release, bucket, aggregate, since, until):
+    results = _get_stat_results(stat_type, release).order_by()
+    if since is not None:
+        results = results.filter(date__date__gte=since)
+    if until is not None:
+        results = results.filter(date__date__lte=until)
+
+    trunc = TIME_SERIES_BUCKETS[bucket]('date')
+    if aggregate == 'last':
+        last_ids = results.annotate(bucket=trunc).values('bucket').annotate(last=Max('id'))
+        rows = results.filter(id__in=last_ids.values('last')).annotate(bucket=trunc) \
+            .values_list('bucket', 'value')
+    else:
+        function = Max if aggregate == 'max' else Avg
+        rows = results.annotate(bucket=trunc).values('bucket') \
+            .annotate(value=function('value')).values_list('bucket', 'value')
+
+    rows = sorted(rows)
+    return {
+        't': [b for b, _ in rows],
+        'v': [round(v, 2) if isinstance(v, float) else v for _, v in rows],
+    }
+
+
+def get_time_series(stat_type, release=None, bucket='day', aggregate='last',
+                    since=None, until=None):
+    """
+    Return values of a statistic in the [since, until] range of dates bucketed
+    by `bucket` (day, week or month) using `aggregate` (last, max or avg) as
+    parallel lists of times and values: {'t': [datetime, ...], 'v': [value, ...]}
+    """
+    if bucket not in TIME_SERIES_BUCKETS:
+        raise ValueError(f"Unknown bucket '{bucket}'")
+    if aggregate not in TIME_SERIES_AGGREGATES:
+        raise ValueError(f"Unknown aggregate '{aggregate}'")
 
-    return {res.date: res.value for res in results.order_by('-date')}
+    release_id = release.id if release is not None else None
+    key = f'stats:series:{stat_type.id}:{release_id}:{bucket}:{aggregate}:{since}:{until}'
+    version = get_results_version()
+    series = cache.get(key, version=version)
+    if series is None:
+        series = _compute_time_series(stat_type, release, bucket, aggregate, since, until)
+        cache.set(key, series, STATS_CACHE_TIMEOUT, version=version)
+    return series
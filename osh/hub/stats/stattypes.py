@@ -13,7 +13,7 @@
 
 import datetime
 
-from django.db.models import Sum
+from django.db.models import Count, Sum
 from kobo.hub.models import Task
 
 from osh.hub.scan.models import Scan, ScanBinding, SystemRelease
@@ -21,9 +21,35 @@ from osh.hub.scan.service import (diff_fixed_defects_between_releases,
                                   diff_fixed_defects_in_package,
                                   diff_new_defects_between_releases,
                                   diff_new_defects_in_package)
-from osh.hub.stats.utils import stat_function
+from osh.hub.stats.utils import per_binding_stat, stat_function
 from osh.hub.waiving.models import Defect, Result, ResultGroup, Waiver
 
+# lookups of release of objects counted in statistics
+RELEASE_LOOKUPS = {
+    Scan: 'tag__release',
+    ScanBinding: 'scan__tag__release',
+    Defect: 'result_group__result__scanbinding__scan__tag__release',
+    ResultGroup: 'result__scanbinding__scan__tag__release',
+    Waiver: 'result_group__result__scanbinding__scan__tag__release',
+}
+
+
+def _aggregate_by_release(queryset, aggregate):
+    """
+    Compute aggregate of queryset for all active releases at once in a single
+    GROUP BY query, return dict {release: value}
+    """
+    releases = list(SystemRelease.objects.filter(active=True))
+    lookup = RELEASE_LOOKUPS[queryset.model]
+    values = dict(queryset.filter(**{lookup + '__in': releases})
+                  .order_by().values_list(lookup).annotate(value=aggregate))
+    return {r: values.get(r.id) or 0 for r in releases}
+
+
+def _count_by_release(queryset):
+    return _aggregate_by_release(queryset, Count('id'))
+
+
 #######
 # SCANS
 #######
@@ -38,9 +64,7 @@ def get_total_scans():
 @stat_function(1, "SCANS", "Scans count",
                "Number of submitted scans by release.")
 def get_scans_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Scan.objects.enabled().target().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Scan.objects.enabled().target())
 
 
 @stat_function(2, "SCANS", "Rebase scans count",
@@ -52,8 +76,7 @@ def get_rebases_count():
 @stat_function(2, "SCANS", "Rebase scans count",
                "Number of all submitted scans of rebases by release.")
 def get_rebases_count_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Scan.objects.rebases().by_release(r).count() for r in releases}
+    return _count_by_release(Scan.objects.rebases())
 
 
 @stat_function(3, "SCANS", "New package scans count",
@@ -65,8 +88,7 @@ def get_newpkg_count():
 @stat_function(3, "SCANS", "New package scans count",
                "Number of scans of new packages by release.")
 def get_newpkg_count_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Scan.objects.newpkgs().by_release(r).count() for r in releases}
+    return _count_by_release(Scan.objects.newpkgs())
 
 
 @stat_function(4, "SCANS", "Update scans count",
@@ -78,8 +100,7 @@ def get_updates_count():
 @stat_function(4, "SCANS", "Update scans count",
                "Number of scans of updates by release.")
 def get_updates_count_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Scan.objects.updates().by_release(r).count() for r in releases}
+    return _count_by_release(Scan.objects.updates())
 
 #####
 # LOC
@@ -98,10 +119,7 @@ def get_total_lines():
 @stat_function(1, "LOC", "Lines of code scanned",
                "Number of LoC scanned by RHEL release.")
 def get_lines_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: ScanBinding.objects.enabled().by_release(r)
-            .aggregate(sum=Sum('result__lines'))['sum'] or 0
-            for r in releases}
+    return _aggregate_by_release(ScanBinding.objects.enabled(), Sum('result__lines'))
 
 #########
 # DEFECTS
@@ -117,9 +135,7 @@ def get_total_fixed_defects():
 @stat_function(1, "DEFECTS", "Fixed defects",
                "Number of fixed defects found by release.")
 def get_fixed_defects_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Defect.objects.enabled().by_release(r).fixed().count()
-            for r in releases}
+    return _count_by_release(Defect.objects.enabled().fixed())
 
 
 @stat_function(2, "DEFECTS", "Fixed defects in rebases",
@@ -131,9 +147,7 @@ def get_total_fixed_defects_in_rebases():
 @stat_function(2, "DEFECTS", "Fixed defects in rebases",
                "Number of fixed defects found in rebases by release.")
 def get_fixed_defects_in_rebases_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Defect.objects.enabled().rebases().by_release(r).fixed().count()
-            for r in releases}
+    return _count_by_release(Defect.objects.enabled().rebases().fixed())
 
 
 @stat_function(3, "DEFECTS", "Fixed defects in updates",
@@ -145,9 +159,7 @@ def get_total_fixed_defects_in_updates():
 @stat_function(3, "DEFECTS", "Fixed defects in updates",
                "Number of fixed defects found in updates by release.")
 def get_fixed_defects_in_updates_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Defect.objects.enabled().updates().by_release(r).fixed().count()
-            for r in releases}
+    return _count_by_release(Defect.objects.enabled().updates().fixed())
 
 
 @stat_function(4, "DEFECTS", "New defects",
@@ -159,9 +171,7 @@ def get_total_new_defects():
 @stat_function(4, "DEFECTS", "New defects",
                "Number of newly introduced defects by release.")
 def get_new_defects_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Defect.objects.enabled().by_release(r).new().count()
-            for r in releases}
+    return _count_by_release(Defect.objects.enabled().new())
 
 
 @stat_function(5, "DEFECTS", "New defects in rebases",
@@ -173,9 +183,7 @@ def get_total_new_defects_in_rebases():
 @stat_function(5, "DEFECTS", "New defects in rebases",
                "Number of newly introduced defects in rebases by release.")
 def get_new_defects_in_rebases_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Defect.objects.enabled().rebases().by_release(r).new().count()
-            for r in releases}
+    return _count_by_release(Defect.objects.enabled().rebases().new())
 
 
 @stat_function(6, "DEFECTS", "New defects in updates",
@@ -187,11 +195,10 @@ def get_total_new_defects_in_updates():
 @stat_function(6, "DEFECTS", "New defects in updates",
                "Number of newly introduced defects in updates by release.")
 def get_new_defects_in_updates_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Defect.objects.enabled().updates().by_release(r).new().count()
-            for r in releases}
+    return _count_by_release(Defect.objects.enabled().updates().new())
 
 
+@per_binding_stat(diff_new_defects_in_package, 'rebases')
 @stat_function(8, "DEFECTS", "Eliminated newly introduced defects in rebases",
                "Number of newly introduced defects in rebases that were fixed between first scan and final one.")
 def get_eliminated_in_rebases_in_release():
@@ -201,6 +208,7 @@ def get_eliminated_in_rebases_in_release():
             for r in releases}
 
 
+@per_binding_stat(diff_new_defects_in_package, 'newpkgs')
 @stat_function(9, "DEFECTS", "Eliminated newly introduced defects in new packages",
                "Number of newly introduced defects in new packages that were fixed between first scan and final one.")
 def get_eliminated_in_newpkgs_in_release():
@@ -210,6 +218,7 @@ def get_eliminated_in_newpkgs_in_release():
             for r in releases}
 
 
+@per_binding_stat(diff_new_defects_in_package, 'updates')
 @stat_function(10, "DEFECTS", "Eliminated newly introduced defects in updates",
                "Number of newly introduced defects in updates that were fixed between first scan and final one.")
 def get_eliminated_in_updates_in_release():
@@ -219,6 +228,7 @@ def get_eliminated_in_updates_in_release():
             for r in releases}
 
 
+@per_binding_stat(diff_fixed_defects_in_package)
 @stat_function(11, "DEFECTS", "Fixed defects in one release",
                "Number of defects that were fixed between first scan and final one.")
 def get_fixed_defects_in_release():
@@ -228,6 +238,8 @@ def get_fixed_defects_in_release():
             for r in releases}
 
 
+@per_binding_stat(diff_fixed_defects_between_releases, between_releases=True,
+                  systemrelease__isnull=False)
 @stat_function(12, "DEFECTS", "Fixed defects between releases",
                "Number of defects that were fixed between this release and previous one")
 def get_fixed_defects_between_releases():
@@ -238,6 +250,7 @@ def get_fixed_defects_between_releases():
             for r in releases}
 
 
+@per_binding_stat(diff_new_defects_between_releases, between_releases=True)
 @stat_function(13, "DEFECTS", "New defects between releases",
                "Number of newly added defects between this release and previous one")
 def get_new_defects_between_releases():
@@ -260,8 +273,7 @@ def get_total_waivers_submitted():
 @stat_function(1, "WAIVERS", "Waivers submitted",
                "Number of waivers submitted by release. (including invalidated)")
 def get_waivers_submitted_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.by_release(r).count() for r in releases}
+    return _count_by_release(Waiver.waivers.all())
 
 
 @stat_function(2, "WAIVERS", "Waivers submitted for regular updates",
@@ -273,9 +285,7 @@ def get_total_update_waivers_submitted():
 @stat_function(2, "WAIVERS", "Waivers submitted for regular updates",
                "Number of waivers submitted for updates in this release.")
 def get_total_update_waivers_submitted_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.updates().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Waiver.waivers.updates())
 
 
 @stat_function(3, "WAIVERS", "Waivers submitted for rebases",
@@ -287,9 +297,7 @@ def get_total_rebase_waivers_submitted():
 @stat_function(3, "WAIVERS", "Waivers submitted for rebases",
                "Number of waivers submitted for rebases in this release.")
 def get_total_rebase_waivers_submitted_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.rebases().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Waiver.waivers.rebases())
 
 
 @stat_function(4, "WAIVERS", "Waivers submitted for newpkg scans",
@@ -301,9 +309,7 @@ def get_total_newpkg_waivers_submitted():
 @stat_function(4, "WAIVERS", "Waivers submitted for newpkg scans",
                "Number of waivers submitted for new package scans in this release.")
 def get_total_newpkg_waivers_submitted_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.newpkgs().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Waiver.waivers.newpkgs())
 
 
 @stat_function(5, "WAIVERS", "Missing waivers",
@@ -315,9 +321,7 @@ def get_total_missing_waivers():
 @stat_function(5, "WAIVERS", "Missing waivers",
                "Number of groups that were not waived by release.")
 def get_missing_waivers_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: ResultGroup.objects.missing_waiver().by_release(r).count()
-            for r in releases}
+    return _count_by_release(ResultGroup.objects.missing_waiver())
 
 
 @stat_function(6, "WAIVERS", "Missing waivers in rebases",
@@ -329,9 +333,7 @@ def get_total_missing_waivers_in_rebases():
 @stat_function(6, "WAIVERS", "Missing waivers in rebases",
                "Number of groups in rebases that were not waived by release.")
 def get_missing_waivers_in_rebases_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: ResultGroup.objects.missing_waiver().rebases().by_release(r).count()
-            for r in releases}
+    return _count_by_release(ResultGroup.objects.missing_waiver().rebases())
 
 
 @stat_function(7, "WAIVERS", "Missing waivers in new packages",
@@ -343,9 +345,7 @@ def get_total_missing_waivers_in_newpkgs():
 @stat_function(7, "WAIVERS", "Missing waivers in new packages",
                "Number of groups in new package scans that were not waived by release.")
 def get_missing_waivers_in_newpkgs_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: ResultGroup.objects.missing_waiver().newpkgs().by_release(r).count()
-            for r in releases}
+    return _count_by_release(ResultGroup.objects.missing_waiver().newpkgs())
 
 
 @stat_function(8, "WAIVERS", "Missing waivers in updates",
@@ -357,9 +357,7 @@ def get_total_missing_waivers_in_updates():
 @stat_function(8, "WAIVERS", "Missing waivers in updates",
                "Number of groups in updates that were not waived.")
 def get_missing_waivers_in_updates_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: ResultGroup.objects.missing_waiver().updates().by_release(r).count()
-            for r in releases}
+    return _count_by_release(ResultGroup.objects.missing_waiver().updates())
 
 
 @stat_function(9, "WAIVERS", "'is a bug' waivers",
@@ -371,33 +369,25 @@ def get_total_is_a_bug_waivers():
 @stat_function(9, "WAIVERS", "'is a bug' waivers",
                "Number of waivers with type IS_A_BUG by release.")
 def get_is_a_bug_waivers_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.is_a_bugs().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Waiver.waivers.is_a_bugs())
 
 
 @stat_function(10, "WAIVERS", "'is a bug' waivers in rebases",
                "Number of waivers with type IS_A_BUG in rebases by release.")
 def get_is_a_bug_waivers_in_rebases_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.is_a_bugs().rebases().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Waiver.waivers.is_a_bugs().rebases())
 
 
 @stat_function(11, "WAIVERS", "'is a bug' waivers in newpkgs",
                "Number of waivers with type IS_A_BUG in new packages by release.")
 def get_is_a_bug_waivers_in_newpkgs_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.is_a_bugs().newpkgs().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Waiver.waivers.is_a_bugs().newpkgs())
 
 
 @stat_function(12, "WAIVERS", "'is a bug' waivers in updates",
                "Number of waivers with type IS_A_BUG in updates by release.")
 def get_is_a_bug_waivers_in_updates_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.is_a_bugs().updates().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Waiver.waivers.is_a_bugs().updates())
 
 
 @stat_function(10, "WAIVERS", "'not a bug' waivers",
@@ -409,33 +399,25 @@ def get_total_not_a_bug_waivers():
 @stat_function(13, "WAIVERS", "'not a bug' waivers",
                "Number of waivers with type NOT_A_BUG by release.")
 def get_not_a_bug_waivers_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.not_a_bugs().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Waiver.waivers.not_a_bugs())
 
 
 @stat_function(14, "WAIVERS", "'not a bug' waivers in rebases",
                "Number of waivers with type NOT_A_BUG in rebases by release.")
 def get_not_a_bug_waivers_in_rebases_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.not_a_bugs().rebases().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Waiver.waivers.not_a_bugs().rebases())
 
 
 @stat_function(15, "WAIVERS", "'not a bug' waivers in newpkgs",
                "Number of waivers with type NOT_A_BUG in new packages by release.")
 def get_not_a_bug_waivers_in_newpkgs_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.not_a_bugs().newpkgs().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Waiver.waivers.not_a_bugs().newpkgs())
 
 
 @stat_function(16, "WAIVERS", "'not a bug' waivers in updates",
                "Number of waivers with type NOT_A_BUG in updates by release.")
 def get_not_a_bug_waivers_in_updates_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.not_a_bugs().updates().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Waiver.waivers.not_a_bugs().updates())
 
 
 @stat_function(11, "WAIVERS", "'fix later' waivers",
@@ -447,33 +429,25 @@ def get_total_fix_later_waivers():
 @stat_function(17, "WAIVERS", "'fix later' waivers",
                "Number of waivers with type FIX_LATER by release.")
 def get_fix_later_waivers_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.fix_laters().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Waiver.waivers.fix_laters())
 
 
 @stat_function(18, "WAIVERS", "'fix later' waivers in rebases",
                "Number of waivers with type FIX_LATER in rebases by release.")
 def get_fix_later_waivers_in_rebases_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.fix_laters().rebases().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Waiver.waivers.fix_laters().rebases())
 
 
 @stat_function(19, "WAIVERS", "'fix later' waivers in newpkgs",
                "Number of waivers with type FIX_LATER in new packages by release.")
 def get_fix_later_waivers_in_newpkgs_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.fix_laters().newpkgs().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Waiver.waivers.fix_laters().newpkgs())
 
 
 @stat_function(20, "WAIVERS", "'fix later' waivers in updates",
                "Number of waivers with type FIX_LATER in updates by release.")
 def get_fix_later_waivers_in_updates_by_release():
-    releases = SystemRelease.objects.filter(active=True)
-    return {r: Waiver.waivers.fix_laters().updates().by_release(r).count()
-            for r in releases}
+    return _count_by_release(Waiver.waivers.fix_laters().updates())
 
 ######
 # TIME
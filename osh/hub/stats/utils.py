@@ -9,3 +9,22 @@ def stat_function(order, group, short_comment, comment):
         function.comment = comment
         return function
     return decorator
+
+
+def per_binding_stat(diff_function, scope=None, between_releases=False, **release_filter):
+    """
+    Mark a release specific stat function that sums `diff_function(sb)` over
+    enabled scan bindings of each active release; `scope` is the name of
+    a ScanBinding queryset method which limits the bindings.  Such stats are
+    computed incrementally, see osh.hub.stats.incremental.
+
+    between_releases -- diff_function depends on scans in the child release
+    release_filter -- additional filter of the releases
+    """
+    def decorator(function):
+        function.diff_function = diff_function
+        function.binding_scope = scope
+        function.between_releases = between_releases
+        function.release_filter = release_filter
+        return function
+    return decorator
@@ -1,97 +1,163 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
+import datetime
 import json
 from collections import OrderedDict
 
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 
 from osh.hub.scan.models import SystemRelease
 from osh.hub.stats.models import StatResults, StatType
-from osh.hub.stats.service import display_values
+from osh.hub.stats.service import (STATS_CACHE_TIMEOUT, TIME_SERIES_BUCKETS,
+                                   get_latest_values, get_results_version,
+                                   get_time_series)
+
+
+def _get_overview(release=None):
+    """ {stat_type: (last value, detail url)} of global or release specific stats """
+    values = get_latest_values(release)
+    return OrderedDict(
+        (stattype, (values.get(stattype.id, 0), stattype.detail_url(release)))
+        for stattype in StatType.objects.filter(is_release_specific=release is not None)
+        .order_by('group', 'order')
+    )
+
+
+def _overview_context(release, title, **context):
+    # the overview is rendered from cache unless update() stored new
+    # results, callables are evaluated by template only on cache miss
+    context.update({
+        'cache_key': release.id if release is not None else 'global',
+        'cache_timeout': STATS_CACHE_TIMEOUT,
+        'cache_version': get_results_version(),
+        'results': lambda: _get_overview(release),
+        'title': title,
+    })
+    return context
 
 
 def release_stats_list(request, release_id):
     release = get_object_or_404(SystemRelease, id=release_id)
-
-    context = {
-        'results': OrderedDict(
-            (stattype, (stattype.display_value(release), stattype.detail_url(release)))
-            for stattype in StatType.objects.filter(is_release_specific=True)
-            .order_by('group', 'order')
-        ),
-        'title': f'Statistics - {release.product}.{release.release}'
-    }
+    context = _overview_context(release, f'Statistics - {release.product}.{release.release}')
     return render(request, "stats/list.html", context)
 
 
 def stats_list(request):
-    release_ids = StatResults.objects.all().values_list(
-        'release__id', flat=True).distinct()
-
-    context = {
-        'releases': SystemRelease.objects.filter(id__in=release_ids),
-        'results': OrderedDict(
-            (stattype, (stattype.display_value(), stattype.detail_url()))
-            for stattype in StatType.objects.filter(is_release_specific=False)
-            .order_by('group', 'order')
-        ),
-        'title': 'Statistics'
-    }
+    def get_releases():
+        release_ids = StatResults.objects.all().values_list(
+            'release__id', flat=True).distinct()
+        return SystemRelease.objects.filter(id__in=release_ids)
+
+    context = _overview_context(None, 'Statistics', releases=get_releases)
     return render(request, "stats/list.html", context)
 
 
+# number of the most recent points shown in graph unless `since` is given
+GRAPH_POINTS = 12
+
+
+def _get_series_args(request):
+    """ parse time series arguments from query string """
+    args = {
+        'bucket': request.GET.get('bucket', 'week'),
+        'aggregate': request.GET.get('aggregate', 'last'),
+    }
+    for name in ('since', 'until'):
+        value = request.GET.get(name)
+        args[name] = datetime.datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    return args
+
+
+def _get_graph_limit(request):
+    """ number of the most recent points of graph (None for all of them) """
+    limit = request.GET.get('limit')
+    if limit is None:
+        return None if request.GET.get('since') else GRAPH_POINTS
+    limit = int(limit)
+    if limit <= 0:
+        raise ValueError(f"Invalid limit '{limit}'")
+    return limit
+
+
+def _detail_context(request, stat_type, release, json_url):
+    """ raise ValueError on invalid time series arguments """
+    series_args = _get_series_args(request)
+    series = get_time_series(stat_type, release, **series_args)
+
+    query = request.GET.urlencode()
+    return {
+        'json_url': f'{json_url}?{query}' if query else json_url,
+        'results': dict(zip(series['t'], series['v'])),
+        'series_args': series_args,
+        'buckets': list(TIME_SERIES_BUCKETS),
+        'type': stat_type,
+    }
+
+
 def release_stats_detail(request, release_id, stat_id):
     release = get_object_or_404(SystemRelease, id=release_id)
     stat_type = get_object_or_404(StatType, id=stat_id)
 
-    context = {
-        'json_url': reverse('stats/release/detail/graph', args=[stat_id, release_id]),
-        'results': display_values(stat_type, release),
-        'title': f'Statistics - {release.product}.{release.release} - {stat_type.short_comment}',
-        'type': stat_type
-    }
+    json_url = reverse('stats/release/detail/graph', args=[stat_id, release_id])
+    try:
+        context = _detail_context(request, stat_type, release, json_url)
+    except ValueError as ex:
+        return HttpResponseBadRequest(str(ex))
+    context['title'] = f'Statistics - {release.product}.{release.release} - {stat_type.short_comment}'
     return render(request, "stats/detail.html", context)
 
 
 def stats_detail(request, stat_id):
     stat_type = get_object_or_404(StatType, id=stat_id)
-    context = {
-        'json_url': reverse('stats/detail/graph', args=[stat_id]),
-        'results': display_values(stat_type),
-        'title': f'Statistics - {stat_type.short_comment}',
-        'type': stat_type
-    }
+
+    json_url = reverse('stats/detail/graph', args=[stat_id])
+    try:
+        context = _detail_context(request, stat_type, None, json_url)
+    except ValueError as ex:
+        return HttpResponseBadRequest(str(ex))
+    context['title'] = f'Statistics - {stat_type.short_comment}'
     return render(request, "stats/detail.html", context)
 
 
 def stats_detail_graph(request, stat_id, release_id=None):
     """
-    Provide data for graph.
+    Provide data for graph: values bucketed by day, week or month (`bucket`)
+    using last, max or avg value (`aggregate`) between `since` and `until`
+    dates as parallel arrays of dates (x) and values (y).  Only the last
+    `limit` points are provided, GRAPH_POINTS by default unless `since` is
+    given.
     """
     st = get_object_or_404(StatType, id=stat_id)
 
+    release = None
+    label = 'Global'
     if release_id is not None:
         release = get_object_or_404(SystemRelease, id=release_id)
         label = release.tag
-        sr = StatResults.objects.filter(stat=st, release=release)
-    else:
-        label = 'Global'
-        sr = StatResults.objects.filter(stat=st)
+
+    try:
+        series_args = _get_series_args(request)
+        series = get_time_series(st, release, **series_args)
+        limit = _get_graph_limit(request)
+    except ValueError as ex:
+        return HttpResponseBadRequest(str(ex))
+
+    times, values = series['t'], series['v']
+    if limit is not None:
+        times, values = times[-limit:], values[-limit:]
 
     data = {
         'title': st.short_comment,
         'subtitle': st.comment,
         'label': label,
-        'x': [],
-        'y': [],
+        'bucket': series_args['bucket'],
+        'aggregate': series_args['aggregate'],
+        'x': [t.strftime("%Y-%m-%d") for t in times],
+        'y': values,
     }
 
-    for result in sr.order_by('-date')[:12]:
-        data['x'].append(result.date.strftime("%Y-%m-%d"))
-        data['y'].append(result.value)
-
     return HttpResponse(json.dumps(data).encode(),
                         content_type='application/json; charset=utf8')
@@ -0,0 +1,40 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from osh.hub.waiving.models import Result, ResultGroup
+
+
+class Command(BaseCommand):
+    help = "Compute precomputed numbers of defects of results and result groups"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='recompute all counters, not only the missing ones')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='number of results updated in one transaction')
+
+    def handle(self, *args, **options):
+        results = Result.objects.order_by('id')
+        if not options['all']:
+            results = results.filter(total_defects__isnull=True)
+
+        ids = list(results.values_list('id', flat=True))
+        batch_size = options['batch_size']
+        for start in range(0, len(ids), batch_size):
+            with transaction.atomic():
+                self.update_batch(ids[start:start + batch_size])
+            self.stdout.write("Updated %d/%d results" % (min(start + batch_size, len(ids)), len(ids)))
+
+    def update_batch(self, ids):
+        rgs = list(ResultGroup.objects.filter(result__in=ids)
+                   .annotate(count=Count('defect')))
+        for rg in rgs:
+            rg.total_defects = rg.count
+        ResultGroup.objects.bulk_update(rgs, ['total_defects'])
+
+        for result in Result.objects.filter(id__in=ids):
+            result.update_defects_counters()
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.20 on 2026-10-18 22:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waiving', '0008_remove_resultgroup_defects_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='result',
+            name='fixed_defects',
+            field=models.IntegerField(blank=True, help_text='Number of fixed defects', null=True),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='new_defects',
+            field=models.IntegerField(blank=True, help_text='Number of newly introduced defects', null=True),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='previously_waived_defects',
+            field=models.IntegerField(blank=True, help_text='Number of defects waived in a past', null=True),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='total_defects',
+            field=models.IntegerField(blank=True, help_text='Number of all defects', null=True),
+        ),
+        migrations.AddField(
+            model_name='resultgroup',
+            name='total_defects',
+            field=models.IntegerField(blank=True, help_text='Number of defects in this group', null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.20 on 2026-10-18 22:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scan', '0019_alter_analyzer_options'),
+        ('waiving', '0009_defects_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestWaiver',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checker_group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waiving.checkergroup')),
+                ('package', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scan.package')),
+                ('release', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scan.systemrelease')),
+                ('waiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waiving.waiver')),
+            ],
+            options={
+                'unique_together': {('package', 'release', 'checker_group')},
+            },
+        ),
+    ]
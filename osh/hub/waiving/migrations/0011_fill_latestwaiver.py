@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+def forwards_func(apps, schema_editor):
+    LatestWaiver = apps.get_model('waiving', 'LatestWaiver')
+    Waiver = apps.get_model('waiving', 'Waiver')
+
+    # active waivers ordered from the oldest one, the latest one wins
+    waivers = Waiver.objects.filter(
+        is_deleted=False,
+        is_active=True,
+        result_group__result__scanbinding__scan__tag__isnull=False,
+    ).order_by('date', 'id').values_list(
+        'id',
+        'result_group__result__scanbinding__scan__package',
+        'result_group__result__scanbinding__scan__tag__release',
+        'result_group__checker_group',
+    )
+
+    latest = {}
+    for waiver_id, package_id, release_id, checker_group_id in waivers.iterator():
+        latest[package_id, release_id, checker_group_id] = waiver_id
+
+    LatestWaiver.objects.bulk_create([
+        LatestWaiver(package_id=package_id, release_id=release_id,
+                     checker_group_id=checker_group_id, waiver_id=waiver_id)
+        for (package_id, release_id, checker_group_id), waiver_id in latest.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('waiving', '0010_latestwaiver'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards_func, migrations.RunPython.noop)
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.20 on 2026-10-18 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waiving', '0011_fill_latestwaiver'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='defect',
+            name='fingerprint',
+            field=models.CharField(blank=True, help_text='Line-number independent hash of the defect', max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='resultgroup',
+            name='digest',
+            field=models.CharField(blank=True, help_text='Hash of fingerprints of defects in this group', max_length=40, null=True),
+        ),
+    ]
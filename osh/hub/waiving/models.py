@@ -5,6 +5,7 @@ import datetime
 import logging
 
 from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
 from django.db import models, transaction
 from kobo.types import Enum, EnumItem
 
@@ -91,6 +92,23 @@ class Result(models.Model):
 
     analyzers = models.ManyToManyField(AnalyzerVersion)
 
+    # precomputed numbers of defects by type of their result group, these are
+    # NULL for results which were not processed by update_defects_counters()
+    new_defects = models.IntegerField(blank=True, null=True,
+                                      help_text='Number of newly introduced defects')
+    fixed_defects = models.IntegerField(blank=True, null=True,
+                                        help_text='Number of fixed defects')
+    previously_waived_defects = models.IntegerField(
+        blank=True, null=True, help_text='Number of defects waived in a past')
+    total_defects = models.IntegerField(blank=True, null=True,
+                                        help_text='Number of all defects')
+
+    DEFECTS_COUNTERS = {
+        DEFECT_STATES['NEW']: 'new_defects',
+        DEFECT_STATES['FIXED']: 'fixed_defects',
+        DEFECT_STATES['PREVIOUSLY_WAIVED']: 'previously_waived_defects',
+    }
+
     def save(self, *args, **kwargs):
         ''' On save, update timestamps '''
         if not self.id:
@@ -101,10 +119,29 @@ class Result(models.Model):
         get_latest_by = "date_submitted"
 
     def get_defects_count(self, defect_type):
+        counter = self.DEFECTS_COUNTERS.get(defect_type)
+        if counter is not None and getattr(self, counter) is not None:
+            return getattr(self, counter)
+
         rgs = ResultGroup.objects.filter(result=self,
                                          defect_type=defect_type)
         return Defect.objects.filter(result_group__in=rgs).count()
 
+    def update_defects_counters(self, save=True):
+        """
+        recompute numbers of defects of this result, needs to be called
+        whenever defect_type of any of its result groups changes
+        """
+        counts = dict(Defect.objects.filter(result_group__result=self)
+                      .values_list('result_group__defect_type')
+                      .annotate(count=models.Count('id'))
+                      .order_by())
+        for defect_type, counter in self.DEFECTS_COUNTERS.items():
+            setattr(self, counter, counts.get(defect_type, 0))
+        self.total_defects = sum(counts.values())
+        if save:
+            self.save(update_fields=list(self.DEFECTS_COUNTERS.values()) + ['total_defects'])
+
     def new_defects_count(self):
         return self.get_defects_count(DEFECT_STATES['NEW'])
 
@@ -232,6 +269,10 @@ current defect",
     events = models.JSONField(default=list,
                               help_text="List of defect related events.")
 
+    # hash of the defect which does not depend on line numbers
+    fingerprint = models.CharField(max_length=40, blank=True, null=True,
+                                   help_text="Line-number independent hash of the defect")
+
     objects = DefectManager()
 
     def __str__(self):
@@ -280,6 +321,11 @@ class ResultGroupMixin:
         return self.filter(
             result__scanbinding__scan__scan_type=SCAN_TYPES['REBASE'])
 
+    def with_waivers(self):
+        """ prefetch active waivers of rgs into attribute active_waivers """
+        return self.prefetch_related(models.Prefetch(
+            'waiver_set', queryset=Waiver.waivers.all(), to_attr='active_waivers'))
+
 
 class ResultGroupQuerySet(models.query.QuerySet, ResultGroupMixin):
     pass
@@ -308,6 +354,13 @@ class ResultGroup(models.Model):
         default=DEFECT_STATES["UNKNOWN"],
         choices=DEFECT_STATES.get_mapping(),
         help_text="Type of defects that are associated with this group.")
+    # precomputed number of defects in this group, all of them are of
+    # defect_type; NULL for groups which were not processed yet
+    total_defects = models.IntegerField(blank=True, null=True,
+                                        help_text="Number of defects in this group")
+    # hash of fingerprints of all defects in this group
+    digest = models.CharField(max_length=40, blank=True, null=True,
+                              help_text="Hash of fingerprints of defects in this group")
 
     objects = ResultGroupManager()
 
@@ -350,6 +403,9 @@ class ResultGroup(models.Model):
         return latest waiver, if it exists
         """
         if self.state in RESULT_GROUP_PROCESSED:
+            if hasattr(self, 'active_waivers'):
+                # prefetched by ResultGroup.objects.with_waivers()
+                return max(self.active_waivers, key=lambda w: w.date, default=None)
             waivers = self.get_waivers()
             if not waivers:
                 return None
@@ -372,6 +428,8 @@ class ResultGroup(models.Model):
 
     @property
     def defects_count(self):
+        if self.total_defects is not None:
+            return self.total_defects
         return Defect.objects.filter(result_group=self).count()
 
     def get_state_to_display(self):
@@ -548,6 +606,16 @@ waived for specific Result", on_delete=models.CASCADE)
         get_latest_by = "date"
         ordering = ("-date", )
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        LatestWaiver.objects.update_for(self.result_group)
+
+    def delete(self, *args, **kwargs):
+        result_group = self.result_group
+        ret = super().delete(*args, **kwargs)
+        LatestWaiver.objects.update_for(result_group)
+        return ret
+
     def __str__(self):
         return "#%d %s - %s, ResultGroup: (%s) BZ: %s" % (
             self.id,
@@ -596,6 +664,56 @@ waived for specific Result", on_delete=models.CASCADE)
                    user=user, state=WAIVER_TYPES['COMMENT'])
 
 
+class LatestWaiverManager(models.Manager):
+    def update_for(self, rg):
+        """
+        refresh latest waiver for package, release and checker group of rg
+        """
+        try:
+            scan = rg.result.scanbinding.scan
+        except ObjectDoesNotExist:
+            return
+        if scan.tag is None:
+            return
+
+        key = {
+            'package': scan.package,
+            'release': scan.tag.release,
+            'checker_group': rg.checker_group,
+        }
+        waiver = Waiver.waivers.filter(
+            result_group__checker_group=rg.checker_group,
+            result_group__result__scanbinding__scan__package=scan.package,
+            result_group__result__scanbinding__scan__tag__release=scan.tag.release,
+        ).order_by('-date', '-id').first()
+
+        if waiver is None:
+            self.filter(**key).delete()
+        else:
+            self.update_or_create(defaults={'waiver': waiver}, **key)
+
+
+class LatestWaiver(models.Model):
+    """
+    Latest active waiver for each package, release and checker group; this is
+    an index which makes it possible to look up waivers from past runs for
+    all result groups of a new run at once
+    """
+    package = models.ForeignKey(Package, on_delete=models.CASCADE)
+    release = models.ForeignKey(SystemRelease, on_delete=models.CASCADE)
+    checker_group = models.ForeignKey(CheckerGroup, on_delete=models.CASCADE)
+    waiver = models.ForeignKey(Waiver, on_delete=models.CASCADE)
+
+    objects = LatestWaiverManager()
+
+    class Meta:
+        unique_together = ('package', 'release', 'checker_group')
+
+    def __str__(self):
+        return "%s, %s, %s: %s" % (self.package, self.release,
+                                   self.checker_group, self.waiver)
+
+
 class WaivingLogMixin:
     def not_deleted(self):
         return self.exclude(state=WAIVER_LOG_ACTIONS['DELETE'])
@@ -3,8 +3,10 @@
 
 import datetime
 import logging
+import time
+from contextlib import contextmanager
 
-from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from kobo.hub.models import Task
 
 from osh.common.constants import DEFAULT_CHECKER_GROUP
@@ -16,10 +18,15 @@ from osh.hub.service.processing import (TaskDiffer, task_has_results,
 from osh.hub.waiving.models import (DEFECT_STATES, RESULT_GROUP_STATES,
                                     Checker, CheckerGroup, Defect, Result,
                                     ResultGroup)
-from osh.hub.waiving.service import find_processed_in_past
+from osh.hub.waiving.service import (defect_fingerprint,
+                                     find_processed_in_past,
+                                     result_group_digest)
 
 logger = logging.getLogger(__name__)
 
+# number of defects inserted by a single INSERT statement
+DEFECTS_BATCH_SIZE = 1000
+
 
 class TaskResultsProcessor:
     """
@@ -111,6 +118,16 @@ class ResultsLoader:
         self.sb = sb
         self.scan = sb.scan
         self.result = None
+        # checker name -> Checker
+        self.checkers = {}
+        # (checker group id, defect state) -> ResultGroup
+        self.result_groups = {}
+        # result group id -> order of the last defect staged into it
+        self.defect_order = {}
+        # result group id -> fingerprints of defects staged into it
+        self.fingerprints = {}
+        # import stage -> time spent in seconds
+        self.timings = {}
         task = Task.objects.get(id=sb.task.id)
         paths = TaskResultPaths(task)
         self.all = CsmockAPI(paths.get_json_results())
@@ -140,53 +157,90 @@ class ResultsLoader:
         self.sb.result = self.result
         self.sb.save()
 
-    def store_defects(self, defects, defect_state):
-        """ put defects in database """
-        for defect in defects:
-            try:
-                key_idx = int(defect['key_event_idx'])
-                key_evt = defect['events'][key_idx]
-                if key_evt['event'] == 'internal warning':
-                    # skip internal warnings
-                    continue
-            except:  # noqa: B901, E722
-                pass
-            d = Defect()
-            json_checker_name = defect['checker']
+    @contextmanager
+    def timed(self, stage):
+        """ measure time spent in the given stage of the import """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0.0) + time.monotonic() - start
 
-            # truncate to fit into the corresponding db field
-            json_checker_name = json_checker_name[:64]
-
-            try:
-                # get_or_create fails here, because there will be integrity
-                # error on group atribute
-                checker = Checker.objects.get(name=json_checker_name)
-            except ObjectDoesNotExist:
-                if json_checker_name.startswith("FB."):
-                    # assign numerous FindBugs checkers to FindBugs automatically
-                    default_group = "FindBugs"
-                else:
-                    default_group = DEFAULT_CHECKER_GROUP
-                checker = Checker()
-                checker.group, _ = CheckerGroup.objects.get_or_create(name=default_group)
-                checker.name = json_checker_name
-                checker.save()
-
-            rg, created = ResultGroup.objects.get_or_create(
-                checker_group=checker.group,
-                result=self.result,
-                defect_type=defect_state)
-
-            if rg.state == RESULT_GROUP_STATES['UNKNOWN']:
-                if defect_state == DEFECT_STATES['NEW']:
-                    rg.state = RESULT_GROUP_STATES['NEEDS_INSPECTION']
-                elif defect_state == DEFECT_STATES['FIXED']:
-                    rg.state = RESULT_GROUP_STATES['INFO']
+    def resolve_checkers(self, names):
+        """
+        make sure that all checkers in names are present in self.checkers,
+        missing ones are created in a single batch
+        """
+        unknown = {name for name in names if name not in self.checkers}
+        if not unknown:
+            return
 
+        for checker in Checker.objects.filter(name__in=unknown):
+            self.checkers.setdefault(checker.name, checker)
+
+        missing = unknown - self.checkers.keys()
+        if not missing:
+            return
+
+        groups = {}
+        new_checkers = []
+        for name in sorted(missing):
+            if name.startswith("FB."):
+                # assign numerous FindBugs checkers to FindBugs automatically
+                group_name = "FindBugs"
+            else:
+                group_name = DEFAULT_CHECKER_GROUP
+            if group_name not in groups:
+                groups[group_name], _ = CheckerGroup.objects.get_or_create(name=group_name)
+            new_checkers.append(Checker(name=name, group=groups[group_name]))
+        Checker.objects.bulk_create(new_checkers)
+
+        # bulk_create() does not set primary keys on all database backends
+        for checker in Checker.objects.filter(name__in=missing):
+            self.checkers.setdefault(checker.name, checker)
+
+    def get_result_group(self, checker_group_id, defect_state):
+        """ return result group of this result, each one is created only once """
+        key = (checker_group_id, defect_state)
+        rg = self.result_groups.get(key)
+        if rg is not None:
+            return rg
+
+        rg, _ = ResultGroup.objects.get_or_create(
+            checker_group_id=checker_group_id,
+            result=self.result,
+            defect_type=defect_state)
+
+        if rg.state == RESULT_GROUP_STATES['UNKNOWN']:
+            if defect_state == DEFECT_STATES['NEW']:
+                rg.state = RESULT_GROUP_STATES['NEEDS_INSPECTION']
+            elif defect_state == DEFECT_STATES['FIXED']:
+                rg.state = RESULT_GROUP_STATES['INFO']
             rg.save()
 
+        self.result_groups[key] = rg
+        return rg
+
+    def insert_defects(self, defects, defect_state):
+        """ insert a batch of defects (parsed JSON) into database """
+        with self.timed('checkers'):
+            # truncate to fit into the corresponding db field
+            self.resolve_checkers({defect['checker'][:64] for defect in defects})
+
+        staged = []
+        for defect in defects:
+            checker = self.checkers[defect['checker'][:64]]
+            with self.timed('result groups'):
+                rg = self.get_result_group(checker.group_id, defect_state)
+
+            # defects in view have fixed order given by the order in JSON
+            order = self.defect_order.get(rg.id, 0) + 1
+            self.defect_order[rg.id] = order
+
+            d = Defect()
             d.checker = checker
             d.result_group = rg
+            d.order = order
             d.annotation = defect.get('annotation', None)
             d.defect_identifier = defect.get('defect_id', None)
             d.function = defect.get('function', None)
@@ -200,26 +254,74 @@ class ResultsLoader:
             d.state = defect_state
             d.key_event = defect['key_event_idx']
             d.events = defect['events']
-            d.save()
+            d.fingerprint = defect_fingerprint(d)
+            self.fingerprints.setdefault(rg.id, []).append(d.fingerprint)
+            staged.append(d)
+
+        with self.timed('defects'):
+            Defect.objects.bulk_create(staged, batch_size=DEFECTS_BATCH_SIZE)
+
+    def store_defects(self, defects, defect_state):
+        """ put defects in database """
+        count = 0
+        batch = []
+        with transaction.atomic():
+            for defect in defects:
+                try:
+                    key_idx = int(defect['key_event_idx'])
+                    key_evt = defect['events'][key_idx]
+                    if key_evt['event'] == 'internal warning':
+                        # skip internal warnings
+                        continue
+                except:  # noqa: B901, E722
+                    pass
+
+                batch.append(defect)
+                if len(batch) >= DEFECTS_BATCH_SIZE:
+                    self.insert_defects(batch, defect_state)
+                    count += len(batch)
+                    batch = []
+
+            if batch:
+                self.insert_defects(batch, defect_state)
+                count += len(batch)
+
+        logger.info("Stored %d %s defects of %s (%s)", count,
+                    DEFECT_STATES.get_value(defect_state),
+                    self.result, self.format_timings())
+
+    def store_result_groups_counters(self):
+        """
+        store numbers of defects and digests of result groups as computed
+        while staging
+        """
+        rgs = list(self.result_groups.values())
+        for rg in rgs:
+            rg.total_defects = self.defect_order.get(rg.id, 0)
+            rg.digest = result_group_digest(self.fingerprints.get(rg.id, []))
+        ResultGroup.objects.bulk_update(rgs, ['total_defects', 'digest'])
+
+    def format_timings(self):
+        return ", ".join("%s: %.3fs" % item for item in sorted(self.timings.items()))
 
     def process(self):
         """ process scan """
-        self.create_result()
+        with self.timed('result'):
+            self.create_result()
         if self.scan.is_errata_scan():
             if self.scan.is_newpkg_scan():
-                self.store_defects(self.all.get_defects(), DEFECT_STATES['NEW'])
+                self.store_defects(self.all.iter_defects(), DEFECT_STATES['NEW'])
             else:
-                self.store_defects(self.fixed.get_defects(), DEFECT_STATES['FIXED'])
-                self.store_defects(self.added.get_defects(), DEFECT_STATES['NEW'])
+                self.store_defects(self.fixed.iter_defects(), DEFECT_STATES['FIXED'])
+                self.store_defects(self.added.iter_defects(), DEFECT_STATES['NEW'])
+            self.store_result_groups_counters()
+
+            with self.timed('waivers'):
+                find_processed_in_past(self.result)
 
-            find_processed_in_past(self.result)
+        self.result.update_defects_counters()
 
-            for rg in ResultGroup.objects.filter(result=self.result):
-                counter = 1
-                for defect in Defect.objects.filter(result_group=rg):
-                    defect.order = counter
-                    defect.save()
-                    counter += 1
+        logger.info("Results of %s loaded (%s)", self.sb, self.format_timings())
 
 
 def process_scan(sb):
@@ -7,13 +7,14 @@
 """
 
 
+import hashlib
 import json
 import logging
 
 import pycsdiff
 
-from .models import (DEFECT_STATES, RESULT_GROUP_STATES, Defect, ResultGroup,
-                     Waiver, WaivingLog)
+from .models import (DEFECT_STATES, RESULT_GROUP_STATES, Defect, LatestWaiver,
+                     Result, ResultGroup, WaivingLog)
 
 logger = logging.getLogger(__name__)
 
@@ -33,14 +34,14 @@ def find_processed_in_past(result):
     """
 
     # get all RGs, that does not have waiver
-    for rg in get_unwaived_rgs(result):
-        # was RG waived in past?
-        w = get_last_waiver(
-            rg.checker_group,
-            rg.result.scanbinding.scan.package,
-            rg.result.scanbinding.scan.tag.release,
-            exclude=rg.id,
-        )
+    rgs = list(get_unwaived_rgs(result).select_related('checker_group'))
+    if not rgs:
+        return
+
+    # was RG waived in past?
+    waivers = get_last_waivers(result, [rg.checker_group_id for rg in rgs])
+    for rg in rgs:
+        w = waivers.get(rg.checker_group_id)
         # compare defects in these 2 result groups using pycsdiff
         if w and compare_result_groups(rg, w.result_group):
             if w.is_bug():
@@ -52,9 +53,8 @@ def find_processed_in_past(result):
                 rg.save()
 
                 # also changes states for defects
-                for d in Defect.objects.filter(result_group=rg):
-                    d.state = DEFECT_STATES['PREVIOUSLY_WAIVED']
-                    d.save()
+                Defect.objects.filter(result_group=rg).update(
+                    state=DEFECT_STATES['PREVIOUSLY_WAIVED'])
 
 
 def get_unwaived_rgs(result):
@@ -86,6 +86,23 @@ def get_serializable_dict(query):
     return result_dict
 
 
+def defect_fingerprint(defect):
+    """
+    Return hash of a defect which does not depend on line and column numbers.
+    Defects with equal fingerprints are always matched by csdiff, while the
+    opposite does not hold.
+    """
+    events = [[e.get('file_name'), e.get('event'), e.get('message'), e.get('verbosity_level')]
+              for e in defect.events]
+    data = [defect.checker.name, defect.annotation, defect.function, defect.key_event, events]
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def result_group_digest(fingerprints):
+    """ Return hash of (unordered) fingerprints of defects in a result group """
+    return hashlib.sha1('\n'.join(sorted(fingerprints)).encode('utf-8')).hexdigest()
+
+
 def compare_result_groups(rg1, rg2):
     """
         Compare defects of two distinct result groups
@@ -94,6 +111,12 @@ def compare_result_groups(rg1, rg2):
     if rg1.defects_count != rg2.defects_count:
         return False
 
+    # groups with equal digests contain the same defects, csdiff is needed
+    # only to match defects which differ in something else than line numbers
+    if rg1.digest is not None and rg1.digest == rg2.digest and \
+            rg1.defect_type == rg2.defect_type == DEFECT_STATES['NEW']:
+        return True
+
     rg1_defects = rg1.get_new_defects()
     rg2_defects = rg2.get_new_defects()
 
@@ -107,34 +130,71 @@ def compare_result_groups(rg1, rg2):
     return not (r_s1['defects'] or r_s2['defects'])
 
 
+def _filter_effective_waivers(waivers, package, release, exclude_rgs=None):
+    """
+    drop waivers from dict {checker_group_id: waiver} which are not valid
+    anymore because there is a newer run with change in waiving
+    """
+    if not waivers:
+        return waivers
+
+    oldest = min(w.result_group.result.date_submitted for w in waivers.values())
+    # return all RGs newer than the oldest waiver's run, if these are changed
+    # it means that the waiver is not valid
+    rgs = ResultGroup.objects.filter(
+        result__date_submitted__gt=oldest,
+        checker_group__in=list(waivers),
+        result__scanbinding__scan__package=package,
+        result__scanbinding__scan__tag__release=release,
+        state=RESULT_GROUP_STATES['NEEDS_INSPECTION'],
+    )
+    if exclude_rgs:
+        rgs = rgs.exclude(id__in=exclude_rgs)
+
+    for checker_group_id, date_submitted in rgs.values_list('checker_group', 'result__date_submitted'):
+        w = waivers.get(checker_group_id)
+        if w is not None and date_submitted > w.result_group.result.date_submitted:
+            del waivers[checker_group_id]
+    return waivers
+
+
+def get_last_waivers(result, checker_group_ids):
+    """
+    Batch version of get_last_waiver() for all result groups of result with
+    specified checker groups: return dict {checker_group_id: waiver}
+    """
+    scan = result.scanbinding.scan
+    package = scan.package
+    release = scan.tag.release
+    latest_waivers = LatestWaiver.objects.filter(
+        package=package,
+        release=release,
+        checker_group__in=checker_group_ids,
+    ).select_related('waiver__result_group__result')
+
+    waivers = {lw.checker_group_id: lw.waiver for lw in latest_waivers}
+    exclude_rgs = ResultGroup.objects.filter(result=result).values_list('id', flat=True)
+    return _filter_effective_waivers(waivers, package, release, list(exclude_rgs))
+
+
 def get_last_waiver(checker_group, package, release, exclude=None):
     """
     Try to get base waiver for specific checkergroup, package, release;
      return None if there is newer run with change in waiving;
     exclude specified resultgroup
     """
-    waivers = Waiver.waivers.filter(
-        result_group__checker_group=checker_group,
-        result_group__result__scanbinding__scan__package=package,
-        result_group__result__scanbinding__scan__tag__release=release,
-    )
-    if waivers:
-        latest_waiver = waivers.latest()
-        # return all RGs newer that latest_waiver's run, if these are changed
-        # it means that last waiver is not valid
-        rgs = ResultGroup.objects.filter(
-            result__date_submitted__gt=latest_waiver.result_group.result.date_submitted,
-            checker_group=latest_waiver.result_group.checker_group,
-            result__scanbinding__scan__package=latest_waiver.result_group.result.scanbinding.scan.package,
-            result__scanbinding__scan__tag__release=latest_waiver.result_group.result.scanbinding.scan.tag.release,
-        ).exclude(id=exclude).values_list('state', flat=True).distinct()
-        if RESULT_GROUP_STATES['NEEDS_INSPECTION'] in rgs:
-            return None
-        else:
-            return latest_waiver
-    else:
+    lw = LatestWaiver.objects.filter(
+        checker_group=checker_group,
+        package=package,
+        release=release,
+    ).select_related('waiver__result_group__result').first()
+    if lw is None:
         return None
 
+    waivers = {lw.checker_group_id: lw.waiver}
+    exclude_rgs = [exclude] if exclude is not None else None
+    return _filter_effective_waivers(waivers, package, release, exclude_rgs).get(lw.checker_group_id)
+
 
 def display_in_result(rg):
     """
@@ -153,9 +213,10 @@ def waiver_condition(result_group):
 
 def get_scans_new_defects_count(scan_id):
     """Return number of newly introduced bugs for particular scan"""
-    rgs = ResultGroup.objects.filter(result__scanbinding__scan__id=scan_id,
-                                     defect_type=DEFECT_STATES['NEW'])
-    return Defect.objects.filter(result_group__in=rgs).count()
+    result = Result.objects.filter(scanbinding__scan__id=scan_id).first()
+    if result is None:
+        return 0
+    return result.new_defects_count()
 
 
 def get_waivers_for_rg(rg):
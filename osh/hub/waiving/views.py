@@ -8,6 +8,7 @@ from urllib.parse import urlencode
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count
 from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
@@ -24,7 +25,8 @@ from osh.hub.scan.models import (SCAN_STATES, SCAN_TYPES, SCAN_TYPES_TARGET,
 from osh.hub.scan.notify import send_notif_new_comment
 from osh.hub.scan.service import get_latest_sb_by_package
 from osh.hub.scan.xmlrpc_helper import scan_notification_email
-from osh.hub.service.processing import task_has_results
+from osh.hub.service.processing import (schedule_diff_artifacts,
+                                        task_has_results)
 from osh.hub.waiving.forms import ScanListSearchForm, WaiverForm
 from osh.hub.waiving.models import (DEFECT_STATES, RESULT_GROUP_STATES,
                                     WAIVER_LOG_ACTIONS, WAIVER_TYPES,
@@ -103,17 +105,18 @@ def get_result_context(request, sb):
 
     # numbers
     if sb.result:
-        n_out, n_count = get_waiving_data(sb.result,
-                                          defect_type=DEFECT_STATES['NEW'])
+        waiving_data = get_waiving_data(sb.result, [
+            DEFECT_STATES['NEW'],
+            DEFECT_STATES['FIXED'],
+            DEFECT_STATES['PREVIOUSLY_WAIVED'],
+        ])
+        n_out, n_count = waiving_data[DEFECT_STATES['NEW']]
         new_defects = get_tupled_data(n_out)
 
-        f_out, f_count = get_waiving_data(sb.result,
-                                          defect_type=DEFECT_STATES['FIXED'])
+        f_out, f_count = waiving_data[DEFECT_STATES['FIXED']]
         fixed_defects = get_tupled_data(f_out)
 
-        o_out, o_count = get_waiving_data(
-            sb.result,
-            defect_type=DEFECT_STATES['PREVIOUSLY_WAIVED'])
+        o_out, o_count = waiving_data[DEFECT_STATES['PREVIOUSLY_WAIVED']]
         old_defects = get_tupled_data(o_out)
         context['output_new'] = new_defects
         context['output_fixed'] = fixed_defects
@@ -151,15 +154,18 @@ one)."
     return context
 
 
-def create_log_dict(title, icon, icon_link, files, logs_list):
+def create_log_dict(title, icon, icon_link, files, logs_list, pending=()):
     """
     create log -- dict; files is a list of tuples:
         [(path, title, ), ]
+    files which are still being generated are listed in pending
     """
     f = []
     for t in files:
         if t[0] in logs_list:
             f.append({'path': t[0], 'title': t[1]})
+        elif t[0] in pending:
+            f.append({'path': t[0], 'title': t[1], 'pending': True})
     if not f:
         return {}
     log = {
@@ -175,6 +181,11 @@ def add_logs_to_context(sb):
     logs = []
     logs_list = sb.task.logs.list
 
+    # HTML and TXT versions of diff files are rendered in background
+    pending = []
+    if ERROR_DIFF_FILE in logs_list or FIXED_DIFF_FILE in logs_list:
+        pending = schedule_diff_artifacts(sb.task)
+
     if task_has_results(sb.task):
         log_prefix = os.path.join(sb.scan.nvr, 'scan-results')
     else:
@@ -189,12 +200,12 @@ def add_logs_to_context(sb):
                                 ERROR_HTML_FILE,
                                 [(ERROR_TXT_FILE, 'TXT'),
                                  (ERROR_HTML_FILE, 'HTML'),
-                                 (ERROR_DIFF_FILE, 'JSON')], logs_list))
+                                 (ERROR_DIFF_FILE, 'JSON')], logs_list, pending))
     logs.append(create_log_dict('Fixed defects', 'Ok_32.png',
                                 FIXED_HTML_FILE,
                                 [(FIXED_TXT_FILE, 'TXT'),
                                  (FIXED_HTML_FILE, 'HTML'),
-                                 (FIXED_DIFF_FILE, 'JSON')], logs_list))
+                                 (FIXED_DIFF_FILE, 'JSON')], logs_list, pending))
     logs.append(create_log_dict('All defects', 'Document_content_32.png',
                                 log_prefix + '-all.html',
                                 [(log_prefix + '-all.err', 'TXT'),
@@ -207,24 +218,46 @@ def add_logs_to_context(sb):
     return {'logs': [x for x in logs if x]}
 
 
-def get_waiving_data(result_object, defect_type):
-    """return list of checker_groups with states and counts"""
-    output = {}
-    count = 0
-    # checker_group: result_group
-    for group in CheckerGroup.objects.filter(enabled=True):
-        try:
-            rg = ResultGroup.objects.get(checker_group=group,
-                                         result=result_object,
-                                         defect_type=defect_type)
-        except ObjectDoesNotExist:
-            output[group] = {}
-        else:
-            count += 1
-            view_data = display_in_result(rg)
-            view_data['id'] = rg.id
-            output[group] = view_data
-    return output, count
+def get_waiving_data(result_object, defect_types):
+    """
+    return dict {defect_type: (output, count)}, where output maps each enabled
+    checker group to state and count of its result group of defect_type and
+    count is number of such result groups; the number of queries does not
+    depend on number of checker groups
+    """
+    groups = list(CheckerGroup.objects.filter(enabled=True))
+    rgs = list(ResultGroup.objects.filter(result=result_object,
+                                          checker_group__enabled=True,
+                                          defect_type__in=defect_types)
+               .with_waivers())
+
+    # count defects of groups which do not have the counter precomputed
+    missing = [rg for rg in rgs if rg.total_defects is None]
+    if missing:
+        counts = dict(Defect.objects.filter(result_group__in=missing)
+                      .values_list('result_group')
+                      .annotate(count=Count('id'))
+                      .order_by())
+        for rg in missing:
+            rg.total_defects = counts.get(rg.id, 0)
+
+    rgs_map = {(rg.checker_group_id, rg.defect_type): rg for rg in rgs}
+    data = {}
+    for defect_type in defect_types:
+        output = {}
+        count = 0
+        # checker_group: result_group
+        for group in groups:
+            rg = rgs_map.get((group.id, defect_type))
+            if rg is None:
+                output[group] = {}
+            else:
+                count += 1
+                view_data = display_in_result(rg)
+                view_data['id'] = rg.id
+                output[group] = view_data
+        data[defect_type] = (output, count)
+    return data
 
 
 def get_tupled_data(output):
@@ -424,6 +457,7 @@ def waiver_post(form, request, sb, result_group_object, url_name,
         Defect.objects.filter(result_group=result_group_object).\
             update(state=DEFECT_STATES['NEW'])
         result_group_object.save()
+        result_group_object.result.update_defects_counters()
 
     # update states of sb and rg; eventually of whole run
     apply_waiver(result_group_object, sb, w)
@@ -1,8 +1,16 @@
 import io
+import os
+import re
+import tempfile
+import threading
 import unittest
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from unittest.mock import MagicMock, patch
 
 from osh.client.commands.cmd_download_results import Download_Results
+from osh.client.commands.shortcuts import (_get_task_urls, download_file,
+                                           fetch_results_concurrently)
 from osh.tests.client import OSHCLITestBase
 
 
@@ -43,7 +51,7 @@ class TestDownloadResults(OSHCLITestBase, unittest.TestCase):
         with patch('sys.stderr', new=io.StringIO()) as fake_err:
             tasks = ['1', '2']
             kwargs = {"dir": "/path/to/non-existent-dir/"}
-            self.command.hub.scan.get_task_info.return_value = False
+            self.command.hub.scan.get_tasks_info.return_value = {}
             with self.assertRaises(SystemExit) as cm:
                 self.command.run(*tasks, **kwargs)
             self.assertEqual(cm.exception.code, 1)
@@ -51,3 +59,125 @@ class TestDownloadResults(OSHCLITestBase, unittest.TestCase):
             for task_id in tasks:
                 error_message = f"Task {task_id} does not exist!"
                 self.assertIn(error_message, output)
+
+    @patch("osh.client.commands.cmd_download_results.fetch_results_concurrently")
+    def test_run_fetches_info_at_once(self, fake_fetch_results):
+        self.command.connect_to_hub = MagicMock()
+        fake_fetch_results.return_value = True
+        tasks_info = {
+            "1": {"args": {"build": "foo-1.0.0-1.el8"}},
+            "2": {"args": {"srpm_name": "bar-1.0.0-1.el8.src.rpm"}},
+        }
+        self.command.hub.scan.get_tasks_info.return_value = tasks_info
+
+        self.command.run('1', '2', jobs=8)
+        self.command.hub.scan.get_tasks_info.assert_called_once_with(['1', '2'], ['args'])
+        self.command.hub.scan.get_task_info.assert_not_called()
+        fake_fetch_results.assert_called_once_with(self.command.hub, None, tasks_info, 8)
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """ serve files from `server.files` with support for Range requests """
+    def do_HEAD(self):
+        self.send_file(head=True)
+
+    def do_GET(self):
+        self.send_file()
+
+    def send_file(self, head=False):
+        path = self.path.split('?')[0]
+        self.server.requests.append((self.command, path, self.headers.get('Range')))
+        data = self.server.files.get(path)
+        if data is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        match = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        if match:
+            offset = int(match[1])
+            if offset >= len(data):
+                self.send_error(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                return
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header('Content-Range', f'bytes {offset}-{len(data) - 1}/{len(data)}')
+            data = data[offset:]
+        else:
+            self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestDownloadFile(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('localhost', 0), RangeRequestHandler)
+        self.server.files = {'/a.tar.xz': b'a' * 3000, '/b.tar.xz': b'b' * 10}
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.dir = tmpdir.name
+
+    def url(self, path):
+        return f"http://localhost:{self.server.server_port}{path}"
+
+    def test_download_and_skip(self):
+        local_path = os.path.join(self.dir, 'a.tar.xz')
+        self.assertEqual(download_file(self.url('/a.tar.xz'), local_path), 3000)
+        with open(local_path, 'rb') as f:
+            self.assertEqual(f.read(), b'a' * 3000)
+        self.assertFalse(os.path.exists(local_path + '.part'))
+
+        # file with matching size is not downloaded again
+        self.server.requests.clear()
+        self.assertEqual(download_file(self.url('/a.tar.xz'), local_path), 0)
+        self.assertEqual(self.server.requests, [('HEAD', '/a.tar.xz', None)])
+
+    def test_resume(self):
+        local_path = os.path.join(self.dir, 'a.tar.xz')
+        with open(local_path + '.part', 'wb') as f:
+            f.write(b'a' * 1000)
+
+        self.assertEqual(download_file(self.url('/a.tar.xz'), local_path), 2000)
+        self.assertEqual(self.server.requests, [('GET', '/a.tar.xz', 'bytes=1000-')])
+        with open(local_path, 'rb') as f:
+            self.assertEqual(f.read(), b'a' * 3000)
+
+    def test_fetch_results_concurrently(self):
+        hub = MagicMock()
+        tasks_info = {'1': {'args': {'result_filename': 'a'}},
+                      '2': {'args': {'result_filename': 'b'}}}
+        hub.client.task_url.side_effect = lambda task_id: self.url(f'/task/{task_id}/')
+        self.server.files = {'/task/1/log/a.tar.xz': b'a' * 3000, '/task/2/log/b.tar.xz': b'b' * 10}
+
+        with patch('sys.stderr', new=io.StringIO()) as fake_err:
+            self.assertTrue(fetch_results_concurrently(hub, self.dir, tasks_info, jobs=2))
+        self.assertEqual(sorted(os.listdir(self.dir)), ['a.tar.xz', 'b.tar.xz'])
+        self.assertIn("Downloaded 0.0 MiB", fake_err.getvalue())
+        # URLs of other tasks are derived from the first one
+        hub.client.task_url.assert_called_once_with('1')
+
+        tasks_info['3'] = {'args': {'result_filename': 'c'}}
+        with patch('sys.stderr', new=io.StringIO()) as fake_err:
+            self.assertFalse(fetch_results_concurrently(hub, self.dir, tasks_info, jobs=2))
+        self.assertIn("Downloading a.tar.xz: already downloaded", fake_err.getvalue())
+        self.assertIn("Downloading c.tar.xz: HTTP Error 404", fake_err.getvalue())
+
+    def test_task_urls(self):
+        hub = MagicMock()
+        hub.client.task_url.side_effect = lambda task_id: f'https://osh/task/{task_id}/'
+        self.assertEqual(_get_task_urls(hub, [7, 12]),
+                         {7: 'https://osh/task/7/', 12: 'https://osh/task/12/'})
+        self.assertEqual(hub.client.task_url.call_count, 1)
+
+        # unexpected URLs are not guessed
+        hub.client.task_url.side_effect = lambda task_id: f'https://osh/task?id={task_id}'
+        self.assertEqual(_get_task_urls(hub, [7, 12]),
+                         {7: 'https://osh/task?id=7', 12: 'https://osh/task?id=12'})
@@ -2,6 +2,7 @@ import io
 import json
 import unittest
 from unittest.mock import patch
+from xmlrpc.client import Fault
 
 from osh.client.commands.cmd_task_info import Task_Info
 from osh.tests.client import OSHCLITestBase
@@ -13,8 +14,8 @@ class TestTaskInfoCommand(OSHCLITestBase, unittest.TestCase):
 
     def test_options(self):
         self.command.options()
-        self.assertEqual(self.command.parser.usage, f"%prog {self.command.normalized_name} <task_id>")
-        self.assertEqual(self.command.parser.epilog, "exit status is set to 1, if the task is not found")
+        self.assertEqual(self.command.parser.usage, f"%prog {self.command.normalized_name} <task_id> [task_id...]")
+        self.assertEqual(self.command.parser.epilog, "exit status is set to 1, if any of the tasks is not found")
 
     # runs successfully with valid task ID
     def test_runs_successfully_with_valid_task_id_and_no_json_flag(self):
@@ -74,7 +75,7 @@ class TestTaskInfoCommand(OSHCLITestBase, unittest.TestCase):
             self.assertEqual(cm.exception.code, 2)
             error_message = fake_err.getvalue()
             self.assertIn("Usage:", error_message)
-            self.assertIn("error: please specify exactly one task ID", error_message)
+            self.assertIn("error: please specify at least one task ID", error_message)
 
     def test_raise_error_with_invalid_task_id(self):
         with patch('sys.stderr', new=io.StringIO()) as fake_err:
@@ -83,3 +84,43 @@ class TestTaskInfoCommand(OSHCLITestBase, unittest.TestCase):
             self.assertEqual(cm.exception.code, 2)
             error_message = fake_err.getvalue()
             self.assertIn("error: 'invalid-task-id' is not a number", error_message)
+
+    def test_multiple_tasks(self):
+        self.command.hub.scan.get_tasks_info.return_value = {
+            "1": {"id": 1, "state": 3},
+            "2": {"id": 2, "state": 1, "args": {"build": "foo-1.0.0-1.el8"}},
+        }
+
+        with patch('sys.stdout', new=io.StringIO()) as fake_out:
+            self.command.run('2', '1')
+        self.assertEqual(fake_out.getvalue(), (
+            "id = 2\n"
+            "state = 1\n"
+            "args:\n"
+            "    build = foo-1.0.0-1.el8\n"
+            "\n"
+            "id = 1\n"
+            "state = 3\n"
+        ))
+        # info about all tasks is fetched by a single call
+        self.command.hub.scan.get_tasks_info.assert_called_once_with(['2', '1'], None)
+        self.command.hub.scan.get_task_info.assert_not_called()
+
+        with patch('sys.stdout', new=io.StringIO()) as fake_out:
+            self.command.run('2', '1', json=True)
+        self.assertEqual(json.loads(fake_out.getvalue()).keys(), {"1", "2"})
+
+    def test_multiple_tasks_not_found(self):
+        self.command.hub.scan.get_tasks_info.return_value = {"1": {"id": 1}}
+        with patch('sys.stdout', new=io.StringIO()), patch('sys.stderr', new=io.StringIO()) as fake_err:
+            with self.assertRaises(SystemExit) as cm:
+                self.command.run('1', '2', '3')
+        self.assertEqual(cm.exception.code, 1)
+        self.assertIn("There is no info about tasks: 2, 3", fake_err.getvalue())
+
+    def test_multiple_tasks_old_hub(self):
+        self.command.hub.scan.get_tasks_info.side_effect = Fault(1, 'method "scan.get_tasks_info" is not supported')
+        self.command.hub.scan.get_task_info.side_effect = lambda task_id: {"id": int(task_id)}
+        with patch('sys.stdout', new=io.StringIO()) as fake_out:
+            self.command.run('1', '2')
+        self.assertEqual(fake_out.getvalue(), "id = 1\n\nid = 2\n")
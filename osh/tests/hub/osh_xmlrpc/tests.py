@@ -0,0 +1,154 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""`osh.hub.osh_xmlrpc` tests."""
+
+import datetime
+import pathlib
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from kobo.hub.models import Task
+
+from osh.hub.osh_xmlrpc.scan import (TASK_INFO_FIELDS, find_tasks,
+                                     get_filtered_scan_list,
+                                     get_filtered_scan_list_page,
+                                     get_task_info, get_tasks_info,
+                                     get_tasks_state)
+from osh.hub.scan.models import Scan, TaskSearch
+
+FIXTURE_PATH = pathlib.Path(__file__).parents[1] / 'waiving/fixtures/initial_test_data.json'
+
+
+class FilteredScanListPageTestCase(TestCase):
+    def setUp(self):
+        call_command('loaddata', FIXTURE_PATH, verbosity=0)
+        scan = Scan.objects.get(id=1)
+        date = datetime.datetime(2023, 1, 1, 12, 0)
+        for i in range(6):
+            new = Scan.objects.create(nvr='python-six-1.%d-1.el7' % i, tag=scan.tag,
+                                      package=scan.package, username=scan.username)
+            # scans submitted at the same time are ordered by id
+            Scan.objects.filter(id=new.id).update(date_submitted=date + datetime.timedelta(hours=i // 2))
+
+    def walk(self, page_size, **kwargs):
+        scans = []
+        cursor = None
+        while True:
+            page = get_filtered_scan_list_page(None, kwargs, cursor, page_size)
+            self.assertEqual(page['status'], 'OK')
+            self.assertLessEqual(len(page['scans']), page_size)
+            scans += page['scans']
+            cursor = page['next_cursor']
+            if cursor is None:
+                return scans
+
+    def test_walk(self):
+        expected = get_filtered_scan_list(None, {})['scans']
+        for page_size in (1, 2, 4, 100):
+            scans = self.walk(page_size)
+            self.assertEqual(sorted(s['target'] for s in scans),
+                             sorted(s['target'] for s in expected))
+            self.assertEqual(scans[0].keys(), expected[0].keys())
+            dates = [s['date_submitted'] for s in scans]
+            self.assertEqual(dates, sorted(dates, reverse=True))
+
+    def test_filter_and_count(self):
+        page = get_filtered_scan_list_page(None, {'target': 'python-six-1.0-1.el7'}, with_count=True)
+        self.assertEqual((page['count'], len(page['scans']), page['next_cursor']), (1, 1, None))
+
+    def test_invalid_arguments(self):
+        self.assertEqual(get_filtered_scan_list_page(None, {}, 'garbage')['status'], 'ERROR')
+        self.assertEqual(get_filtered_scan_list_page(None, {}, page_size=0)['status'], 'ERROR')
+        for page_size in ('10', None, 1.5, True):
+            self.assertEqual(get_filtered_scan_list_page(None, {}, page_size=page_size)['status'],
+                             'ERROR')
+
+
+class FindTasksTestCase(TestCase):
+    def setUp(self):
+        call_command('loaddata', FIXTURE_PATH, verbosity=0)
+        template = Task.objects.get(id=1)
+        self.tasks = {}
+        for label, comment in (('python-six-1.9.0-2.el7', 'Errata  Scan'),
+                               ('python-six-1.10.0-1.el7', None),
+                               ('/tmp/units-2.22-1.fc39.src.rpm', 'user scan of units'),
+                               ('six-1.0-1', 'see bug (1234)'),
+                               ('Refresh version cache', None)):
+            task = Task.objects.create(owner=template.owner, method='MockBuild', arch=template.arch,
+                                       channel=template.channel, label=label, comment=comment)
+            self.tasks[label] = task.id
+
+    def ids(self, *labels):
+        return sorted((self.tasks[label] for label in labels), reverse=True)
+
+    def test_index(self):
+        search = TaskSearch.objects.get(task=self.tasks['/tmp/units-2.22-1.fc39.src.rpm'])
+        self.assertEqual((search.nvr, search.package_name, search.comment),
+                         ('units-2.22-1.fc39', 'units', 'user scan of units'))
+        self.assertIsNone(TaskSearch.objects.get(task=self.tasks['Refresh version cache']).package_name)
+
+    def test_index_follows_changes(self):
+        task = Task.objects.get(id=self.tasks['six-1.0-1'])
+        task.label = 'six-1.1-1'
+        task.comment = 'Rebased'
+        task.save()
+        self.assertEqual(find_tasks(None, {'nvr': 'six-1.1-1'}), [task.id])
+        self.assertEqual(find_tasks(None, {'comment': 'rebased'}), [task.id])
+        self.assertEqual(find_tasks(None, {'nvr': 'six-1.0-1'}), [])
+
+    def test_index_writes_only_changes(self):
+        def index_writes(task):
+            with CaptureQueriesContext(connection) as ctx:
+                task.save()
+            return [q['sql'].split()[0] for q in ctx.captured_queries
+                    if 'scan_tasksearch' in q['sql'] and not q['sql'].startswith('SELECT')]
+
+        task = Task.objects.get(id=self.tasks['six-1.0-1'])
+        self.assertEqual(index_writes(task), [])
+        task.comment = 'Rebased'
+        self.assertEqual(index_writes(task), ['UPDATE'])
+
+    def test_find(self):
+        self.assertEqual(find_tasks(None, {'package_name': 'python-six'}),
+                         self.ids('python-six-1.9.0-2.el7', 'python-six-1.10.0-1.el7'))
+        self.assertEqual(find_tasks(None, {'package_name': 'six'}), self.ids('six-1.0-1'))
+        self.assertEqual(find_tasks(None, {'nvr': 'units-2.22-1.fc39'}),
+                         self.ids('/tmp/units-2.22-1.fc39.src.rpm'))
+        self.assertEqual(find_tasks(None, {'regex': r'six-1\.\d{2}\.'}), self.ids('python-six-1.10.0-1.el7'))
+        self.assertEqual(find_tasks(None, {'comment': 'errata scan'}), self.ids('python-six-1.9.0-2.el7'))
+        self.assertEqual(find_tasks(None, {'comment': r'bug \(\d+\)'}), self.ids('six-1.0-1'))
+        self.assertEqual(find_tasks(None, {'package_name': 'python-six', 'latest': True}),
+                         self.ids('python-six-1.10.0-1.el7'))
+
+
+class TasksInfoTestCase(TestCase):
+    def setUp(self):
+        call_command('loaddata', FIXTURE_PATH, verbosity=0)
+
+    def test_tasks_info(self):
+        with self.assertNumQueries(1):
+            infos = get_tasks_info(None, [1, 2, 12345])
+        self.assertEqual(infos, {'1': get_task_info(None, 1), '2': get_task_info(None, 2)})
+
+        with self.assertNumQueries(1):
+            infos = get_tasks_info(None, ['1'], ['state', 'args', 'unknown'])
+        task = Task.objects.get(id=1)
+        self.assertEqual(infos, {'1': {'state': task.state, 'args': task.args}})
+
+    def test_tasks_info_fields(self):
+        fields = list(TASK_INFO_FIELDS)
+        self.assertEqual(get_tasks_info(None, [1, 2], fields), get_tasks_info(None, [1, 2]))
+
+        # columns of fields which were not requested are not loaded
+        with CaptureQueriesContext(connection) as queries:
+            get_tasks_info(None, [1], ['state', 'is_failed', 'owner'])
+        self.assertNotIn('"result"', queries[0]['sql'])
+        self.assertIn('"username"', queries[0]['sql'])
+
+    def test_tasks_state(self):
+        with self.assertNumQueries(1):
+            states = get_tasks_state(None, [1, 2, 12345])
+        self.assertEqual(states, {str(task.id): task.state for task in Task.objects.filter(id__in=[1, 2])})
@@ -3,10 +3,42 @@
 
 """`osh.hub.scan` tests."""
 
-from django.test import TestCase
+import datetime
+import os
+import pathlib
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
 
+import koji
+import proton
+import proton.handlers
+import proton.reactor
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from osh.hub.scan import koji_cache
+from osh.hub.scan.apps import START_PUBLISHER_UID, start_publisher
+from osh.hub.scan.check import check_build, is_container_build
 from osh.hub.scan.compare import (CSS_CLASS_BASE, CSS_CLASS_OTHER,
                                   get_compare_title)
+from osh.hub.scan.messaging import Publisher
+from osh.hub.scan.mock import generate_mock_configs
+from osh.hub.scan.models import (REQUEST_STATES, AppSettings, BusMessage,
+                                 ETMapping, Package, ReleaseMapping, Scan, Tag,
+                                 release_resolver)
+from osh.hub.scan.scanner import handle_scans
+
+FIXTURE_PATH = pathlib.Path(__file__).parents[1] / 'waiving/fixtures/initial_test_data.json'
 
 
 class CompareTestSuite(TestCase):
@@ -259,3 +291,473 @@ class CompareTestSuite(TestCase):
                 f'<span class="{CSS_CLASS_BASE}">el8</span>'
             )
         )
+
+
+class FakeKojiSession:
+    """ koji session with a single build recording calls of its methods """
+    def __init__(self, server):
+        self.server = server
+        self.calls = []
+
+    def getBuild(self, nvr):
+        self.calls.append(('getBuild', nvr))
+        if nvr == 'units-2.22-1.fc39':
+            return {'nvr': nvr, 'task_id': 42, 'extra': None}
+        return None
+
+    def getTaskInfo(self, task_id, request=False):
+        self.calls.append(('getTaskInfo', task_id))
+        return {'id': task_id, 'method': 'build'}
+
+    def listTags(self, nvr):
+        self.calls.append(('listTags', nvr))
+        return []
+
+
+def fake_read_config(profile):
+    if profile != 'koji':
+        raise koji.ConfigurationError(f'no configuration for profile name: {profile}')
+    return {'server': 'https://koji.example.com/kojihub'}
+
+
+@patch('koji.ClientSession', FakeKojiSession)
+@patch('koji.read_config', fake_read_config)
+class KojiCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        koji_cache._local.__dict__.clear()
+        koji_cache.metadata_cache.clear()
+
+    def test_session_pool(self):
+        session = koji_cache.get_koji_session('koji')
+        self.assertIs(koji_cache.get_koji_session('koji'), session)
+        with self.assertRaises(koji.ConfigurationError):
+            koji_cache.get_koji_session('brew')
+
+        # every thread has its own session
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(koji_cache.get_koji_session('koji')))
+        thread.start()
+        thread.join()
+        self.assertIsNot(sessions[0], session)
+
+    def test_submission(self):
+        nvr = 'units-2.22-1.fc39'
+        for _ in range(3):
+            self.assertEqual(check_build(nvr)['koji_profile'], 'koji')
+            self.assertFalse(is_container_build(nvr, 'koji'))
+
+        session = koji_cache.get_koji_session('koji')
+        self.assertEqual(session.session.calls, [('getBuild', nvr), ('getTaskInfo', 42)])
+        self.assertEqual(koji_cache.get_cache_stats(), {'hits': 7, 'misses': 2, 'size': 2})
+
+        # missing builds and other methods are not cached
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                check_build('foo-1-1')
+            session.listTags(nvr)
+        self.assertEqual(session.session.calls[2:], [('getBuild', 'foo-1-1'), ('listTags', nvr)] * 2)
+
+    def test_lru_and_expiration(self):
+        cache = koji_cache.MetadataCache(maxsize=2, timeout=60)
+        for key in ('a', 'b', 'a', 'c'):
+            cache.get(key, lambda: key.upper())
+        self.assertEqual(list(cache.entries), ['a', 'c'])
+        self.assertEqual(cache.get_stats(), {'hits': 1, 'misses': 3, 'size': 2})
+
+        with patch('time.monotonic', return_value=koji_cache.time.monotonic() + 61):
+            self.assertEqual(cache.get('a', lambda: 'new'), 'new')
+        self.assertEqual(cache.get_stats()['misses'], 4)
+
+
+class FakeMultiCall:
+    """ koji multicall of FakeBuildKojiSession recorded as a single call """
+    def __init__(self, session):
+        self.session = session
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.session.calls.append(('multicall', self.count))
+
+    def getTaskInfo(self, task_id, request=False):
+        self.count += 1
+        return SimpleNamespace(result=self.session.tasks[task_id])
+
+
+class FakeBuildKojiSession:
+    """ koji session with a build of three arches recording calls of its methods """
+    tasks = {
+        '42': {'id': 42, 'method': 'build', 'request': ['git+https://src.example.com/units', 'f39-candidate', {}]},
+        '43': {'id': 43, 'method': 'buildSRPMFromSCM', 'request': ['git+https://src.example.com/units', 10, {}]},
+        '44': {'id': 44, 'method': 'buildArch', 'request': ['units.src.rpm', 10, 'x86_64', True, {}]},
+        '45': {'id': 45, 'method': 'buildArch', 'request': ['units.src.rpm', 10, 'aarch64', False, {}]},
+        '46': {'id': 46, 'method': 'buildArch', 'request': ['units.src.rpm', 10, 's390x', False, {}]},
+    }
+
+    def __init__(self, server):
+        self.calls = []
+
+    def __getattr__(self, name):
+        responses = {
+            'getBuild': {'nvr': 'units-2.22-1.fc39', 'task_id': 42, 'extra': None},
+            'getTaskDescendents': {task_id: [] for task_id in self.tasks},
+            'getBuildTarget': {'name': 'f39-candidate', 'build_tag_name': 'f39-build'},
+            'getTag': {'name': 'f39-build', 'arches': 'x86_64 aarch64 s390x'},
+            'getRepo': {'id': 1234},
+        }
+
+        def method(*args, **kwargs):
+            self.calls.append((name,) + args)
+            if name == 'getTaskInfo':
+                return self.tasks[str(args[0])]
+            return responses[name]
+        return method
+
+    def multicall(self, strict=False):
+        return FakeMultiCall(self)
+
+
+def fake_koji_mock_config(cmd, **kwargs):
+    arch = cmd[cmd.index('--arch') + 1]
+    config = f"config_opts['root'] = 'f39-build-{arch}'\n" \
+             f"[build]\nbaseurl=https://koji.example.com/repos/f39-build/latest/{arch}/\n"
+    return SimpleNamespace(stdout=config.encode())
+
+
+@patch('koji.ClientSession', FakeBuildKojiSession)
+@patch('koji.read_config', fake_read_config)
+class GenerateMockConfigsTestCase(SimpleTestCase):
+    def setUp(self):
+        koji_cache._local.__dict__.clear()
+        koji_cache.metadata_cache.clear()
+        cache.clear()
+
+    def generate(self):
+        tmpdir = generate_mock_configs('units-2.22-1.fc39', 'koji')
+        self.addCleanup(shutil.rmtree, tmpdir)
+        configs = {}
+        for name in os.listdir(tmpdir):
+            with open(os.path.join(tmpdir, name)) as f:
+                configs[name] = f.read()
+        return configs
+
+    @patch('subprocess.run', side_effect=fake_koji_mock_config)
+    def test_generate(self, fake_run):
+        configs = self.generate()
+        self.assertEqual(sorted(configs), ['mock-aarch64.cfg', 'mock-s390x.cfg', 'mock-x86_64.cfg'])
+        self.assertIn('/f39-build/latest/$basearch/', configs['mock-s390x.cfg'])
+        self.assertEqual(fake_run.call_count, 3)
+
+        # arches are discovered only once using a single multicall
+        calls = koji_cache.get_koji_session('koji').session.calls
+        self.assertEqual([call for call in calls if call[0] in ('getTaskDescendents', 'multicall')],
+                         [('getTaskDescendents', 42), ('multicall', 5)])
+
+        # configs of the same repo are reused, but each of them has its own root
+        again = self.generate()
+        self.assertEqual(fake_run.call_count, 3)
+        self.assertNotEqual(configs['mock-x86_64.cfg'], again['mock-x86_64.cfg'])
+
+    @patch('subprocess.run', side_effect=subprocess.CalledProcessError(1, 'koji'))
+    def test_failure(self, fake_run):
+        with self.assertRaises(subprocess.CalledProcessError):
+            generate_mock_configs('units-2.22-1.fc39', 'koji')
+
+
+class ReleaseResolverTestCase(TestCase):
+    def setUp(self):
+        call_command('loaddata', FIXTURE_PATH, verbosity=0)
+        release_resolver.invalidate()
+        ReleaseMapping.objects.all().delete()
+        ReleaseMapping.objects.create(release_tag=r'^RHEL-(\d+)\.(\d+)\.0$', template='RHEL-%s.%s', priority=2)
+        ReleaseMapping.objects.create(release_tag=r'^RHEL-(\d+)\.(\d+)', template='rhel-%s.%s', priority=1)
+
+    def test_resolve(self):
+        tag = Tag.objects.for_release_str('RHEL-5.1.0')
+        self.assertEqual((tag.id, tag.name), (3, 'RHEL-5.1'))
+
+        # steady state does not hit the database
+        with self.assertNumQueries(0):
+            self.assertEqual(Tag.objects.for_release_str('RHEL-5.1.0'), tag)
+            self.assertIsNot(Tag.objects.for_release_str('RHEL-5.1.0'), tag)
+            with self.assertRaises(RuntimeError):
+                Tag.objects.for_release_str('RHEL-5.99.0')
+
+    def test_invalidation(self):
+        self.assertEqual(Tag.objects.for_release_str('RHEL-5.0.0').name, 'RHEL-5.0')
+
+        # mapping with a higher priority
+        new = Tag.objects.create(name='rhel-5.0', mock_id=90, release_id=2)
+        self.assertEqual(Tag.objects.for_release_str('RHEL-5.0.0'), new)
+
+        # ambiguous tags are skipped
+        Tag.objects.create(name='rhel-5.0', mock_id=90, release_id=2)
+        self.assertEqual(Tag.objects.for_release_str('RHEL-5.0.0').name, 'RHEL-5.0')
+
+        ReleaseMapping.objects.all().delete()
+        with self.assertRaises(RuntimeError):
+            Tag.objects.for_release_str('RHEL-5.0.0')
+
+
+class FakeErrataKojiSession:
+    """ koji session with a few non-container builds recording calls """
+    builds = ['units-2.22-1.el9', 'foo-1.0-2.el9', 'kpatch-patch-1-1.el9', 'newpkg-1.0-1.el9',
+              'newpkg-1.0-2.el9']
+
+    def __init__(self, server):
+        self.calls = []
+
+    def call(self, name, *args, **kwargs):
+        if name == 'getBuild':
+            if args[0] not in self.builds:
+                return None
+            return {'nvr': args[0], 'task_id': 100 + self.builds.index(args[0]), 'extra': None}
+        return {'id': args[0], 'method': 'build'}
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            self.calls.append(name)
+            return self.call(name, *args, **kwargs)
+        return method
+
+    def multicall(self, strict=False):
+        session = self
+
+        class MultiCall:
+            def __enter__(self):
+                session.calls.append('multicall')
+                return self
+
+            def __exit__(self, *exc_info):
+                pass
+
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: SimpleNamespace(result=session.call(name, *args, **kwargs))
+        return MultiCall()
+
+
+@patch('koji.ClientSession', FakeErrataKojiSession)
+@patch('koji.read_config', fake_read_config)
+class HandleScansTestCase(TestCase):
+    def setUp(self):
+        call_command('loaddata', FIXTURE_PATH, verbosity=0)
+        AppSettings.objects.filter(key='SEND_BUS_MESSAGE').update(value='N')
+        koji_cache._local.__dict__.clear()
+        koji_cache.metadata_cache.clear()
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        task_dir = override_settings(TASK_DIR=tmpdir.name)
+        task_dir.enable()
+        self.addCleanup(task_dir.disable)
+
+    def kwargs(self, scan_id, target, base):
+        return {'id': scan_id, 'errata_id': 7, 'target': target, 'base': base,
+                'package_owner': 'admin', 'release': 'RHEL-9.0.0', 'rhel_version': 'RHEL-9.0.0',
+                'task_user': 'admin'}
+
+    def test_batch(self):
+        responses = handle_scans([
+            self.kwargs(1, 'units-2.22-1.el9', 'units-2.21-1.el9'),
+            self.kwargs(2, 'missing-1.0-1.el9', 'missing-0.9-1.el9'),
+            self.kwargs(3, 'kpatch-patch-1-1.el9', 'new_package'),
+            self.kwargs(4, 'foo-1.0-2.el9', 'foo-1.0-1.el9'),
+        ])
+
+        self.assertEqual([response['status'] for response in responses], ['OK', 'ERROR', 'INELIGIBLE', 'OK'])
+        self.assertIn("Build 'missing-1.0-1.el9' does not exist", responses[1]['message'])
+        for response in responses:
+            etm = ETMapping.objects.get(id=response['id'])
+            self.assertEqual(etm.state, REQUEST_STATES[response['status']])
+            self.assertEqual(etm.latest_run is not None, response['status'] == 'OK')
+
+        # failed builds do not leave any scans behind
+        self.assertEqual(sorted(Scan.objects.filter(nvr__endswith='.el9').values_list('nvr', flat=True)),
+                         ['foo-1.0-2.el9', 'units-2.22-1.el9'])
+
+        # builds and their tasks were fetched by multicalls, only the missing build is checked again
+        calls = koji_cache.get_koji_session('koji').session.calls
+        self.assertEqual(calls, ['multicall', 'multicall', 'getBuild'])
+
+    def test_failed_build_of_new_package(self):
+        # the first build fails after its package is looked up
+        with patch('osh.hub.scan.scanner.check_obsolete_scan', side_effect=[RuntimeError('boom'), None]):
+            responses = handle_scans([
+                self.kwargs(1, 'newpkg-1.0-1.el9', 'new_package'),
+                self.kwargs(2, 'newpkg-1.0-2.el9', 'new_package'),
+            ])
+
+        self.assertEqual([response['status'] for response in responses], ['ERROR', 'OK'])
+        scan = Scan.objects.get(nvr='newpkg-1.0-2.el9')
+        self.assertEqual(scan.package, Package.objects.get(name='newpkg'))
+        self.assertFalse(Scan.objects.filter(nvr='newpkg-1.0-1.el9').exists())
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.01)
+
+
+class LocalBroker(proton.handlers.MessagingHandler):
+    """ AMQP broker accepting all messages, running in its own thread """
+    def __init__(self):
+        super().__init__()
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            self.address = '127.0.0.1:%d' % sock.getsockname()[1]
+        self.url = 'amqp://' + self.address
+        self.messages = []
+        self.injector = proton.reactor.EventInjector()
+        self.listening = threading.Event()
+        self.container = proton.reactor.Container(self)
+        self.thread = threading.Thread(target=self.container.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self.listening.wait(10)
+
+    def stop(self):
+        self.injector.trigger(proton.reactor.ApplicationEvent('broker_stop'))
+        self.thread.join(10)
+
+    def on_start(self, event):
+        self.acceptor = event.container.listen(self.address)
+        event.container.selectable(self.injector)
+        self.listening.set()
+
+    def on_message(self, event):
+        self.messages.append((event.receiver.remote_target.address, event.message.body))
+
+    def on_broker_stop(self, event):
+        self.acceptor.close()
+        self.injector.close()
+        self.container.stop()
+
+
+class FakeOutbox:
+    def __init__(self, pending=(), errors=0):
+        self.pending = list(pending)
+        self.deleted = []
+        # number of calls failing with DatabaseError
+        self.errors = errors
+
+    def check_error(self):
+        if self.errors:
+            self.errors -= 1
+            raise DatabaseError('database is not available')
+
+    def claim(self, limit):
+        self.check_error()
+        claimed, self.pending = self.pending[:limit], self.pending[limit:]
+        return claimed
+
+    def delete_sent(self, ids):
+        self.check_error()
+        self.deleted.extend(ids)
+
+
+class PublisherTestCase(SimpleTestCase):
+    def setUp(self):
+        self.broker = LocalBroker()
+        self.broker.start()
+        self.addCleanup(self.broker.stop)
+
+    def create_publisher(self, outbox, **kwargs):
+        publisher = Publisher(outbox, [self.broker.url], **kwargs)
+        self.addCleanup(publisher.stop, 10)
+        return publisher
+
+    def message(self, message_id, key):
+        return SimpleNamespace(id=message_id, topic='topic://scan.' + key,
+                               body='{"scan_id": %d}' % message_id)
+
+    def test_publish(self):
+        # message left in the outbox by a previous run
+        outbox = FakeOutbox([self.message(1, 'finished')])
+        publisher = self.create_publisher(outbox, batch_size=2)
+        publisher.start()
+        self.assertTrue(publisher.publish([self.message(2, 'unfinished'), self.message(3, 'finished'),
+                                           self.message(4, 'finished')]))
+
+        wait_for(lambda: len(outbox.deleted) == 4)
+        self.assertEqual(sorted(outbox.deleted), [1, 2, 3, 4])
+        self.assertEqual(sorted(self.broker.messages), [
+            ('topic://scan.finished', '{"scan_id": 1}'),
+            ('topic://scan.finished', '{"scan_id": 3}'),
+            ('topic://scan.finished', '{"scan_id": 4}'),
+            ('topic://scan.unfinished', '{"scan_id": 2}'),
+        ])
+
+        stats = publisher.get_stats()
+        self.assertEqual((stats['sent'], stats['failed'], stats['dropped'], stats['queued']), (4, 0, 0, 0))
+        self.assertGreater(stats['latency_max'], 0)
+        self.assertLessEqual(stats['latency_avg'], stats['latency_max'])
+
+    def test_database_errors(self):
+        # claim() and the first delete_sent() fail
+        outbox = FakeOutbox([self.message(1, 'finished')], errors=2)
+        publisher = self.create_publisher(outbox, retry_delay=0.1)
+        publisher.start()
+        publisher.publish([self.message(2, 'finished')])
+        wait_for(lambda: len(self.broker.messages) == 2)
+
+        # the publisher keeps running and deletes the messages later
+        publisher.publish([self.message(3, 'finished')])
+        wait_for(lambda: len(outbox.deleted) == 3)
+        self.assertEqual(sorted(outbox.deleted), [1, 2, 3])
+        self.assertTrue(publisher.is_alive())
+
+    def test_full_queue(self):
+        outbox = FakeOutbox()
+        publisher = self.create_publisher(outbox, queue_size=1)
+        self.assertFalse(publisher.publish([self.message(1, 'finished'), self.message(2, 'finished')]))
+        self.assertEqual((publisher.get_stats()['queued'], publisher.get_stats()['dropped']), (1, 1))
+
+        # the dropped message is left in the outbox for the next claim()
+        publisher.start()
+        wait_for(lambda: outbox.deleted)
+        self.assertEqual(outbox.deleted, [1])
+        self.assertEqual(self.broker.messages, [('topic://scan.finished', '{"scan_id": 1}')])
+
+
+@override_settings(UMB_TOPIC_PREFIX=['topic://a.scan', 'topic://b.scan'], UMB_RETRY_DELAY=60)
+class BusMessageTestCase(TestCase):
+    def test_post(self):
+        with patch('osh.hub.scan.models.get_publisher') as get_publisher:
+            with self.captureOnCommitCallbacks(execute=True):
+                messages = BusMessage.objects.post({'scan_id': 1, 'scan_state': 'QUEUED'}, 'unfinished')
+                get_publisher.assert_not_called()
+        get_publisher.return_value.publish.assert_called_once_with(messages)
+
+        self.assertEqual(list(BusMessage.objects.order_by('id').values_list('topic', 'body')), [
+            ('topic://a.scan.unfinished', '{"scan_id": 1, "scan_state": "QUEUED"}'),
+            ('topic://b.scan.unfinished', '{"scan_id": 1, "scan_state": "QUEUED"}'),
+        ])
+
+    def test_start_publisher(self):
+        AppSettings.objects.update_or_create(key='SEND_BUS_MESSAGE', defaults={'value': 'Y'})
+        with patch('osh.hub.scan.messaging.get_publisher') as get_publisher:
+            request_started.connect(start_publisher, dispatch_uid=START_PUBLISHER_UID)
+            request_started.send(sender=None)
+            request_started.send(sender=None)
+        # messages left in the outbox are sent once the first request comes
+        get_publisher.assert_called_once_with(BusMessage.objects)
+
+    def test_claim(self):
+        now = timezone.now()
+        for delay in (-120, -60, 30):
+            BusMessage.objects.create(topic='topic://a.scan.finished', body='{}',
+                                      locked_until=now + datetime.timedelta(seconds=delay))
+
+        claimed = BusMessage.objects.claim(limit=10)
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(BusMessage.objects.claim(limit=10), [])
+        self.assertEqual(sorted(BusMessage.objects.values_list('attempts', flat=True)), [0, 1, 1])
+
+        BusMessage.objects.delete_sent([message.id for message in claimed])
+        self.assertEqual(BusMessage.objects.count(), 1)
@@ -0,0 +1,342 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""`osh.hub.service` tests."""
+
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from osh.hub.service import processing
+from osh.hub.service.csmock_parser import CsmockAPI, JSONStreamReader
+from osh.hub.service.loading import get_defect_stats
+from osh.hub.service.tarball import extract_tarball, path_matches
+
+SCAN = {
+    "analyzer-version-gcc": "12.3.1",
+    "analyzer-version-shellcheck": "0.8.0",
+    "cov-lines-processed": 1234,
+    "tool": "csmock",
+}
+
+DEFECTS = [
+    {
+        "checker": "COMPILER_WARNING" if i % 3 else "SHELLCHECK_WARNING",
+        "key_event_idx": 0,
+        "events": [{
+            "file_name": "src/file%d.c" % i,
+            "line": i,
+            "event": "warning",
+            "message": "message with \"quotes\", [brackets] and {braces} " * (i % 5),
+            "verbosity_level": 0,
+        }],
+    }
+    for i in range(200)
+]
+
+
+class JSONStreamReaderTestSuite(SimpleTestCase):
+    def read(self, text, chunk_size=7):
+        reader = JSONStreamReader(io.StringIO(text))
+        reader.CHUNK_SIZE = chunk_size
+        items = []
+        for key, value in reader.iter_items(streamed=('defects',)):
+            if key == 'defects':
+                value = list(value)
+            items.append((key, value))
+        return items
+
+    def test_small_chunks(self):
+        data = {"scan": SCAN, "defects": DEFECTS, "number": 123456789}
+        items = self.read(json.dumps(data, indent=4))
+        self.assertEqual(dict(items), data)
+
+    def test_compact_and_empty(self):
+        self.assertEqual(self.read('{}'), [])
+        self.assertEqual(self.read('{"defects":[],"n":1.5e3}'),
+                         [('defects', []), ('n', 1500.0)])
+
+    def test_skip_unconsumed_items(self):
+        reader = JSONStreamReader(io.StringIO(json.dumps({"defects": DEFECTS, "scan": SCAN})))
+        reader.CHUNK_SIZE = 16
+        keys = [key for key, _ in reader.iter_items(streamed=('defects',))]
+        self.assertEqual(keys, ['defects', 'scan'])
+
+    def test_short_reads(self):
+        class ShortReader(io.StringIO):
+            """ return 1-3 characters from every read() """
+            calls = 0
+
+            def read(self, size=-1):
+                self.calls += 1
+                return super().read(self.calls % 3 + 1)
+
+        data = {"scan": SCAN, "defects": DEFECTS,
+                "numbers": [1.5, 12345, -2.5e-3, 1E10, 0, 1000000.25, True, None]}
+        for indent in (None, 1):
+            reader = JSONStreamReader(ShortReader(json.dumps(data, indent=indent)))
+            items = {key: list(value) if key == 'defects' else value
+                     for key, value in reader.iter_items(streamed=('defects',))}
+            self.assertEqual(items, data)
+
+    def test_invalid(self):
+        for text in ('[]', '{"defects": [1 2]}', '{"defects": [1,'):
+            with self.assertRaises(ValueError):
+                self.read(text)
+
+
+class CsmockAPITestSuite(SimpleTestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.js')
+        with os.fdopen(fd, 'w') as f:
+            # put defects first to make sure metadata are found anyway
+            json.dump({"defects": DEFECTS, "scan": SCAN}, f)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_iter_defects(self):
+        api = CsmockAPI(self.path)
+        self.assertEqual(list(api.iter_defects()), DEFECTS)
+        self.assertEqual(api.get_scan_metadata(), SCAN)
+
+    def test_missing_defects(self):
+        with open(self.path, 'w') as f:
+            json.dump({"scan": SCAN}, f)
+        with self.assertRaises(KeyError):
+            list(CsmockAPI(self.path).iter_defects())
+
+    def test_scan_metadata(self):
+        api = CsmockAPI(self.path)
+        self.assertEqual(api.get_scan_metadata(), SCAN)
+        self.assertEqual(sorted(a['name'] for a in api.get_analyzers()),
+                         ['gcc', 'shellcheck'])
+
+    def test_defect_stats(self):
+        stats = get_defect_stats(CsmockAPI(self.path).iter_defects())
+        self.assertEqual(stats, {'COMPILER_WARNING': 133, 'SHELLCHECK_WARNING': 67})
+
+
+class ExtractTarballTestSuite(SimpleTestCase):
+    MEMBERS = {
+        'nvr/scan-results.js': b'{"defects": []}',
+        'nvr/scan-results-summary.txt': b'summary',
+        'nvr/debug/raw.log': b'debug',
+        'nvr/raw-results/cov/emit.data': b'x' * 1000,
+        'nvr/raw-results/file.cov': b'cov',
+        'nvr/raw-results/notcov.txt': b'log',
+        '../evil.txt': b'evil',
+    }
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.tarball = os.path.join(self.tmpdir, 'nvr.tar.xz')
+        with tarfile.open(self.tarball, 'w:xz') as tar:
+            for name, data in self.MEMBERS.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        self.output = os.path.join(self.tmpdir, 'out')
+        os.mkdir(self.output)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def extracted(self):
+        return sorted(os.path.relpath(os.path.join(root, f), self.output)
+                      for root, _, files in os.walk(self.output) for f in files)
+
+    def test_path_matches(self):
+        self.assertTrue(path_matches('nvr/debug/raw.log', ['*debug']))
+        self.assertTrue(path_matches('nvr/raw-results/cov/emit.data', ['*cov']))
+        self.assertTrue(path_matches('nvr/raw-results/file.cov', ['*cov']))
+        self.assertFalse(path_matches('nvr/raw-results/notcov.txt', ['*cov']))
+        self.assertFalse(path_matches('nvr/scan-results.js', []))
+
+    def test_exclude(self):
+        files, size = extract_tarball(self.tarball, self.output, ['*cov', '*debug'])
+        self.assertEqual(self.extracted(), ['nvr/raw-results/notcov.txt',
+                                            'nvr/scan-results-summary.txt',
+                                            'nvr/scan-results.js'])
+        self.assertEqual((files, size), (3, 25))
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'evil.txt')))
+
+    def test_include(self):
+        extract_tarball(self.tarball, self.output, include_patterns=['*/scan-results.js'])
+        self.assertEqual(self.extracted(), ['nvr/scan-results.js'])
+
+
+def make_defect(checker, path, message):
+    return {"checker": checker, "key_event_idx": 0,
+            "events": [{"file_name": path, "line": 1, "event": "warning", "message": message}]}
+
+
+# src/moved.c moves to lib/moved.c, which csdiff -z does not consider a change
+BASE_SCAN = {"scan": SCAN, "defects": [
+    make_defect("COMPILER_WARNING", "pkg-1.0/src/moved.c", "unused variable"),
+    make_defect("COMPILER_WARNING", "pkg-1.0/src/fixed.c", "null dereference"),
+]}
+TARGET_SCAN = {"scan": SCAN, "defects": [
+    make_defect("COMPILER_WARNING", "pkg-1.1/lib/moved.c", "unused variable"),
+    make_defect("SHELLCHECK_WARNING", "pkg-1.1/src/added.sh", "quote this"),
+]}
+
+
+def fake_diff_scans(old_json, new_json):
+    """ csdiff matching defects by checker, path and message """
+    def key(defect):
+        return defect['checker'], defect['events'][0]['file_name'], defect['events'][0]['message']
+    old = {key(d) for d in json.loads(old_json)['defects']}
+    new = json.loads(new_json)
+    return json.dumps({"scan": new['scan'], "defects": [d for d in new['defects'] if key(d) not in old]})
+
+
+class DiffTestSuite(SimpleTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.base = self.write('base.js', BASE_SCAN)
+        self.target = self.write('target.js', TARGET_SCAN)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        return path
+
+    def read(self, name):
+        with open(os.path.join(self.tmpdir, name)) as f:
+            data = json.load(f)
+        return data['scan']['title'], [(d['checker'], d['events'][0]['file_name']) for d in data['defects']]
+
+    def diff_in_process(self):
+        processing.pycsdiff_diff(self.base, self.target, os.path.join(self.tmpdir, 'added.js'),
+                                 os.path.join(self.tmpdir, 'fixed.js'))
+        return self.read('added.js'), self.read('fixed.js')
+
+    def diff_csdiff(self):
+        added = os.path.join(self.tmpdir, 'added.js')
+        fixed = os.path.join(self.tmpdir, 'fixed.js')
+        self.assertTrue(processing.csdiff_new_defects(self.base, self.target, added, self.tmpdir))
+        self.assertTrue(processing.csdiff_fixed_defects(self.base, self.target, fixed, self.tmpdir))
+        processing.add_title_to_json(added, processing.ADDED_TITLE)
+        processing.add_title_to_json(fixed, processing.FIXED_TITLE)
+        return self.read('added.js'), self.read('fixed.js')
+
+    @patch('osh.hub.service.processing.pycsdiff', SimpleNamespace(diff_scans=fake_diff_scans))
+    def test_paths_are_ignored(self):
+        added, fixed = self.diff_in_process()
+        # defects keep their full paths
+        self.assertEqual(added, (processing.ADDED_TITLE, [("SHELLCHECK_WARNING", "pkg-1.1/src/added.sh")]))
+        self.assertEqual(fixed, (processing.FIXED_TITLE, [("COMPILER_WARNING", "pkg-1.0/src/fixed.c")]))
+
+    @unittest.skipUnless(shutil.which('csdiff') and hasattr(processing.pycsdiff, 'diff_scans'),
+                         'csdiff and pycsdiff are needed')
+    def test_engines_are_equivalent(self):
+        self.assertEqual(self.diff_in_process(), self.diff_csdiff())
+
+
+class FakeExecutor:
+    def __init__(self, run=False):
+        self.run = run
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(os.path.basename(args[-1]))
+        if self.run:
+            fn(*args)
+
+
+def fake_render(succ):
+    def render(input_file, output_file, workdir):
+        if succ:
+            with open(output_file, 'w') as f:
+                f.write('rendered')
+        return succ
+    return render
+
+
+class DiffArtifactsTestSuite(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        task_dir = override_settings(TASK_DIR=tmpdir)
+        task_dir.enable()
+        self.addCleanup(task_dir.disable)
+
+        self.task = SimpleNamespace(id=1)
+        self.paths = processing.TaskResultPaths(self.task)
+        for path in (self.paths.get_json_added(), self.paths.get_json_fixed()):
+            with open(path, 'w') as f:
+                json.dump({"scan": SCAN, "defects": []}, f)
+        self.names = [os.path.basename(output) for _, output in self.paths.get_diff_artifacts()]
+
+    def schedule(self, executor):
+        with patch('osh.hub.service.processing._get_artifacts_executor', return_value=executor):
+            return processing.schedule_diff_artifacts(self.task)
+
+    def states(self):
+        status = processing.get_diff_artifacts_status(self.paths)
+        return {name: (entry['state'], entry['failures']) for name, entry in status.items()}
+
+    def age_entries(self, seconds):
+        status = processing.get_diff_artifacts_status(self.paths)
+        for entry in status.values():
+            entry['updated'] -= seconds
+        processing._write_json_atomically(status, self.paths.get_diff_artifacts_status())
+
+    def test_schedule(self):
+        executor = FakeExecutor()
+        self.assertEqual(self.schedule(executor), self.names)
+        self.assertEqual(executor.submitted, self.names)
+        self.assertEqual(self.states(), {name: ('PENDING', 0) for name in self.names})
+
+        # artifacts being rendered are not scheduled again
+        executor = FakeExecutor()
+        self.assertEqual(self.schedule(executor), self.names)
+        self.assertEqual(executor.submitted, [])
+
+    def test_pending_timeout(self):
+        self.schedule(FakeExecutor())
+        self.age_entries(processing.ARTIFACT_PENDING_TIMEOUT + 1)
+
+        executor = FakeExecutor()
+        self.assertEqual(self.schedule(executor), self.names)
+        self.assertEqual(executor.submitted, self.names)
+
+    @patch('osh.hub.service.processing.cshtml', fake_render(True))
+    def test_ready_and_failed(self):
+        with patch('osh.hub.service.processing.csgrep_err', fake_render(False)):
+            self.schedule(FakeExecutor(run=True))
+        html = [name for name in self.names if name.endswith('.html')]
+        txt = [name for name in self.names if name not in html]
+        self.assertEqual(self.states(), dict([(name, ('READY', 0)) for name in html]
+                                             + [(name, ('FAILED', 1)) for name in txt]))
+        self.assertTrue(all(os.path.exists(os.path.join(self.paths.task_dir, name)) for name in html))
+
+        # failed rendering is not retried too early
+        executor = FakeExecutor()
+        self.assertEqual(self.schedule(executor), [])
+        self.assertEqual(executor.submitted, [])
+
+        # the delay doubles with each failure
+        self.age_entries(processing.ARTIFACT_RETRY_DELAY + 1)
+        with patch('osh.hub.service.processing.csgrep_err', fake_render(False)):
+            self.assertEqual(self.schedule(FakeExecutor(run=True)), txt)
+        self.assertEqual(self.states()[txt[0]], ('FAILED', 2))
+        self.age_entries(processing.ARTIFACT_RETRY_DELAY + 1)
+        self.assertEqual(self.schedule(FakeExecutor()), [])
+
+        self.age_entries(processing.ARTIFACT_RETRY_DELAY)
+        with patch('osh.hub.service.processing.csgrep_err', fake_render(True)):
+            self.assertEqual(self.schedule(FakeExecutor(run=True)), txt)
+        self.assertEqual(self.states(), {name: ('READY', 0) for name in self.names})
+        self.assertEqual(self.schedule(FakeExecutor()), [])
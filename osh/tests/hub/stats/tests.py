@@ -0,0 +1,235 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""`osh.hub.stats` tests."""
+
+import datetime
+import pathlib
+import time
+
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from kobo.client.constants import TASK_STATES
+from kobo.hub.models import Task
+
+from osh.hub.scan.models import (SCAN_STATES, SCAN_TYPES, Package, Scan,
+                                 ScanBinding, SystemRelease, Tag)
+from osh.hub.stats import stattypes
+from osh.hub.stats.incremental import (get_incremental_stats, get_stat_values,
+                                       update_contributions)
+from osh.hub.stats.models import StatContribution, StatResults, StatType
+from osh.hub.stats.service import (StatResultsWriter, StatTimeBudgetExceeded,
+                                   compute_stat, create_stat_type,
+                                   get_latest_values, get_mapping,
+                                   get_time_series, update)
+from osh.hub.stats.views import GRAPH_POINTS
+from osh.hub.waiving.models import Result
+
+FIXTURE_PATH = pathlib.Path(__file__).parents[1] / 'waiving/fixtures/initial_test_data.json'
+
+
+class StatsTestCase(TestCase):
+    def setUp(self):
+        call_command('loaddata', FIXTURE_PATH, verbosity=0)
+        self.template_task = Task.objects.get(id=1)
+        self.date = datetime.datetime(2023, 1, 1)
+
+    def create_scan(self, package, tag_id, scan_type, new, fixed, task_state=TASK_STATES['CLOSED']):
+        scan = Scan.objects.create(nvr='%s-1-1' % package.name, scan_type=SCAN_TYPES[scan_type],
+                                   state=SCAN_STATES['NEEDS_INSPECTION'],
+                                   tag=Tag.objects.get(id=tag_id), package=package,
+                                   username=self.template_task.owner)
+        task = Task.objects.create(owner=self.template_task.owner, method='ErrataDiffBuild',
+                                   arch=self.template_task.arch,
+                                   channel=self.template_task.channel,
+                                   state=task_state, label=scan.nvr)
+        self.date += datetime.timedelta(days=1)
+        result = Result.objects.create(new_defects=new, fixed_defects=fixed,
+                                       previously_waived_defects=0, total_defects=new + fixed)
+        Result.objects.filter(id=result.id).update(date_submitted=self.date)
+        return ScanBinding.objects.create(scan=scan, task=task, result=result)
+
+
+class GroupedStatsTestCase(StatsTestCase):
+    def test_by_release(self):
+        foo = Package.objects.create(name='foo')
+        self.create_scan(foo, 23, 'REBASE', 8, 0)
+        self.create_scan(foo, 24, 'NEWPKG', 3, 1)
+        self.create_scan(foo, 32, 'REBASE', 2, 3)
+        SystemRelease.objects.filter(id=24).update(active=True)
+        releases = SystemRelease.objects.filter(active=True)
+
+        with self.assertNumQueries(2):
+            scans = stattypes.get_scans_by_release()
+        self.assertEqual(scans, {r: Scan.objects.enabled().target().by_release(r).count()
+                                 for r in releases})
+        self.assertEqual(scans[SystemRelease.objects.get(id=32)], 2)
+
+        with self.assertNumQueries(2):
+            rebases = stattypes.get_rebases_count_by_release()
+        self.assertEqual(rebases, {r: Scan.objects.rebases().by_release(r).count()
+                                   for r in releases})
+
+
+class IncrementalStatsTestCase(StatsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.stats = get_incremental_stats(get_mapping())
+        for key, func in self.stats.items():
+            create_stat_type(key, func)
+
+    def assertEquivalent(self):
+        update_contributions(self.stats)
+        for key, func in self.stats.items():
+            self.assertEqual(get_stat_values(key, func), func(), key)
+
+    def test_equivalence(self):
+        six = Package.objects.get(name='python-six')
+        foo = Package.objects.create(name='foo')
+
+        # tags 23 and 24 belong to RHEL-6.7 and its child release RHEL-6.8
+        self.create_scan(six, 23, 'ERRATA', 10, 2)
+        self.create_scan(six, 23, 'ERRATA', 4, 5)
+        self.create_scan(foo, 23, 'REBASE', 8, 0)
+        self.create_scan(foo, 24, 'NEWPKG', 3, 1)
+        self.assertEquivalent()
+        self.assertTrue(StatContribution.objects.exclude(value=0).exists())
+
+        # new scans, changed results and unfinished scans are processed next time
+        self.create_scan(foo, 24, 'REBASE', 1, 7)
+        self.create_scan(foo, 23, 'REBASE', 2, 6)
+        pending = self.create_scan(six, 23, 'ERRATA', 1, 1, task_state=TASK_STATES['OPEN'])
+        self.assertEquivalent()
+
+        Task.objects.filter(id=pending.task_id).update(state=TASK_STATES['CLOSED'])
+        Result.objects.filter(id=pending.result_id).update(new_defects=0)
+        self.assertEquivalent()
+
+        # nothing is processed when nothing changed
+        self.assertEqual(update_contributions(self.stats), 0)
+
+    def test_full_recompute(self):
+        foo = Package.objects.create(name='foo')
+        self.create_scan(foo, 23, 'REBASE', 8, 0)
+        sb = self.create_scan(foo, 23, 'REBASE', 2, 3)
+        self.assertEquivalent()
+
+        # changes outside of the tracked models need full recomputation
+        Scan.objects.filter(id=sb.scan_id).update(enabled=False)
+        update_contributions(self.stats, full=True)
+        for key, func in self.stats.items():
+            self.assertEqual(get_stat_values(key, func), func(), key)
+
+
+@override_settings(STATS_WORKERS=1)
+class UpdateTestCase(StatsTestCase):
+    def test_timings(self):
+        self.create_scan(Package.objects.create(name='foo'), 23, 'REBASE', 8, 0)
+        update()
+        self.assertFalse(StatType.objects.filter(duration__isnull=True).exists())
+        self.assertEqual(StatType.objects.get(key='SCANS_BY_RELEASE').queries, 2)
+        self.assertEqual(StatResults.objects.get(stat__key='TOTAL_SCANS').value, 2)
+
+    @override_settings(STATS_TIME_BUDGET=0.05)
+    def test_time_budget_covers_whole_stat(self):
+        def slow_stat():
+            for _ in range(3):
+                Scan.objects.count()
+                time.sleep(0.03)
+
+        with self.assertRaises(StatTimeBudgetExceeded):
+            compute_stat('SLOW', slow_stat)
+
+        # a single query of each stat fits in the budget
+        self.assertEqual(compute_stat('TOTAL_SCANS', stattypes.get_total_scans)[2], 1)
+
+    def test_only_changed_results_are_stored(self):
+        update()
+        last_id = StatResults.objects.latest('id').id
+
+        self.create_scan(Package.objects.create(name='foo'), 23, 'REBASE', 8, 0)
+        with self.assertNumQueries(2):
+            writer = StatResultsWriter()
+        writer.add('TOTAL_SCANS', 2)
+        writer.add('BUSY_MINUTES', 0)
+        with self.assertNumQueries(1):
+            writer.write()
+
+        self.assertEqual(list(StatResults.objects.filter(id__gt=last_id)
+                              .values_list('stat__key', 'value')), [('TOTAL_SCANS', 2)])
+
+
+class TimeSeriesTestCase(TestCase):
+    def setUp(self):
+        self.stat_type = StatType.objects.create(key='TOTAL_SCANS', short_comment='Scans',
+                                                 comment='Scans', group='SCANS', order=1,
+                                                 is_release_specific=False)
+        for date, value in (('2023-01-01 01:00', 1), ('2023-01-01 02:00', 5),
+                            ('2023-01-02 01:00', 3), ('2023-02-10 01:00', 4)):
+            self.add_result(date, value)
+
+    def add_result(self, date, value):
+        result = StatResults.objects.create(stat=self.stat_type, value=value)
+        StatResults.objects.filter(id=result.id).update(
+            date=datetime.datetime.strptime(date, '%Y-%m-%d %H:%M'))
+
+    def series(self, **kwargs):
+        series = get_time_series(self.stat_type, **kwargs)
+        return [(t.strftime('%Y-%m-%d'), v) for t, v in zip(series['t'], series['v'])]
+
+    def test_buckets(self):
+        self.assertEqual(self.series(), [('2023-01-01', 5), ('2023-01-02', 3), ('2023-02-10', 4)])
+        self.assertEqual(self.series(bucket='month'), [('2023-01-01', 3), ('2023-02-01', 4)])
+        self.assertEqual(self.series(bucket='month', aggregate='max'),
+                         [('2023-01-01', 5), ('2023-02-01', 4)])
+        self.assertEqual(self.series(bucket='month', aggregate='avg'),
+                         [('2023-01-01', 3), ('2023-02-01', 4)])
+        self.assertEqual(self.series(since=datetime.date(2023, 1, 2), until=datetime.date(2023, 1, 31)),
+                         [('2023-01-02', 3)])
+
+    def test_cache_invalidation(self):
+        self.series(bucket='month')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.series(bucket='month'), [('2023-01-01', 3), ('2023-02-01', 4)])
+
+        self.add_result('2023-02-11 01:00', 7)
+        self.assertEqual(self.series(bucket='month'), [('2023-01-01', 3), ('2023-02-01', 7)])
+
+    def test_graph(self):
+        client = Client()
+        url = reverse('stats/detail/graph', args=[self.stat_type.id])
+        response = client.get(url + '?bucket=month&aggregate=max')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['x'], data['y']), (['2023-01-01', '2023-02-01'], [5, 4]))
+
+        response = client.get(url + '?bucket=year')
+        self.assertEqual(response.status_code, 400)
+        response = client.get(reverse('stats/detail', args=[self.stat_type.id]) + '?bucket=year')
+        self.assertEqual(response.status_code, 400)
+
+    def test_graph_limit(self):
+        client = Client()
+        url = reverse('stats/detail/graph', args=[self.stat_type.id])
+        for day in range(3, 23):
+            self.add_result('2023-03-%02d 01:00' % day, day)
+
+        data = client.get(url + '?bucket=day').json()
+        self.assertEqual(len(data['x']), GRAPH_POINTS)
+        self.assertEqual(data['x'][-1], '2023-03-22')
+        self.assertEqual(len(client.get(url + '?bucket=day&limit=2').json()['y']), 2)
+        self.assertEqual(len(client.get(url + '?bucket=day&since=2023-01-01').json()['y']), 23)
+        self.assertEqual(client.get(url + '?limit=0').status_code, 400)
+
+    def test_latest_values(self):
+        release = SystemRelease.objects.create(tag='rhel-9.3', product='RHEL 9', release=3)
+        other = StatType.objects.create(key='SCANS_BY_RELEASE', short_comment='Scans',
+                                        comment='Scans', group='SCANS', order=1,
+                                        is_release_specific=True)
+        StatResults.objects.create(stat=other, release=release, value=10)
+        StatResults.objects.create(stat=other, release=release, value=12)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_latest_values(), {self.stat_type.id: 4})
+        self.assertEqual(get_latest_values(release), {other.id: 12})
@@ -1,10 +1,26 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
+import io
 import pathlib
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from osh.hub.scan.models import ScanBinding
+from osh.hub.waiving.models import (DEFECT_STATES, RESULT_GROUP_STATES,
+                                    WAIVER_TYPES, Checker, CheckerGroup,
+                                    Defect, LatestWaiver, Result, ResultGroup,
+                                    Waiver)
+from osh.hub.waiving.service import (compare_result_groups, defect_fingerprint,
+                                     get_last_waiver, get_last_waivers,
+                                     result_group_digest)
+from osh.hub.waiving.views import get_waiving_data
+
+FIXTURE_PATH = pathlib.Path(__file__).parent.absolute() / 'fixtures/initial_test_data.json'
 
 
 class BasicWebTestCase(TestCase):
@@ -13,8 +29,7 @@ class BasicWebTestCase(TestCase):
     """
 
     def setUp(self):
-        fixture_path = pathlib.Path(__file__).parent.absolute() / 'fixtures/initial_test_data.json'
-        call_command('loaddata', fixture_path, verbosity=0)
+        call_command('loaddata', FIXTURE_PATH, verbosity=0)
         self.client = Client()
 
     def test_scans_list(self):
@@ -52,3 +67,155 @@ class BasicWebTestCase(TestCase):
     def test_mockconfs_list(self):
         r = self.client.get('/scan/mock/')
         self.assertEqual(r.status_code, 200)
+
+
+class DefectsCountersTestCase(TestCase):
+    def setUp(self):
+        self.result = Result.objects.create()
+        group = CheckerGroup.objects.create(name='Group')
+        checker = Checker.objects.create(name='CHECKER', group=group)
+        self.rgs = {}
+        for defect_type, count in (('NEW', 3), ('FIXED', 2)):
+            rg = ResultGroup.objects.create(result=self.result, checker_group=group,
+                                            defect_type=DEFECT_STATES[defect_type])
+            Defect.objects.bulk_create(
+                Defect(checker=checker, result_group=rg, key_event=0, state=rg.defect_type)
+                for _ in range(count))
+            self.rgs[defect_type] = rg
+
+    def test_backfill(self):
+        self.assertIsNone(self.result.total_defects)
+        call_command('backfill_defect_counters', stdout=io.StringIO())
+
+        self.result.refresh_from_db()
+        self.assertEqual(self.result.new_defects, 3)
+        self.assertEqual(self.result.fixed_defects, 2)
+        self.assertEqual(self.result.previously_waived_defects, 0)
+        self.assertEqual(self.result.total_defects, 5)
+
+        rg = ResultGroup.objects.get(id=self.rgs['NEW'].id)
+        with self.assertNumQueries(0):
+            self.assertEqual(rg.defects_count, 3)
+            self.assertEqual(self.result.new_defects_count(), 3)
+
+    def test_defect_type_change(self):
+        rg = self.rgs['NEW']
+        rg.defect_type = DEFECT_STATES['PREVIOUSLY_WAIVED']
+        rg.save()
+        self.result.update_defects_counters()
+
+        self.assertEqual(self.result.new_defects_count(), 0)
+        self.assertEqual(self.result.get_defects_count(DEFECT_STATES['PREVIOUSLY_WAIVED']), 3)
+
+
+class WaivingDataTestCase(TestCase):
+    DEFECT_TYPES = [
+        DEFECT_STATES['NEW'],
+        DEFECT_STATES['FIXED'],
+        DEFECT_STATES['PREVIOUSLY_WAIVED'],
+    ]
+
+    def create_result(self, groups_count):
+        result = Result.objects.create()
+        user = get_user_model().objects.create(username='user%d' % groups_count)
+        for i in range(groups_count):
+            group = CheckerGroup.objects.create(name='Group %d/%d' % (groups_count, i))
+            checker = Checker.objects.create(name='CHECKER_%d_%d' % (groups_count, i), group=group)
+            rgs = {}
+            for defect_type, state in (('NEW', 'WAIVED'), ('FIXED', 'INFO')):
+                rg = ResultGroup.objects.create(result=result, checker_group=group,
+                                                defect_type=DEFECT_STATES[defect_type],
+                                                state=RESULT_GROUP_STATES[state])
+                Defect.objects.create(checker=checker, result_group=rg, key_event=0,
+                                      state=rg.defect_type)
+                rgs[defect_type] = rg
+            Waiver.objects.create(result_group=rgs['NEW'], user=user, message='waived', is_active=True,
+                                  state=WAIVER_TYPES['NOT_A_BUG'])
+        return result
+
+    def count_queries(self, result):
+        with CaptureQueriesContext(connection) as ctx:
+            data = get_waiving_data(result, self.DEFECT_TYPES)
+        return len(ctx.captured_queries), data
+
+    def test_constant_number_of_queries(self):
+        small_count, _ = self.count_queries(self.create_result(2))
+        result = self.create_result(20)
+        large_count, data = self.count_queries(result)
+        self.assertEqual(small_count, large_count)
+
+        output, count = data[DEFECT_STATES['NEW']]
+        self.assertEqual(count, 20)
+        self.assertEqual(sum(1 for value in output.values() if value), 20)
+
+        # precomputed counters save the query counting defects
+        call_command('backfill_defect_counters', stdout=io.StringIO())
+        result.refresh_from_db()
+        precomputed_count, _ = self.count_queries(result)
+        self.assertEqual(precomputed_count, large_count - 1)
+
+
+class LatestWaiverTestCase(TestCase):
+    def setUp(self):
+        call_command('loaddata', FIXTURE_PATH, verbosity=0)
+        self.sb = ScanBinding.objects.get(id=1)
+        self.sb.result = Result.objects.create()
+        self.sb.save()
+        self.package = self.sb.scan.package
+        self.release = self.sb.scan.tag.release
+        self.group = CheckerGroup.objects.create(name='Group')
+        self.rg = ResultGroup.objects.create(result=self.sb.result, checker_group=self.group,
+                                             defect_type=DEFECT_STATES['NEW'],
+                                             state=RESULT_GROUP_STATES['WAIVED'])
+
+    def waive(self, message):
+        return Waiver.objects.create(result_group=self.rg, user=self.sb.scan.username,
+                                     message=message, is_active=True,
+                                     state=WAIVER_TYPES['NOT_A_BUG'])
+
+    def test_index_is_maintained(self):
+        first = self.waive('first')
+        second = self.waive('second')
+        self.assertEqual(LatestWaiver.objects.get().waiver, second)
+        self.assertEqual(get_last_waiver(self.group, self.package, self.release), second)
+
+        second.is_deleted = True
+        second.save()
+        self.assertEqual(get_last_waiver(self.group, self.package, self.release), first)
+
+        first.delete()
+        self.assertFalse(LatestWaiver.objects.exists())
+        self.assertIsNone(get_last_waiver(self.group, self.package, self.release))
+
+    def test_batch_lookup(self):
+        waiver = self.waive('waived')
+        self.assertEqual(get_last_waivers(self.sb.result, [self.group.id]),
+                         {self.group.id: waiver})
+        self.assertEqual(get_last_waivers(self.sb.result, []), {})
+
+
+class FingerprintTestCase(SimpleTestCase):
+    def defect(self, line, message='unused variable'):
+        events = [{'file_name': 'src/main.c', 'line': line, 'column': 3,
+                   'event': 'warning', 'message': message, 'verbosity_level': 0}]
+        return Defect(checker=Checker(name='COMPILER_WARNING'), function='main',
+                      key_event=0, events=events)
+
+    def test_fingerprint_ignores_lines(self):
+        self.assertEqual(defect_fingerprint(self.defect(1)), defect_fingerprint(self.defect(42)))
+        self.assertNotEqual(defect_fingerprint(self.defect(1)),
+                            defect_fingerprint(self.defect(1, 'unused function')))
+
+    def test_digest_ignores_order(self):
+        fingerprints = [defect_fingerprint(self.defect(1, m)) for m in 'abc']
+        self.assertEqual(result_group_digest(fingerprints),
+                         result_group_digest(fingerprints[::-1]))
+        self.assertNotEqual(result_group_digest(fingerprints),
+                            result_group_digest(fingerprints[:2]))
+
+    def test_equal_digests_skip_csdiff(self):
+        digest = result_group_digest([defect_fingerprint(self.defect(1))])
+        rgs = [ResultGroup(defect_type=DEFECT_STATES['NEW'], total_defects=1, digest=digest)
+               for _ in range(2)]
+        # no defects are stored, so anything but the digest comparison fails
+        self.assertTrue(compare_result_groups(*rgs))
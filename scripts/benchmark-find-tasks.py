@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Compare regex queries previously used by find_tasks() with lookups in the task
+search index on a synthetic table of tasks.  All the data are created in a
+transaction which is rolled back at the end.
+"""
+
+import argparse
+import os
+import time
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'osh.hub.settings'
+
+BATCH_SIZE = 10000
+PACKAGES = 5000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=1000000,
+                        help='number of synthetic tasks (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of runs of each query (default: %(default)s)')
+    return parser.parse_args()
+
+
+def get_label(i):
+    return 'package%d-%d.%d-1.el9' % (i % PACKAGES, i // PACKAGES, i % 7)
+
+
+def create_tasks(count):
+    from django.contrib.auth import get_user_model
+    from kobo.hub.models import Arch, Channel, Task
+
+    from osh.hub.scan.models import TaskSearch
+    from osh.hub.scan.utils import normalize_comment, parse_task_label
+
+    owner, _ = get_user_model().objects.get_or_create(username='benchmark')
+    arch, _ = Arch.objects.get_or_create(name='noarch', pretty_name='noarch')
+    channel, _ = Channel.objects.get_or_create(name='default')
+
+    for start in range(0, count, BATCH_SIZE):
+        tasks = []
+        for i in range(start, min(start + BATCH_SIZE, count)):
+            label = get_label(i)
+            comment = 'Errata scan of %s (advisory %d)' % (label, i // 3)
+            tasks.append(Task(owner=owner, arch=arch, channel=channel, method='ErrataDiffBuild',
+                              label=label, comment=comment))
+        # bulk_create() does not send post_save, the index is filled directly
+        tasks = Task.objects.bulk_create(tasks)
+        if tasks[0].id is None:
+            tasks = Task.objects.order_by('-id')[:len(tasks)]
+        search = []
+        for task in tasks:
+            nvr, package_name = parse_task_label(task.label)
+            search.append(TaskSearch(task_id=task.id, nvr=nvr, package_name=package_name,
+                                     comment=normalize_comment(task.comment)))
+        TaskSearch.objects.bulk_create(search)
+
+
+def measure(name, queryset, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.monotonic()
+        count = len(queryset.order_by('-id').values_list('id', flat=True))
+        elapsed = time.monotonic() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print('%-32s %8d tasks %10.2f ms' % (name, count, best * 1000))
+
+
+def main():
+    from django.db import connection, transaction
+    from kobo.hub.models import Task
+
+    args = parse_args()
+
+    with transaction.atomic():
+        start = time.monotonic()
+        create_tasks(args.tasks)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        print('Created %d tasks in %.1f s' % (args.tasks, time.monotonic() - start))
+
+        package = 'package%d' % (PACKAGES // 2)
+        nvr = get_label(args.tasks // 2)
+        # no regex special characters, so that find_tasks() uses the index
+        comment = 'advisory %d' % (args.tasks // 6)
+
+        measure('package_name (regex)', Task.objects.filter(label__regex=package + r'-\d'), args.repeat)
+        measure('package_name (index)', Task.objects.filter(search__package_name=package), args.repeat)
+        measure('nvr (label)', Task.objects.filter(label=nvr), args.repeat)
+        measure('nvr (index)', Task.objects.filter(search__nvr=nvr), args.repeat)
+        measure('comment (regex)', Task.objects.filter(comment__regex=comment), args.repeat)
+        measure('comment (index)', Task.objects.filter(search__comment__contains=comment), args.repeat)
+
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    import django
+    django.setup()
+
+    main()